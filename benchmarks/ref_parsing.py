@@ -0,0 +1,65 @@
+"""
+Compares the precompiled per-resource matcher used by :func:`flask_potion.utils.id_from_uri` with matching references
+against the whole URL map using :func:`flask_potion.utils.route_from`.
+
+Usage::
+
+    python benchmarks/ref_parsing.py [number of resources] [number of references]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+from flask import Flask
+
+from flask_potion import Api, ModelResource
+from flask_potion.contrib.memory.manager import MemoryManager
+from flask_potion.utils import id_from_uri, route_from
+
+
+def create_api(resource_count):
+    app = Flask(__name__)
+    api = Api(app, prefix='/api/v1')
+    resources = []
+
+    for i in range(resource_count):
+        class Meta:
+            name = 'resource-{}'.format(i)
+            model = name
+            manager = MemoryManager
+
+        resource = type('Resource{}'.format(i), (ModelResource,), {'Meta': Meta})
+        api.add_resource(resource)
+        resources.append(resource)
+
+    return app, resources
+
+
+def main(resource_count=300, reference_count=10000):
+    app, resources = create_api(resource_count)
+    resource = resources[-1]
+    uris = ['{}/{}'.format(resource.route_prefix, i) for i in range(reference_count)]
+
+    def match_url_map():
+        for uri in uris:
+            route_from(uri, 'GET')[1]['id']
+
+    def match_precompiled():
+        for uri in uris:
+            id_from_uri(uri, resource)
+
+    with app.test_request_context():
+        assert [route_from(uri, 'GET')[1]['id'] for uri in uris] == [id_from_uri(uri, resource) for uri in uris]
+
+        print('{} rules in URL map, {} references'.format(len(list(app.url_map.iter_rules())), reference_count))
+
+        for name, function in (('route_from', match_url_map), ('id_from_uri', match_precompiled)):
+            seconds = min(timeit.repeat(function, number=1, repeat=3))
+            print('{:<12} {:8.2f} ms  {:8.2f} us/reference'.format(name,
+                                                                 seconds * 1000,
+                                                                 seconds * 1000000 / reference_count))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -2,12 +2,15 @@ from collections import OrderedDict
 import inspect
 import operator
 from functools import partial
-from flask import current_app, make_response, json, Response, request
+from flask import current_app, make_response, json, Response, request, g
 from six import wraps
 from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
 from werkzeug.wrappers import BaseResponse
-from .exceptions import PotionException
+from .exceptions import PotionException, RequestMustBeJSON, InvalidBatchRequest
 from .routes import RouteSet, to_camel_case
+from .schema import SchemaImpl
+from .signals import _in_unit_of_work, _defer_signals, _send_deferred_signals, _discard_deferred_signals
 from .utils import unpack
 from .resource import Resource, ModelResource
 
@@ -53,15 +56,24 @@ class Api(object):
     :param str title: an optional title for the schema
     :param str description: an optional description for the schema
     :param Manager default_manager: an optional manager to use as default. If SQLAlchemy is installed, will use :class:`contrib.alchemy.SQLAlchemyManager`
+    :param bool unit_of_work: whether to write all changes of a request in one transaction, which is committed once the
+        view has responded successfully and rolled back otherwise. The ``after_*`` signals are sent after the commit.
+    :param signals.AsyncDispatcher signal_dispatcher: an optional dispatcher for sending the ``after_*`` signals to
+        their receivers outside of the request
+    :param bool batch: whether to add a ``{prefix}/batch`` route for sending several requests at once
     """
 
-    def __init__(self, app=None, decorators=None, prefix=None, title=None, description=None, default_manager=None):
+    def __init__(self, app=None, decorators=None, prefix=None, title=None, description=None, default_manager=None,
+                 unit_of_work=False, signal_dispatcher=None, batch=False):
         self.app = app
         self.blueprint = None
         self.prefix = prefix or ''
         self.decorators = decorators or []
         self.title = title
         self.description = description
+        self.unit_of_work = unit_of_work
+        self.signal_dispatcher = signal_dispatcher
+        self.batch = batch
         self.endpoints = set()
         self.resources = {}
         self.views = []
@@ -102,6 +114,10 @@ class Api(object):
         """
         app.config.setdefault('POTION_MAX_PER_PAGE', 100)
         app.config.setdefault('POTION_DEFAULT_PER_PAGE', 20)
+        app.config.setdefault('POTION_MAX_BATCH_SIZE', 100)
+
+        if self.signal_dispatcher is not None:
+            app.extensions['potion_signal_dispatcher'] = self.signal_dispatcher
 
         self._register_view(app,
                             rule=''.join((self.prefix, '/schema')),
@@ -109,6 +125,14 @@ class Api(object):
                             endpoint='schema',
                             methods=['GET'])
 
+        if self.batch:
+            # the batch view manages the transactions of its sub-requests itself
+            self._register_view(app,
+                                rule=''.join((self.prefix, '/batch')),
+                                view_func=self.output(self._batch_view, unit_of_work=False),
+                                endpoint='batch',
+                                methods=['POST'])
+
         for route, resource, view_func, endpoint, methods in self.views:
             rule = route.rule_factory(resource)
             self._register_view(app, rule, view_func, endpoint, methods)
@@ -140,10 +164,13 @@ class Api(object):
 
         return original_handler(e)
 
-    def output(self, view):
+    def output(self, view, unit_of_work=True):
         @wraps(view)
         def wrapper(*args, **kwargs):
-            resp = view(*args, **kwargs)
+            if unit_of_work and self.unit_of_work and request.method != 'GET' and not _in_unit_of_work():
+                resp = self._dispatch_unit_of_work(view, *args, **kwargs)
+            else:
+                resp = view(*args, **kwargs)
 
             if isinstance(resp, BaseResponse):
                 return resp
@@ -153,6 +180,53 @@ class Api(object):
 
         return wrapper
 
+    def _dispatch_unit_of_work(self, view, *args, **kwargs):
+        managers = self._begin()
+
+        try:
+            resp = view(*args, **kwargs)
+        except Exception:
+            self._rollback(managers)
+            raise
+
+        if (resp.status_code if isinstance(resp, BaseResponse) else unpack(resp)[1]) >= 400:
+            self._rollback(managers)
+        else:
+            self._commit(managers)
+        return resp
+
+    def _begin(self):
+        """
+        Starts a unit of work by beginning a transaction with the manager of each resource and deferring the
+        ``after_*`` signals.
+
+        :return: the managers in the unit of work
+        """
+        managers = []
+        for resource in self.resources.values():
+            manager = getattr(resource, 'manager', None)
+            if manager is not None and manager not in managers:
+                managers.append(manager)
+
+        _defer_signals()
+        for manager in managers:
+            manager.begin()
+        return managers
+
+    def _commit(self, managers):
+        try:
+            for manager in reversed(managers):
+                manager.commit()
+        except Exception:
+            self._rollback(managers)
+            raise
+        _send_deferred_signals()
+
+    def _rollback(self, managers):
+        for manager in managers:
+            manager.rollback()
+        _discard_deferred_signals()
+
     def _schema_view(self):
         schema = OrderedDict()
         schema["$schema"] = "http://json-schema.org/draft-04/hyper-schema#"
@@ -170,6 +244,153 @@ class Api(object):
 
         return OrderedDict(schema), 200, {'Content-Type': 'application/schema+json'}
 
+    _batch_schema = SchemaImpl({
+        "definitions": {
+            "requests": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "method": {
+                            "type": "string",
+                            "enum": ["GET", "POST", "PATCH", "PUT", "DELETE"]
+                        },
+                        "path": {
+                            "type": "string",
+                            "pattern": "^/"
+                        },
+                        "headers": {
+                            "type": "object",
+                            "additionalProperties": {"type": "string"}
+                        },
+                        "body": {}
+                    },
+                    "required": ["method", "path"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "anyOf": [
+            {"$ref": "#/definitions/requests"},
+            {
+                "type": "object",
+                "properties": {
+                    "requests": {"$ref": "#/definitions/requests"},
+                    "atomic": {"type": "boolean", "default": False}
+                },
+                "required": ["requests"],
+                "additionalProperties": False
+            }
+        ]
+    })
+
+    def _batch_view(self):
+        """
+        Dispatches an array of ``{"method", "path", "headers", "body"}`` sub-requests to the views of the application
+        in turn, within the current process, and returns an array of ``{"status", "headers", "body"}`` responses, with
+        the headers as an array of ``[name, value]`` pairs. Sub-requests are sent with the headers of the batch request,
+        updated with their own ``headers``. Each sub-request starts with an empty ``g``.
+
+        The body may also be an object with the sub-requests in ``requests`` and an ``atomic`` flag. With ``atomic``,
+        all sub-requests run in one transaction of each manager; the batch stops at the first sub-request that fails,
+        rolls back and responds with the status of the failed sub-request. The ``after_*`` signals are sent once the
+        transaction has been committed. Otherwise, with ``unit_of_work``, each sub-request runs in its own transaction.
+
+        Batches of more than ``POTION_MAX_BATCH_SIZE`` sub-requests and batch sub-requests are rejected.
+        """
+        if request.environ.get('potion.batch'):
+            raise InvalidBatchRequest('Batch requests cannot be nested')
+
+        if request.mimetype != 'application/json':
+            raise RequestMustBeJSON()
+
+        data = self._batch_schema.convert(request.json)
+
+        if isinstance(data, dict):
+            sub_requests, atomic = data['requests'], data.get('atomic', False)
+        else:
+            sub_requests, atomic = data, False
+
+        max_batch_size = current_app.config['POTION_MAX_BATCH_SIZE']
+        if len(sub_requests) > max_batch_size:
+            raise InvalidBatchRequest('Batch requests are limited to {} sub-requests'.format(max_batch_size))
+
+        app = current_app._get_current_object()
+        headers = [(key, value) for key, value in request.headers.items()
+                   if key.lower() not in ('content-type', 'content-length')]
+        base_url = request.host_url.rstrip('/') + request.script_root
+
+        if not atomic:
+            return [self._dispatch_sub_request(app, base_url, headers, sub_request) for sub_request in sub_requests]
+
+        managers = self._begin()
+
+        responses = []
+        try:
+            for sub_request in sub_requests:
+                response = self._dispatch_sub_request(app, base_url, headers, sub_request)
+                responses.append(response)
+
+                if response['status'] >= 400:
+                    self._rollback(managers)
+                    return responses, response['status']
+        except Exception:
+            self._rollback(managers)
+            raise
+
+        self._commit(managers)
+        return responses
+
+    @staticmethod
+    def _dispatch_sub_request(app, base_url, headers, sub_request):
+        path, _, query_string = sub_request['path'].partition('?')
+        body = sub_request.get('body')
+
+        builder = EnvironBuilder(path=path,
+                                 base_url=base_url,
+                                 query_string=query_string,
+                                 method=sub_request['method'],
+                                 headers=headers,
+                                 data=None if body is None else json.dumps(body),
+                                 content_type='application/json')
+
+        for key, value in sub_request.get('headers', {}).items():
+            builder.headers[key] = value
+
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+
+        environ['potion.batch'] = True
+
+        # sub-requests share the application context of the batch request, and with it g. Each sub-request gets an
+        # empty g, so that nothing cached on g by one sub-request, such as the identity, is seen by the next; only the
+        # unit of work of an atomic batch is carried over.
+        batch_globals = dict(vars(g))
+        vars(g).clear()
+        vars(g).update((key, value) for key, value in batch_globals.items() if key.startswith('potion_'))
+
+        try:
+            with app.request_context(environ):
+                response = app.full_dispatch_request()
+        finally:
+            vars(g).clear()
+            vars(g).update(batch_globals)
+
+        if response.status_code == 204:
+            body = None
+        elif response.mimetype == 'application/json':
+            body = json.loads(response.get_data(as_text=True))
+        else:
+            body = response.get_data(as_text=True)
+
+        return {
+            "status": response.status_code,
+            "headers": [[key, value] for key, value in response.headers.items()],
+            "body": body
+        }
+
     def add_route(self, route, resource, endpoint=None, decorator=None):
         endpoint = endpoint or '_'.join((resource.meta.name, route.relation))
         methods = [route.method]
@@ -1,12 +1,31 @@
+from operator import attrgetter
+
 from flask import current_app
-from flask_sqlalchemy import Pagination as SAPagination, get_state
-from sqlalchemy import String, or_, and_
+from flask_sqlalchemy import BaseQuery, Pagination as SAPagination, get_state
+from sqlalchemy import String, or_, and_, func, inspect, literal, select, exists
 from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import class_mapper, aliased
-from sqlalchemy.orm.attributes import ScalarObjectAttributeImpl
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import class_mapper, aliased, joinedload, load_only, with_parent, scoped_session, \
+    ColumnProperty, RelationshipProperty
+from sqlalchemy.orm.interfaces import MANYTOONE, MANYTOMANY, ONETOMANY
+from sqlalchemy.orm.state import InstanceState
+from sqlalchemy.orm.attributes import ScalarObjectAttributeImpl, set_committed_value
 from sqlalchemy.orm.collections import InstrumentedList
-from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.exc import NoResultFound, UnmappedColumnError
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.expression import Executable, ClauseElement
+
+try:
+    from sqlalchemy.orm import selectinload
+except ImportError:  # SQLAlchemy < 1.2
+    from sqlalchemy.orm import subqueryload as selectinload
+
+try:
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+except ImportError:  # SQLAlchemy < 1.4
+    sqlite_insert = None
 
 from flask_potion import fields
 from flask_potion.contrib.alchemy.filters import FILTER_NAMES, FILTERS_BY_TYPE, SQLAlchemyBaseFilter
@@ -14,8 +33,26 @@ from flask_potion.exceptions import ItemNotFound, DuplicateKey, BackendConflict
 from flask_potion.instances import Pagination
 from flask_potion.manager import RelationalManager
 from flask_potion.signals import before_add_to_relation, after_add_to_relation, before_remove_from_relation, \
-    after_remove_from_relation, before_create, after_create, before_update, after_update, before_delete, after_delete
-from flask_potion.utils import get_value
+    after_remove_from_relation, before_create, after_create, before_update, after_update, before_delete, after_delete, \
+    before_bulk_add_to_relation, after_bulk_add_to_relation, before_bulk_remove_from_relation, \
+    after_bulk_remove_from_relation
+from flask_potion.utils import get_value, chunked
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain)
+def _compile_explain(element, compiler, **kwargs):
+    if compiler.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    return prefix + compiler.process(element.statement, **kwargs)
 
 
 class SQLAlchemyManager(RelationalManager):
@@ -24,6 +61,11 @@ class SQLAlchemyManager(RelationalManager):
 
     Expects that ``Meta.model`` contains a SQLALchemy declarative model.
 
+    Created and updated items stay loaded after they are committed, so that they are formatted without being read
+    again. Columns generated by the database, such as server defaults, are read when they are first accessed; with
+    ``__mapper_args__ = {'eager_defaults': True}`` on the model they are instead returned by the ``INSERT`` or
+    ``UPDATE`` statement on databases that support ``RETURNING``.
+
     """
     FILTER_NAMES = FILTER_NAMES
     FILTERS_BY_TYPE = FILTERS_BY_TYPE
@@ -45,6 +87,7 @@ class SQLAlchemyManager(RelationalManager):
             self.id_attribute = mapper.primary_key[0].name
 
         self.id_field = self._get_field_from_column_type(self.id_column, self.id_attribute, io="r")
+        self.version_column = getattr(model, meta.version_attribute) if meta.get('version_attribute') else None
 
         fs = resource.schema
         if meta.include_id:
@@ -81,7 +124,8 @@ class SQLAlchemyManager(RelationalManager):
                 elif name in write_only_fields:
                     io = "w"
 
-                if not (column.nullable or column.default):
+                # read-only values, such as the version, are set by the manager
+                if io != "r" and not (column.nullable or column.default):
                     fs.required.add(name)
                 fs.set(name, self._get_field_from_column_type(column, name, io=io))
 
@@ -130,6 +174,55 @@ class SQLAlchemyManager(RelationalManager):
         else:
             return False
 
+    def _foreign_key_column(self, attribute, target_resource):
+        """
+        Returns the local column of a many-to-one relationship that holds the id of the referenced item,
+        or ``None`` if the relationship is not backed by such a column.
+        """
+        relationship = getattr(getattr(self.model, attribute, None), 'property', None)
+
+        if not isinstance(relationship, RelationshipProperty) \
+                or relationship.direction is not MANYTOONE \
+                or len(relationship.local_remote_pairs) != 1:
+            return None
+
+        local, remote = relationship.local_remote_pairs[0]
+        if remote.key != target_resource.manager.id_attribute:
+            return None
+        return local
+
+    def _foreign_key_getter(self, attribute, target_resource):
+        column = self._foreign_key_column(attribute, target_resource)
+
+        if column is None:
+            return None
+
+        try:
+            return attrgetter(class_mapper(self.model).get_property_by_column(column).key)
+        except UnmappedColumnError:
+            return None
+
+    def _reference_ids(self, items, attribute, target_resource):
+        relationship = getattr(getattr(self.model, attribute, None), 'property', None)
+
+        # ordered relationships are loaded as usual to preserve their order
+        if not isinstance(relationship, RelationshipProperty) or not relationship.uselist or relationship.order_by:
+            return None
+
+        target = aliased(relationship.mapper.class_)
+        target_id_column = getattr(target, target_resource.manager.id_attribute)
+
+        query = self._get_session().query(self.id_column, target_id_column) \
+            .select_from(self.model) \
+            .join(getattr(self.model, attribute).of_type(target)) \
+            .filter(self.id_column.in_([get_value(self.id_attribute, item, None) for item in items])) \
+            .order_by(target_id_column)
+
+        ids = {}
+        for item_id, target_id in query:
+            ids.setdefault(item_id, []).append(target_id)
+        return ids
+
     @staticmethod
     def _get_session():
         return get_state(current_app).db.session
@@ -150,6 +243,9 @@ class SQLAlchemyManager(RelationalManager):
     def _expression_for_condition(self, condition):
         return condition.filter.expression(condition.value)
 
+    def _expression_for_version(self, version):
+        return self.version_column == version
+
     def _expression_for_ids(self, ids):
         return self.id_column.in_(ids)
 
@@ -188,6 +284,56 @@ class SQLAlchemyManager(RelationalManager):
 
         return query.order_by(*order_clauses)
 
+    def _query_facet(self, query, field, attribute, limit):
+        column = getattr(self.model, attribute)
+
+        if isinstance(field, fields.ToOne):
+            foreign_key = self._foreign_key_column(attribute, field.target)
+
+            if foreign_key is not None:
+                column = foreign_key
+            else:
+                target_alias = aliased(field.target.meta.model)
+                query = query.outerjoin(target_alias, column).reset_joinpoint()
+                column = getattr(target_alias, field.target.manager.id_attribute)
+
+        count = func.count(self.id_column)
+        return query.with_entities(column, count) \
+            .group_by(column) \
+            .order_by(count.desc(), column.asc()) \
+            .limit(limit) \
+            .all()
+
+    def _query_eager_load(self, query, attributes):
+        options = []
+
+        for attribute in attributes:
+            column = getattr(self.model, attribute)
+            relationship = getattr(column, 'property', None)
+
+            # dynamic relationships return a query and cannot be loaded eagerly
+            if not isinstance(relationship, RelationshipProperty) or relationship.lazy == 'dynamic':
+                continue
+
+            if relationship.uselist:
+                options.append(selectinload(column))
+            else:
+                options.append(joinedload(column))
+
+        if options:
+            return query.options(*options)
+        return query
+
+    def _query_load_only(self, query, attributes):
+        mapper = class_mapper(self.model)
+
+        # relationships and other attributes that are not columns are loaded when they are accessed
+        columns = [attribute for attribute in attributes if isinstance(mapper.attrs.get(attribute), ColumnProperty)]
+
+        if columns:
+            return query.options(load_only(*columns))
+        return query
+
     def _query_get_paginated_items(self, query, page, per_page):
         return query.paginate(page=page, per_page=per_page)
 
@@ -197,19 +343,86 @@ class SQLAlchemyManager(RelationalManager):
     def _query_get_one(self, query):
         return query.one()
 
+    def _query_get_ids(self, query, limit=None):
+        query = query.with_entities(self.id_column).order_by(self.id_column)
+        if limit is not None:
+            query = query.limit(limit)
+        return [id for id, in query]
+
     def _query_get_first(self, query):
         try:
             return query.one()
         except NoResultFound:
             raise IndexError()
 
-    def create(self, properties, commit=True):
+    def facets(self, fields, where=None, limit=None):
+        query = self.instances(where=where)
+
+        if isinstance(query, list):
+            return super(SQLAlchemyManager, self).facets(fields, where=where, limit=limit)
+
+        return {
+            name: [tuple(row) for row in self._query_facet(query, field, field.attribute or name, limit)]
+            for name, field in fields.items()
+        }
+
+    def explain(self, page, per_page, where=None, sort=None):
+        query = self.instances(where=where, sort=sort)
+
+        if isinstance(query, list):
+            return {"statement": None, "parameters": [], "plan": []}
+
+        query = query.limit(per_page).offset((page - 1) * per_page)
+        mapper = class_mapper(self.model)
+        compiled = query.statement.compile(dialect=query.session.get_bind(mapper=mapper).dialect)
+
+        if compiled.positional:
+            parameters = [compiled.params[name] for name in compiled.positiontup]
+        else:
+            parameters = compiled.params
+
+        result = query.session.execute(_Explain(query.statement), mapper=mapper)
+        columns = list(result.keys())
+
+        return {
+            "statement": str(compiled),
+            "parameters": parameters,
+            "plan": [dict(zip(columns, row)) for row in result]
+        }
+
+    def _new_item(self, properties):
+        properties = self._versioned_properties(properties)
         # noinspection properties
         item = self.model()
 
         for key, value in properties.items():
             setattr(item, key, value)
 
+        mapper = class_mapper(self.model)
+
+        # the collections of an item with a generated primary key are empty until it is inserted; initializing them
+        # while the item is still transient spares a lazy load for each when the item is formatted
+        if all(value is None for value in mapper.primary_key_from_instance(item)):
+            for relationship in mapper.relationships:
+                if relationship.uselist and relationship.key not in properties \
+                        and relationship.lazy not in ('dynamic', 'noload', 'raise', 'raise_on_sql') \
+                        and relationship.local_columns <= set(mapper.primary_key):
+                    getattr(item, relationship.key)
+        return item
+
+    @staticmethod
+    def _conflict(e):
+        if hasattr(e.orig, 'pgcode'):
+            if e.orig.pgcode == "23505":  # duplicate key
+                return DuplicateKey(detail=e.orig.diag.message_detail)
+
+        if current_app.debug:
+            return BackendConflict(debug_info=dict(statement=e.statement, params=e.params))
+        return BackendConflict()
+
+    def create(self, properties, commit=True):
+        item = self._new_item(properties)
+
         before_create.send(self.resource, item=item)
 
         session = self._get_session()
@@ -217,36 +430,55 @@ class SQLAlchemyManager(RelationalManager):
         try:
             session.add(item)
             if commit:
-                session.commit()
+                self._commit(session, expire=False)
         except IntegrityError as e:
             session.rollback()
-
-            if hasattr(e.orig, 'pgcode'):
-                if e.orig.pgcode == "23505":  # duplicate key
-                    raise DuplicateKey(detail=e.orig.diag.message_detail)
-
-            if current_app.debug:
-                raise BackendConflict(debug_info=dict(statement=e.statement, params=e.params))
-            raise BackendConflict()
+            raise self._conflict(e)
 
         after_create.send(self.resource, item=item)
         return item
 
+    def create_many(self, properties_list, commit=True):
+        items = [self._new_item(properties) for properties in properties_list]
+
+        for item in items:
+            before_create.send(self.resource, item=item)
+
+        session = self._get_session()
+
+        try:
+            # a single flush lets the unit of work batch the INSERT statements
+            session.add_all(items)
+            session.flush()
+            if commit:
+                self._commit(session, expire=False)
+        except IntegrityError as e:
+            session.rollback()
+            raise self._conflict(e)
+
+        for item in items:
+            after_create.send(self.resource, item=item)
+        return items
+
     def update(self, item, changes, commit=True):
         session = self._get_session()
+        changes = self._versioned_changes(item, changes)
         actual_changes = {
             key: value for key, value in changes.items()
-            if get_value(key, item, None) != value
+            if isinstance(value, fields.ToManyChanges) or get_value(key, item, None) != value
         }
 
         try:
             before_update.send(self.resource, item=item, changes=actual_changes)
 
             for key, value in changes.items():
-                setattr(item, key, value)
+                if isinstance(value, fields.ToManyChanges):
+                    self._update_to_many(item, key, value)
+                else:
+                    setattr(item, key, value)
 
             if commit:
-                session.commit()
+                self._commit(session, expire=False)
         except IntegrityError as e:
             session.rollback()
 
@@ -259,17 +491,301 @@ class SQLAlchemyManager(RelationalManager):
         after_update.send(self.resource, item=item, changes=actual_changes)
         return item
 
+    def _bulk_update_values(self, changes):
+        mapper = class_mapper(self.model)
+        values = {}
+
+        # validators and mapper events only run when items are loaded and changed one by one
+        if mapper.validators or mapper.dispatch.before_update or mapper.dispatch.after_update:
+            return None
+
+        for key, value in changes.items():
+            prop = mapper.attrs.get(key)
+
+            if isinstance(prop, ColumnProperty) and len(prop.columns) == 1:
+                column = prop.columns[0]
+
+                if mapper.class_manager[key].dispatch.set:
+                    return None
+
+                if not isinstance(value, fields.InPlaceChange):
+                    values[column] = value
+                elif value.operator == '$inc':
+                    values[column] = column + value.value
+                elif isinstance(column.type, postgresql.ARRAY):
+                    values[column] = func.array_append(column, value.value)
+                else:
+                    return None
+            elif isinstance(prop, RelationshipProperty) and prop.direction is MANYTOONE and prop.secondary is None:
+                # a reference is written to the foreign key columns of the relationship
+                for local, remote in prop.local_remote_pairs:
+                    remote_key = prop.mapper.get_property_by_column(remote).key
+                    values[local] = None if value is None else getattr(value, remote_key)
+            else:
+                return None
+
+        if self.version_column is not None:
+            version_column = self.version_column.property.columns[0]
+            values[version_column] = version_column + 1
+        return values
+
+    def _upsert_insert(self):
+        """
+        Returns the ``insert()`` construct of the database dialect if it supports ``ON CONFLICT DO UPDATE``, or ``None``.
+        """
+        dialect = self._get_session().connection(mapper=class_mapper(self.model)).dialect.name
+
+        if dialect == 'postgresql':
+            return postgresql_insert
+        if dialect == 'sqlite':
+            return sqlite_insert
+        return None
+
+    def _upsert_key_columns(self):
+        mapper = class_mapper(self.model)
+        columns = []
+
+        for name, attribute in self._natural_key:
+            prop = mapper.attrs.get(attribute)
+
+            if not isinstance(prop, ColumnProperty) or len(prop.columns) != 1:
+                return None
+            columns.append(prop.columns[0])
+        return columns
+
+    def upsert_many(self, properties_list, commit=True):
+        if self._natural_key is None:
+            raise RuntimeError("'{}' has no natural key".format(self.resource.meta.name))
+
+        insert = self._upsert_insert()
+        key_columns = self._upsert_key_columns()
+        rows = [self._bulk_update_values(properties) for properties in properties_list]
+        table = self.model.__table__
+
+        # items are written with INSERT ... ON CONFLICT DO UPDATE only if that can be done without reading them:
+        if insert is None \
+                or key_columns is None \
+                or any(row is None or any(column.table is not table for column in row) for row in rows) \
+                or any(column not in row for row in rows for column in key_columns) \
+                or self._has_item_receivers(before_create, after_create, before_update, after_update) \
+                or class_mapper(self.model).dispatch.before_insert \
+                or class_mapper(self.model).dispatch.after_insert:
+            return super(SQLAlchemyManager, self).upsert_many(properties_list, commit)
+
+        session = self._get_session()
+        version_column = None
+
+        # new items start at the initial version; the version of existing items is incremented on conflict
+        if self.version_column is not None:
+            version_column = self.version_column.property.columns[0]
+            for row in rows:
+                row[version_column] = 1
+
+        # rows with the same columns are written with a single executemany() call
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row, key=attrgetter('key'))), []).append(row)
+
+        try:
+            for columns, group in groups.items():
+                statement = insert(table)
+                update = {column.key: statement.excluded[column.key]
+                          for column in columns if column not in key_columns}
+
+                if version_column is not None:
+                    update[version_column.key] = version_column + 1
+
+                if update:
+                    statement = statement.on_conflict_do_update(index_elements=key_columns, set_=update)
+                else:
+                    statement = statement.on_conflict_do_nothing(index_elements=key_columns)
+
+                session.execute(statement, [{column.key: value for column, value in row.items()} for row in group])
+
+            if commit:
+                self._commit(session)
+        except IntegrityError as e:
+            session.rollback()
+            raise self._conflict(e)
+
+        keys = [tuple(row[column] for column in key_columns) for row in rows]
+
+        if len(key_columns) == 1:
+            condition = key_columns[0].in_([key for key, in keys])
+        else:
+            condition = or_(*[and_(*[column == value for column, value in zip(key_columns, key)]) for key in keys])
+
+        items = session.query(self.model).filter(condition).populate_existing().all()
+        items_by_key = {tuple(getattr(item, attribute) for name, attribute in self._natural_key): item
+                        for item in items}
+        return [items_by_key[key] for key in keys]
+
+    def _query_ids_criterion(self, query, column=None):
+        # conditions may refer to other tables, which not every database supports in UPDATE and DELETE statements, so
+        # the items are matched by id; the derived table lets MySQL select from the table being written to
+        ids = query.with_entities(self.id_column).subquery()
+        return (self.id_column if column is None else column).in_(select([list(ids.c)[0]]))
+
+    def _query_update(self, query, values, commit=True):
+        session = self._get_session()
+        query = session.query(self.model).filter(self._query_ids_criterion(query))
+
+        try:
+            count = query.update(values, synchronize_session=False)
+            if commit:
+                self._commit(session)
+        except IntegrityError as e:
+            session.rollback()
+            raise self._conflict(e)
+        return count
+
+    def _query_update_by_id(self, query, id, values, commit=True):
+        session = self._get_session()
+        dialect = session.connection(mapper=class_mapper(self.model)).dialect
+
+        # SQLAlchemy 1.3 has no full_returning flag; of its dialects, only PostgreSQL supports UPDATE ... RETURNING
+        if not getattr(dialect, 'update_returning', getattr(dialect, 'full_returning', dialect.name == 'postgresql')):
+            return super(SQLAlchemyManager, self)._query_update_by_id(query, id, values, commit)
+
+        # UPDATE ... RETURNING loads the updated item with the same statement
+        table = class_mapper(self.model).local_table
+        statement = table.update() \
+            .where(self._query_ids_criterion(query)) \
+            .values(values) \
+            .returning(*table.columns)
+
+        try:
+            items = list(session.query(self.model).populate_existing().instances(session.execute(statement)))
+            # the item has just been loaded from the updated row
+            if commit:
+                self._commit(session, expire=False)
+        except IntegrityError as e:
+            session.rollback()
+            raise self._conflict(e)
+
+        return items[0] if items else None
+
     def delete(self, item):
         before_delete.send(self.resource, item=item)
 
         session = self._get_session()
         session.delete(item)
-        session.commit()
+        self._commit(session)
 
         after_delete.send(self.resource, item=item)
 
-    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None):
-        query = getattr(item, attribute)
+    def _bulk_delete_secondaries(self):
+        """
+        Returns the columns of association tables referencing the ids of items that are deleted without being loaded,
+        or ``None`` if the items need to be deleted through the session so that relationships are cascaded.
+        """
+        id_column = self.id_column.expression
+        columns = []
+
+        for relationship in class_mapper(self.model).relationships:
+            if relationship.viewonly or relationship.direction is MANYTOONE or relationship.passive_deletes:
+                continue
+
+            if relationship.direction is not MANYTOMANY or len(relationship.synchronize_pairs) != 1:
+                return None
+
+            parent_column, secondary_column = relationship.synchronize_pairs[0]
+            if not parent_column.shares_lineage(id_column):
+                return None
+            columns.append(secondary_column)
+        return columns
+
+    def _delete_ids(self, ids, commit=True):
+        for chunk in chunked(ids, self.IDS_PER_STATEMENT):
+            # whether the items can be deleted without the session does not depend on the ids
+            if self._delete_matching(lambda column: column.in_(chunk), commit=False) is None:
+                return False
+
+        if commit:
+            self._commit(self._get_session())
+        return True
+
+    def _query_delete(self, query, commit=True):
+        secondary_tables = {column.table for column in self._bulk_delete_secondaries() or ()}
+
+        # rows in association tables are deleted first, so a condition on them would no longer match the items
+        if any(element in secondary_tables for element in visitors.iterate(query.statement, {})):
+            ids = self._query_get_ids(query)
+            return len(ids) if self._delete_ids(ids, commit) else None
+
+        return self._delete_matching(lambda column: self._query_ids_criterion(query, column), commit)
+
+    def _delete_matching(self, criterion, commit=True):
+        """
+        Deletes the items whose id matches ``criterion(column)``, along with their rows in association tables.
+
+        :return: the number of items deleted, or ``None`` if the items need to be deleted through the session
+        """
+        secondary_columns = self._bulk_delete_secondaries()
+
+        if secondary_columns is None:
+            return None
+
+        session = self._get_session()
+
+        try:
+            for column in secondary_columns:
+                session.execute(column.table.delete().where(criterion(column)))
+
+            count = session.query(self.model).filter(criterion(self.id_column)).delete(synchronize_session=False)
+            if commit:
+                self._commit(session)
+        except IntegrityError as e:
+            session.rollback()
+            raise self._conflict(e)
+        return count
+
+    def _query_relation(self, item, attribute, target_resource, where=None, sort=None):
+        """
+        Returns a query for the items of a collection relationship, so that a page of the collection can be read with
+        ``LIMIT``/``OFFSET`` instead of loading the whole collection. Conditions and sort fields are those of the
+        target resource.
+
+        Returns ``None`` if ``attribute`` is not a relationship that loads a list, or if the collection is already
+        loaded and needs neither filtering nor sorting.
+        """
+        state = inspect(item)
+        relationship = state.mapper.relationships.get(attribute)
+
+        if relationship is None or not relationship.uselist:
+            return None
+
+        dynamic = relationship.lazy == 'dynamic'
+
+        if dynamic:
+            query = getattr(item, attribute)
+        elif not state.persistent or (attribute in state.dict and not (where or sort)):
+            return None
+        else:
+            # the query class of the model provides paginate(), which a plain session query may not have
+            query_class = getattr(relationship.mapper.class_, 'query_class', None) or BaseQuery
+            query = query_class(relationship.mapper, session=state.session) \
+                .filter(with_parent(item, getattr(state.class_, attribute)))
+
+        target_manager = target_resource.manager
+
+        if where:
+            expressions = [target_manager._expression_for_condition(condition) for condition in where]
+            query = target_manager._query_filter(query, target_manager._and_expression(expressions))
+
+        if sort:
+            query = target_manager._query_order_by(query.order_by(None), sort)
+        elif dynamic:
+            return query
+
+        # pages need a stable order:
+        return query.order_by(*(relationship.order_by or relationship.mapper.primary_key))
+
+    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None, where=None, sort=None):
+        query = self._query_relation(item, attribute, target_resource, where, sort)
+
+        if query is None:
+            query = getattr(item, attribute)
 
         if isinstance(query, InstrumentedList):
             if page and per_page:
@@ -294,6 +810,166 @@ class SQLAlchemyManager(RelationalManager):
         except ValueError:
             pass  # if the relation does not exist, do nothing
 
+    @staticmethod
+    def _bulk_writable_relationship(item, attribute):
+        """
+        Returns the relationship property for ``attribute`` if changes to it can be written directly to the
+        association table or the foreign-key column of the target, otherwise ``None``.
+        """
+        state = inspect(item)
+        relationship = state.mapper.relationships.get(attribute)
+
+        if relationship is None \
+                or not relationship.uselist \
+                or relationship.viewonly \
+                or not state.persistent:
+            return None
+
+        if relationship.direction is MANYTOMANY and len(relationship.secondary_synchronize_pairs) == 1:
+            return relationship
+        if relationship.direction is ONETOMANY and not relationship.cascade.delete_orphan:
+            return relationship
+        return None
+
+    @staticmethod
+    def _parent_values(item, relationship):
+        mapper = inspect(item).mapper
+        for parent_column, column in relationship.synchronize_pairs:
+            yield column, literal(getattr(item, mapper.get_property_by_column(parent_column).key), parent_column.type)
+
+    @staticmethod
+    def _check_target_ids(session, target_resource, target_ids):
+        id_column = target_resource.manager.id_column
+        existing_ids = {id for id, in session.query(id_column).filter(id_column.in_(target_ids))}
+
+        for id in target_ids:
+            if id not in existing_ids:
+                raise ItemNotFound(target_resource, id=id)
+
+    def relation_add_many(self, item, attribute, target_resource, target_ids):
+        relationship = self._bulk_writable_relationship(item, attribute)
+
+        if relationship is None:
+            return super(SQLAlchemyManager, self).relation_add_many(item, attribute, target_resource, target_ids)
+
+        session = inspect(item).session
+        self._check_target_ids(session, target_resource, target_ids)
+        before_bulk_add_to_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+        parent_values = list(self._parent_values(item, relationship))
+        target_id_column = target_resource.manager.id_column
+
+        if relationship.direction is MANYTOMANY:
+            (target_column, target_secondary_column), = relationship.secondary_synchronize_pairs
+            secondary = relationship.secondary
+
+            # INSERT ... SELECT the targets that are not yet associated with the item:
+            associated = select([secondary]).where(and_(target_secondary_column == target_column,
+                                                        *[column == value for column, value in parent_values]))
+            targets = select([value for column, value in parent_values] + [target_column]) \
+                .where(target_id_column.in_(target_ids)) \
+                .where(~exists(associated))
+
+            statement = secondary.insert().from_select([column for column, value in parent_values] +
+                                                       [target_secondary_column], targets)
+        else:
+            statement = relationship.mapper.local_table.update() \
+                .where(target_id_column.in_(target_ids)) \
+                .values(dict(parent_values))
+
+        session.execute(statement)
+        session.expire(item, [attribute])
+        after_bulk_add_to_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+    def relation_remove_many(self, item, attribute, target_resource, target_ids):
+        relationship = self._bulk_writable_relationship(item, attribute)
+
+        if relationship is None:
+            return super(SQLAlchemyManager, self).relation_remove_many(item, attribute, target_resource, target_ids)
+
+        session = inspect(item).session
+        self._check_target_ids(session, target_resource, target_ids)
+        before_bulk_remove_from_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+        parent_values = list(self._parent_values(item, relationship))
+        target_id_column = target_resource.manager.id_column
+
+        if relationship.direction is MANYTOMANY:
+            (target_column, target_secondary_column), = relationship.secondary_synchronize_pairs
+            targets = select([target_column]).where(target_id_column.in_(target_ids))
+
+            statement = relationship.secondary.delete() \
+                .where(and_(target_secondary_column.in_(targets),
+                            *[column == value for column, value in parent_values]))
+        else:
+            statement = relationship.mapper.local_table.update() \
+                .where(and_(target_id_column.in_(target_ids),
+                            *[column == value for column, value in parent_values])) \
+                .values({column: None for column, value in parent_values})
+
+        session.execute(statement)
+        session.expire(item, [attribute])
+        after_bulk_remove_from_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+    def _commit(self, session, expire=True):
+        """
+        Commits the session, or only flushes it within a transaction started with :meth:`begin`.
+
+        :param expire: whether to expire the items in the session. Items are expired, as they would be on commit,
+            since changes may have been written without the session. Items that were only written through the session
+            can be kept loaded, so that they are formatted without being read again. Columns generated by the database
+            are then read on access, unless the mapper loads them with the INSERT or UPDATE using ``eager_defaults``.
+        """
+        if session.info.get('potion_transactions'):
+            session.flush()
+            if expire:
+                session.expire_all()
+        elif expire:
+            session.commit()
+        else:
+            if isinstance(session, scoped_session):
+                session = session.registry()
+
+            expire_on_commit = session.expire_on_commit
+            session.expire_on_commit = False
+            try:
+                session.commit()
+            finally:
+                session.expire_on_commit = expire_on_commit
+
+    def begin(self):
+        info = self._get_session().info
+        info['potion_transactions'] = info.get('potion_transactions', 0) + 1
+
     def commit(self):
         session = self._get_session()
-        session.commit()
+        transactions = session.info.get('potion_transactions', 0)
+
+        if transactions > 1:
+            session.info['potion_transactions'] = transactions - 1
+            session.flush()
+            session.expire_all()
+        else:
+            session.info.pop('potion_transactions', None)
+            session.commit()
+
+    def rollback(self):
+        session = self._get_session()
+        session.info.pop('potion_transactions', None)
+        session.rollback()
+
+    def snapshot(self, value):
+        state = inspect(value, raiseerr=False)
+        if not isinstance(state, InstanceState):
+            return value
+
+        # items expired on commit are loaded again here rather than on the thread of the receiver
+        if state.persistent and state.expired_attributes:
+            state.session.refresh(value)
+
+        mapper = state.mapper
+        snapshot = mapper.class_manager.new_instance()
+        for prop in mapper.column_attrs:
+            if prop.key in state.dict:
+                set_committed_value(snapshot, prop.key, state.dict[prop.key])
+        return snapshot
@@ -1,4 +1,5 @@
 from flask_potion.exceptions import ItemNotFound
+from flask_potion.fields import ToManyChanges
 from flask_potion.instances import Pagination
 from flask_potion.manager import Manager
 from flask_potion.signals import before_add_to_relation, after_add_to_relation, before_remove_from_relation, \
@@ -20,6 +21,7 @@ class MemoryManager(Manager):
         self.id_sequence = 0
         self.items = {}
         self.session = []
+        self.transactions = 0
 
     def _new_item_id(self):
         self.id_sequence += 1
@@ -40,18 +42,23 @@ class MemoryManager(Manager):
     def _paginate(self, items, page, per_page):
         return Pagination.from_list(list(items), page, per_page)
 
-    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None):
+    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None, where=None, sort=None):
         collection = item.get(attribute, set())
 
         items = []
-        for id in collection:
+        for id in list(collection):
             try:
                 items.append(target_resource.manager.read(id))
             except ItemNotFound:
                 collection.remove(id)
                 pass
 
-        return Pagination.from_list(items, page, per_page)
+        if where:
+            items = self._filter_items(items, where)
+        if sort:
+            items = self._sort_items(items, sort)
+
+        return self._paginate(items, page, per_page)
 
     def relation_add(self, item, attribute, target_resource, target_item):
         before_add_to_relation.send(self.resource, item=item, attribute=attribute, child=target_item)
@@ -68,7 +75,7 @@ class MemoryManager(Manager):
         collection.remove(item_id)
         after_remove_from_relation.send(self.resource, item=item, attribute=attribute, child=target_item)
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
+    def paginated_instances(self, page, per_page, where=None, sort=None, embed=None):
         return self._paginate(self.instances(where=where, sort=sort), page, per_page)
 
     def instances(self, where=None, sort=None):
@@ -92,14 +99,17 @@ class MemoryManager(Manager):
         item = dict({self.id_attribute: item_id})
         item.update(properties)
 
-        if commit:
+        if self.version_attribute is not None:
+            item[self.version_attribute] = 1
+
+        if commit and not self.transactions:
             self.items[item_id] = item
         else:
-            self.session[item_id] = item
+            self.session.append((item_id, item))
 
         return item
 
-    def read(self, id):
+    def read(self, id, attributes=None):
         try:
             item = self.items[id]
         except KeyError:
@@ -107,12 +117,25 @@ class MemoryManager(Manager):
 
         return item
 
+    @staticmethod
+    def _apply_to_many_changes(items, changes):
+        id_attribute = changes.target.manager.id_attribute
+        remove = set(changes.remove)
+        items = [i for i in items or () if get_value(id_attribute, i, None) not in remove]
+        ids = {get_value(id_attribute, i, None) for i in items}
+        return items + [i for i in changes.target.manager.read_many(changes.add)
+                        if get_value(id_attribute, i, None) not in ids]
+
     def update(self, item, changes, commit=True):
         item_id = item[self.id_attribute]
         item = dict(item)
-        item.update(changes)
 
-        if commit:
+        for key, value in self._versioned_changes(item, changes).items():
+            if isinstance(value, ToManyChanges):
+                value = self._apply_to_many_changes(item.get(key), value)
+            item[key] = value
+
+        if commit and not self.transactions:
             self.items[item_id] = item
         else:
             self.session.append((item_id, item))
@@ -121,11 +144,30 @@ class MemoryManager(Manager):
 
     def delete(self, item):
         item_id = item[self.id_attribute]
-        del self.items[item_id]
+
+        if self.transactions:
+            self.session.append((item_id, None))
+        else:
+            del self.items[item_id]
 
     def commit(self):
+        if self.transactions > 1:
+            self.transactions -= 1
+            return
+
         for item_id, item in self.session:
-            self.items[item_id] = item
+            if item is None:
+                self.items.pop(item_id, None)
+            else:
+                self.items[item_id] = item
+        self.session = []
+        self.transactions = 0
 
     def begin(self):
-        self.session = []
\ No newline at end of file
+        if not self.transactions:
+            self.session = []
+        self.transactions += 1
+
+    def rollback(self):
+        self.session = []
+        self.transactions = 0
\ No newline at end of file
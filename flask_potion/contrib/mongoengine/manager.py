@@ -1,9 +1,10 @@
 from __future__ import absolute_import
 
-from bson import ObjectId as bson_ObjectId
+from bson import ObjectId as bson_ObjectId, DBRef, json_util
 from bson.errors import InvalidId
 
-from flask import current_app
+from flask import current_app, json
+from mongoengine import Document
 from mongoengine.errors import OperationError, ValidationError
 import mongoengine.fields as mongo_fields
 from flask_mongoengine import Pagination as MEPagination
@@ -14,7 +15,9 @@ from flask_potion.exceptions import ItemNotFound, BackendConflict
 from flask_potion.instances import Pagination
 from flask_potion.manager import Manager
 from flask_potion.signals import before_create, before_update, after_update, before_delete, after_delete, after_create, \
-    before_add_to_relation, after_remove_from_relation, before_remove_from_relation, after_add_to_relation
+    before_add_to_relation, after_remove_from_relation, before_remove_from_relation, after_add_to_relation, \
+    before_bulk_add_to_relation, after_bulk_add_to_relation, before_bulk_remove_from_relation, \
+    after_bulk_remove_from_relation, before_bulk_update, after_bulk_update, before_bulk_delete, after_bulk_delete
 from flask_potion import fields
 
 
@@ -119,7 +122,8 @@ class MongoEngineManager(Manager):
 
                 field_instance = self._get_field_from_mongoengine_type(column, io=io, attribute=name)
 
-                if not (column.null or column.default is not None):
+                # read-only values, such as the version, are set by the manager
+                if io != "r" and not (column.null or column.default is not None):
                     fs.required.add(name)
 
                 fs.set(name, field_instance)
@@ -187,13 +191,35 @@ class MongoEngineManager(Manager):
             else:
                 yield "+%s" % attribute
 
-    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None):
-        query = getattr(item, attribute)
-        if page and per_page:
-            return Pagination.from_list(query, page, per_page)
-        else:
+    @staticmethod
+    def _reference_id(reference):
+        if isinstance(reference, DBRef):
+            return reference.id
+        return getattr(reference, 'pk', reference)
+
+    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None, where=None, sort=None):
+        # read the references without dereferencing them:
+        references = item._data.get(attribute) or []
+        target_manager = target_resource.manager
+
+        if where or sort:
+            ids = [self._reference_id(reference) for reference in references]
+            query = target_manager.instances(where, sort)(pk__in=ids)
+
+            if page and per_page:
+                return query.paginate(page=page, per_page=per_page)
             return query.all()
 
+        if page and per_page:
+            # only read the items on the page:
+            start = per_page * (page - 1)
+            ids = [self._reference_id(reference) for reference in references[start:start + per_page]]
+            target_items = {target_item.pk: target_item for target_item in target_manager.model.objects(pk__in=ids)}
+            return Pagination([target_items[id] for id in ids if id in target_items], page, per_page, len(references))
+
+        query = getattr(item, attribute)
+        return query.all()
+
     def relation_add(self, item, attribute, target_resource, target_item):
         before_add_to_relation.send(self.resource, item=item, attribute=attribute, child=target_item)
         getattr(item, attribute).append(target_item)
@@ -211,7 +237,26 @@ class MongoEngineManager(Manager):
             item.save()
             after_remove_from_relation.send(self.resource, item=item, attribute=attribute, child=target_item)
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
+    def relation_add_many(self, item, attribute, target_resource, target_ids):
+        target_items = target_resource.manager.read_many(target_ids)
+        before_bulk_add_to_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+        # a single $addToSet with $each instead of saving the whole list:
+        self.model.objects(pk=item.pk).update_one(**{'add_to_set__{}'.format(attribute): target_items})
+        item.reload(attribute)
+
+        after_bulk_add_to_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+    def relation_remove_many(self, item, attribute, target_resource, target_ids):
+        target_items = target_resource.manager.read_many(target_ids)
+        before_bulk_remove_from_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+        self.model.objects(pk=item.pk).update_one(**{'pull_all__{}'.format(attribute): target_items})
+        item.reload(attribute)
+
+        after_bulk_remove_from_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+    def paginated_instances(self, page, per_page, where=None, sort=None, embed=None):
         return self.instances(where=where, sort=sort).paginate(page=page, per_page=per_page)
 
     def instances(self, where=None, sort=None):
@@ -233,11 +278,60 @@ class MongoEngineManager(Manager):
         else:
             return res
 
-    def create(self, properties, commit=True):
+    def explain(self, page, per_page, where=None, sort=None):
+        query = self.instances(where=where, sort=sort).skip((page - 1) * per_page).limit(per_page)
+
+        statement = {
+            "filter": query._query,
+            "sort": query._ordering,
+            "skip": (page - 1) * per_page,
+            "limit": per_page
+        }
+
+        return {
+            "statement": json.loads(json_util.dumps(statement)),
+            "parameters": [],
+            "plan": json.loads(json_util.dumps(query.explain()))
+        }
+
+    def facets(self, fields, where=None, limit=None):
+        # all facets are counted in a single aggregation using the $facet stage (MongoDB 3.4+)
+        stages = {}
+        for i, (name, field) in enumerate(fields.items()):
+            db_field = self.model._fields[field.attribute or name].db_field
+            stages['f{}'.format(i)] = [
+                {'$group': {'_id': '${}'.format(db_field), 'count': {'$sum': 1}}},
+                {'$sort': {'count': -1, '_id': 1}}
+            ]
+
+            if limit:
+                stages['f{}'.format(i)].append({'$limit': limit})
+
+        if not stages:
+            return {}
+
+        result = next(self.instances(where=where).aggregate({'$facet': stages}))
+        return {
+            name: [(self._facet_value(group['_id']), group['count']) for group in result['f{}'.format(i)]]
+            for i, name in enumerate(fields)
+        }
+
+    @staticmethod
+    def _facet_value(value):
+        if isinstance(value, DBRef):
+            return value.id
+        return value
+
+    def _new_item(self, properties):
+        properties = self._versioned_properties(properties)
         item = self.model()
 
         for key, value in properties.items():
             setattr(item, key, value)
+        return item
+
+    def create(self, properties, commit=True):
+        item = self._new_item(properties)
 
         before_create.send(self.resource, item=item)
 
@@ -251,23 +345,95 @@ class MongoEngineManager(Manager):
         after_create.send(self.resource, item=item)
         return item
 
-    def read(self, id):
+    def create_many(self, properties_list, commit=True):
+        items = [self._new_item(properties) for properties in properties_list]
+
+        for item in items:
+            before_create.send(self.resource, item=item)
+            item.validate()
+
+        if items:
+            try:
+                # one bulk insert; the ids of the new documents are set on the items
+                self.model.objects.insert(items, load_bulk=False)
+            except OperationError as e:
+                if current_app.debug:
+                    raise BackendConflict(debug_info=dict(statement=e.args))
+                raise BackendConflict()
+
+        for item in items:
+            after_create.send(self.resource, item=item)
+        return items
+
+    def upsert_many(self, properties_list, commit=True):
+        if self._natural_key is None:
+            raise RuntimeError("'{}' has no natural key".format(self.resource.meta.name))
+
+        if self._has_item_receivers(before_create, after_create, before_update, after_update):
+            # items are only saved by update() when committed
+            return [self._upsert_item(properties, commit=True) for properties in properties_list]
+
+        items = []
+        for properties in properties_list:
+            key = {attribute: properties.get(attribute) for name, attribute in self._natural_key}
+            update = {'set__{}'.format(k): v for k, v in properties.items() if k not in key} \
+                or {'set__{}'.format(k): v for k, v in key.items()}
+
+            # $inc sets the version of a new document to 1
+            if self.version_attribute is not None:
+                update.pop('set__{}'.format(self.version_attribute), None)
+                update['inc__{}'.format(self.version_attribute)] = 1
+
+            try:
+                # a single findAndModify() with upsert, which returns the new or updated document
+                items.append(self.model.objects(**key).modify(upsert=True, new=True, **update))
+            except OperationError as e:
+                if current_app.debug:
+                    raise BackendConflict(debug_info=dict(statement=e.args))
+                raise BackendConflict()
+        return items
+
+    def read(self, id, attributes=None):
+        # documents are always read in full: fields excluded with only() are not loaded when they are accessed, but
+        # read as their defaults, and would be formatted or saved as such
         try:
             return self.model.objects(**{self.id_attribute: id}).first()
         except (InvalidId, ValidationError):
             raise ItemNotFound(self.resource, id=id)
 
+    def read_many(self, ids):
+        if not ids:
+            return []
+
+        try:
+            items = list(self.model.objects(**{'{}__in'.format(self.id_attribute): ids}))
+        except (InvalidId, ValidationError):
+            # read one by one to report the id that is invalid
+            return super(MongoEngineManager, self).read_many(ids)
+
+        # ids in references may be strings rather than ObjectIds
+        items_by_id = {str(get_value(self.id_attribute, item, None)): item for item in items}
+
+        for id in ids:
+            if str(id) not in items_by_id:
+                raise ItemNotFound(self.resource, id=id)
+        return [items_by_id[str(id)] for id in ids]
+
     def update(self, item, changes, commit=True):
+        changes = self._versioned_changes(item, changes)
         actual_changes = {
             key: value for key, value in changes.items()
-            if get_value(key, item, None) != value
+            if isinstance(value, fields.ToManyChanges) or get_value(key, item, None) != value
             }
 
         try:
             before_update.send(self.resource, item=item, changes=actual_changes)
 
             for key, value in changes.items():
-                setattr(item, key, value)
+                if isinstance(value, fields.ToManyChanges):
+                    self._update_to_many(item, key, value)
+                else:
+                    setattr(item, key, value)
 
             if commit:
                 item.save()
@@ -277,7 +443,131 @@ class MongoEngineManager(Manager):
         after_update.send(self.resource, item=item, changes=actual_changes)
         return item
 
+    def _update_operators(self, changes):
+        operators = {}
+        for key, value in changes.items():
+            if isinstance(value, fields.InPlaceChange):
+                operators['{}__{}'.format(value.operator[1:], key)] = value.value
+            else:
+                operators['set__{}'.format(key)] = value
+
+        if self.version_attribute is not None:
+            operators['inc__{}'.format(self.version_attribute)] = 1
+        return operators
+
+    def _objects_by_id_and_version(self, id, version=None):
+        conditions = {self.id_attribute: id}
+        if version is not None:
+            conditions[self.version_attribute] = version
+        return self.model.objects(**conditions)
+
+    def _validates_changes(self, changes):
+        """
+        Validates changes the way ``Document.validate()`` would before a save.
+
+        :return: ``False`` if the changes can only be validated with the document, e.g. because the document
+            implements ``clean()``, or because they are invalid
+        """
+        if getattr(self.model.clean, '__func__', self.model.clean) is not getattr(Document.clean, '__func__',
+                                                                                    Document.clean):
+            return False
+
+        for key, value in changes.items():
+            field = self.model._fields.get(key)
+
+            # in-place changes depend on the current value
+            if field is None or isinstance(value, (fields.InPlaceChange, fields.ToManyChanges)):
+                return False
+
+            if value is None:
+                if field.required:
+                    return False
+                continue
+
+            try:
+                field._validate(value)
+            except ValidationError:
+                return False
+        return True
+
+    def update_by_id(self, id, changes, commit=True, version=None):
+        # modify() does not validate the document, so changes that cannot be validated without it are saved instead
+        if not changes or self._has_item_receivers(before_update, after_update) or not self._validates_changes(changes):
+            return super(MongoEngineManager, self).update_by_id(id, changes, commit, version)
+
+        try:
+            # a single findAndModify(), which returns the updated document
+            item = self._objects_by_id_and_version(id, version).modify(new=True, **self._update_operators(changes))
+        except (InvalidId, ValidationError):
+            raise ItemNotFound(self.resource, id=id)
+        except OperationError as e:
+            if current_app.debug:
+                raise BackendConflict(debug_info=dict(statement=e.args))
+            raise BackendConflict()
+
+        if item is None:
+            raise self._not_written(id, version)
+        return item
+
+    def update_where(self, where, changes, commit=True):
+        query = self.instances(where)
+
+        if self._has_item_receivers(before_update, after_update) \
+                or any(isinstance(value, fields.ToManyChanges) for value in changes.values()):
+            before_bulk_update.send(self.resource, where=where, changes=changes)
+            items = list(query)
+            for item in items:
+                self.update(item, changes)
+            after_bulk_update.send(self.resource, where=where, changes=changes, count=len(items))
+            return len(items)
+
+        before_bulk_update.send(self.resource, where=where, changes=changes)
+        # QuerySet.update() issues a single update_many()
+        count = query.update(**self._update_operators(changes))
+        after_bulk_update.send(self.resource, where=where, changes=changes, count=count)
+        return count
+
     def delete(self, item):
         before_delete.send(self.resource, item=item)
         item.delete()
         after_delete.send(self.resource, item=item)
+
+    def delete_by_id(self, id, version=None):
+        if self._has_item_receivers(before_delete, after_delete):
+            return super(MongoEngineManager, self).delete_by_id(id, version)
+
+        try:
+            count = self._objects_by_id_and_version(id, version).delete()
+        except (InvalidId, ValidationError):
+            raise ItemNotFound(self.resource, id=id)
+
+        if not count:
+            raise self._not_written(id, version)
+
+    def delete_where(self, where, limit=None, commit=True):
+        if limit is None and not self._has_item_receivers(before_delete, after_delete,
+                                                          before_bulk_delete, after_bulk_delete):
+            return self.instances(where).delete()
+
+        query = self.instances(where).order_by('pk')
+        if limit is not None:
+            query = query.limit(limit)
+
+        ids = list(query.scalar('pk'))
+
+        if not ids:
+            return 0
+
+        if self._has_item_receivers(before_delete, after_delete):
+            return self._delete_items(self.read_many(ids), ids)
+
+        before_bulk_delete.send(self.resource, ids=ids)
+        # QuerySet.delete() applies the delete rules of reference fields and issues a single delete_many()
+        count = self.model.objects(pk__in=ids).delete()
+        after_bulk_delete.send(self.resource, ids=ids)
+        return count
+
+    def snapshot(self, value):
+        if not isinstance(value, Document):
+            return value
+        return type(value)._from_son(value.to_mongo())
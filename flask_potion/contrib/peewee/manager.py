@@ -1,5 +1,8 @@
 from __future__ import absolute_import
-from flask import current_app
+from functools import reduce
+import operator
+
+from flask import current_app, g
 import peewee as pw
 
 try:
@@ -7,12 +10,17 @@ try:
 except ImportError:
     postgres_ext = False
 
+try:
+    from playhouse.fields import ManyToManyField
+except ImportError:
+    ManyToManyField = None
+
 from flask_potion import fields, signals
 from flask_potion.instances import Pagination
 from flask_potion.contrib.peewee.filters import FILTER_NAMES, FILTERS_BY_TYPE, PeeweeBaseFilter
 from flask_potion.exceptions import ItemNotFound, BackendConflict
 from flask_potion.manager import Manager
-from flask_potion.utils import get_value
+from flask_potion.utils import get_value, chunked
 
 
 class PeeweeManager(Manager):
@@ -110,7 +118,8 @@ class PeeweeManager(Manager):
                 elif name in write_only_fields:
                     io = "w"
 
-                if not (column.null or column.default):
+                # read-only values, such as the version, are set by the manager
+                if io != "r" and not (column.null or column.default):
                     fs.required.add(name)
 
                 fs.set(
@@ -122,6 +131,46 @@ class PeeweeManager(Manager):
                             attribute=field.attribute or attribute,
                             column=getattr(self.model, field.attribute or attribute))
 
+    def _foreign_key_getter(self, attribute, target_resource):
+        column = self.model._meta.fields.get(attribute)
+
+        if isinstance(column, pw.ForeignKeyField) and column.to_field.name == target_resource.manager.id_attribute:
+            # the id of the referenced item is stored in the item's data; the item is read on attribute access
+            return lambda item: item._data.get(attribute)
+        return None
+
+    def _reference_ids(self, items, attribute, target_resource):
+        target_id_attribute = target_resource.manager.id_attribute
+
+        if attribute in self.model._meta.reverse_rel:
+            foreign_key = self.model._meta.reverse_rel[attribute]
+
+            if foreign_key.to_field.name != self.id_attribute:
+                return None
+
+            query = foreign_key.model_class.select(foreign_key, getattr(foreign_key.model_class, target_id_attribute))
+        else:
+            field = getattr(self.model, attribute, None)
+
+            if ManyToManyField is None or not isinstance(field, ManyToManyField) or field.rel_model is self.model:
+                return None
+
+            through_model = field.get_through_model()
+            foreign_key = through_model._meta.rel_for_model(self.model)
+            target_foreign_key = through_model._meta.rel_for_model(field.rel_model)
+
+            if foreign_key.to_field.name != self.id_attribute or target_foreign_key.to_field.name != target_id_attribute:
+                return None
+
+            query = through_model.select(foreign_key, target_foreign_key)
+
+        query = query.where(foreign_key << [get_value(self.id_attribute, item, None) for item in items])
+
+        ids = {}
+        for item_id, target_id in query.tuples():
+            ids.setdefault(item_id, []).append(target_id)
+        return ids
+
     def _query(self):
         return self.model.select()
 
@@ -135,8 +184,14 @@ class PeeweeManager(Manager):
                 yield column.asc()
 
     def relation_instances(self, item, attribute, target_resource, page=None,
-                           per_page=None):
+                           per_page=None, where=None, sort=None):
         query = getattr(item, attribute)
+
+        if where:
+            query = PeeweeBaseFilter.apply(query, where)
+        if sort:
+            query = query.order_by(*target_resource.manager._order_by(sort))
+
         if page and per_page:
             # TODO see if this can be better done in one query
             return Pagination(query.paginate(page, per_page), page, per_page, query.count())
@@ -172,10 +227,133 @@ class PeeweeManager(Manager):
         signals.after_remove_from_relation.send(
             self.resource, item=item, attribute=attribute, child=target_item)
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
+    def _bulk_relation(self, attribute, target_resource):
+        """
+        Returns a ``(model, foreign_key, target_foreign_key)`` tuple for writing changes to a relation directly to
+        the through model of a many-to-many field or, with ``target_foreign_key`` set to ``None``, to the foreign key
+        of a back-reference. Returns ``None`` if the relation cannot be written in bulk.
+        """
+        target_id_attribute = target_resource.manager.id_attribute
+
+        if attribute in self.model._meta.reverse_rel:
+            foreign_key = self.model._meta.reverse_rel[attribute]
+
+            if foreign_key.to_field.name != self.id_attribute or not foreign_key.null:
+                return None
+            return foreign_key.model_class, foreign_key, None
+
+        field = getattr(self.model, attribute, None)
+
+        if ManyToManyField is None or not isinstance(field, ManyToManyField) or field.rel_model is self.model:
+            return None
+
+        through_model = field.get_through_model()
+        foreign_key = through_model._meta.rel_for_model(self.model)
+        target_foreign_key = through_model._meta.rel_for_model(field.rel_model)
+
+        if foreign_key.to_field.name != self.id_attribute or target_foreign_key.to_field.name != target_id_attribute:
+            return None
+        return through_model, foreign_key, target_foreign_key
+
+    @staticmethod
+    def _check_target_ids(target_resource, target_ids):
+        id_column = getattr(target_resource.manager.model, target_resource.manager.id_attribute)
+        query = target_resource.manager.model.select(id_column).where(id_column << target_ids)
+        existing_ids = {id for id, in query.tuples()}
+
+        for id in target_ids:
+            if id not in existing_ids:
+                raise ItemNotFound(target_resource, id=id)
+
+    def relation_add_many(self, item, attribute, target_resource, target_ids):
+        relation = self._bulk_relation(attribute, target_resource)
+
+        if relation is None:
+            return super(PeeweeManager, self).relation_add_many(item, attribute, target_resource, target_ids)
+
+        self._check_target_ids(target_resource, target_ids)
+        signals.before_bulk_add_to_relation.send(
+            self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+        model, foreign_key, target_foreign_key = relation
+        item_id = get_value(self.id_attribute, item, None)
+
+        if target_foreign_key is None:
+            target_id_column = getattr(model, target_resource.manager.id_attribute)
+            model.update(**{foreign_key.name: item_id}).where(target_id_column << target_ids).execute()
+        else:
+            # INSERT ... SELECT the targets that are not yet associated with the item:
+            target_id_column = target_foreign_key.to_field
+            associated = model.select(target_foreign_key).where(foreign_key == item_id)
+            targets = target_foreign_key.rel_model \
+                .select(pw.Param(item_id), target_id_column) \
+                .where((target_id_column << target_ids) & ~(target_id_column << associated))
+            model.insert_from([foreign_key, target_foreign_key], targets).execute()
+
+        signals.after_bulk_add_to_relation.send(
+            self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+    def relation_remove_many(self, item, attribute, target_resource, target_ids):
+        relation = self._bulk_relation(attribute, target_resource)
+
+        if relation is None:
+            return super(PeeweeManager, self).relation_remove_many(item, attribute, target_resource, target_ids)
+
+        self._check_target_ids(target_resource, target_ids)
+        signals.before_bulk_remove_from_relation.send(
+            self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+        model, foreign_key, target_foreign_key = relation
+        item_id = get_value(self.id_attribute, item, None)
+
+        if target_foreign_key is None:
+            target_id_column = getattr(model, target_resource.manager.id_attribute)
+            model.update(**{foreign_key.name: None}) \
+                .where((target_id_column << target_ids) & (foreign_key == item_id)) \
+                .execute()
+        else:
+            model.delete() \
+                .where((foreign_key == item_id) & (target_foreign_key << target_ids)) \
+                .execute()
+
+        signals.after_bulk_remove_from_relation.send(
+            self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+    def _prefetch(self, query, attributes):
+        subqueries = []
+        backrefs = []
+
+        for attribute in attributes:
+            column = self.model._meta.fields.get(attribute)
+
+            if isinstance(column, pw.ForeignKeyField):
+                subqueries.append(column.rel_model)
+            elif attribute in self.model._meta.reverse_rel:
+                subqueries.append(self.model._meta.reverse_rel[attribute].model_class)
+                backrefs.append(attribute)
+
+        if not subqueries:
+            return query
+
+        items = list(pw.prefetch(query, *subqueries))
+
+        # prefetch() stores back-references in "<related_name>_prefetch"; expose them under the
+        # original attribute name instead of the query that would otherwise be executed for each item:
+        for item in items:
+            for attribute in backrefs:
+                item.__dict__[attribute] = getattr(item, '{}_prefetch'.format(attribute))
+        return items
+
+    def paginated_instances(self, page, per_page, where=None, sort=None, embed=None):
         query = self.instances(where, sort)
+
+        attributes = self.eager_load
+        if embed:
+            attributes += tuple(a for a in self._attributes_for_fields(embed) if a not in attributes)
+
         # TODO see if this can be better done in one query
-        return Pagination(query.paginate(page, per_page), page, per_page, query.count())
+        items = self._prefetch(query.paginate(page, per_page), attributes)
+        return Pagination(items, page, per_page, query.count())
 
     def instances(self, where=None, sort=None):
         query = self._query()
@@ -188,16 +366,96 @@ class PeeweeManager(Manager):
         return query
 
     def first(self, where=None, sort=None):
-        try:
-            return self.instances(where, sort).first()
-        except self.model.DoesNotExist:
+        item = self.instances(where, sort).first()
+        if item is None:
             raise ItemNotFound(self.resource, where=where)
+        return item
 
-    def create(self, properties, commit=True):
+    def explain(self, page, per_page, where=None, sort=None):
+        query = self.instances(where, sort).paginate(page, per_page)
+        statement, parameters = query.sql()
+        database = self.model._meta.database
+
+        if isinstance(database, pw.SqliteDatabase):
+            prefix = 'EXPLAIN QUERY PLAN '
+        else:
+            prefix = 'EXPLAIN '
+
+        cursor = database.execute_sql(prefix + statement, parameters)
+        columns = [column[0] for column in cursor.description]
+
+        return {
+            "statement": statement,
+            "parameters": list(parameters),
+            "plan": [dict(zip(columns, row)) for row in cursor.fetchall()]
+        }
+
+    def facets(self, fields, where=None, limit=None):
+        query = self.instances(where=where)
+        count = pw.fn.COUNT(self.id_column)
+        facets = {}
+
+        for name, field in fields.items():
+            column = getattr(self.model, field.attribute or name)
+            facets[name] = list(query.select(column, count)
+                                .group_by(column)
+                                .order_by(count.desc(), column.asc())
+                                .limit(limit)
+                                .tuples())
+        return facets
+
+    def _transactions(self):
+        # the transactions started with begin() by the current request or application context, for each database
+        transactions = getattr(g, 'potion_peewee_transactions', None)
+        if transactions is None:
+            transactions = g.potion_peewee_transactions = {}
+        return transactions.setdefault(self.model._meta.database, [])
+
+    def begin(self):
+        # saves within a transaction are not committed until the outermost transaction is
+        transaction = self.model._meta.database.transaction()
+        transaction.__enter__()
+        self._transactions().append(transaction)
+
+    def commit(self):
+        transactions = self._transactions()
+
+        if transactions:
+            transactions.pop().__exit__(None, None, None)
+
+    def rollback(self):
+        transactions = self._transactions()
+
+        while transactions:
+            transaction = transactions.pop()
+            transaction.rollback(False)
+            transaction.__exit__(None, None, None)
+
+    def snapshot(self, value):
+        if not isinstance(value, pw.Model):
+            return value
+
+        # related items are not copied; they are read again when they are accessed
+        snapshot = type(value)()
+        snapshot._data = dict(value._data)
+        return snapshot
+
+    @staticmethod
+    def _conflict(e):
+        if current_app.debug:
+            return BackendConflict(debug_info=e.args)
+        return BackendConflict()
+
+    def _new_item(self, properties):
+        properties = self._versioned_properties(properties)
         item = self.model()
 
         for key, value in properties.items():
             setattr(item, key, value)
+        return item
+
+    def create(self, properties, commit=True):
+        item = self._new_item(properties)
 
         signals.before_create.send(
             self.resource, item=item)
@@ -205,42 +463,173 @@ class PeeweeManager(Manager):
         try:
             item.save()
         except pw.IntegrityError as e:
-            if current_app.debug:
-                raise BackendConflict(debug_info=e.args)
-            raise BackendConflict()
+            raise self._conflict(e)
 
         signals.after_create.send(self.resource, item=item)
         return item
 
-    def read(self, id):
+    def create_many(self, properties_list, commit=True):
+        items = [self._new_item(properties) for properties in properties_list]
+
+        for item in items:
+            signals.before_create.send(
+                self.resource, item=item)
+
+        # insert_many() cannot return the ids of the new rows on every database, so the items are saved one by one,
+        # but in a single transaction:
+        try:
+            with self.model._meta.database.atomic():
+                for item in items:
+                    item.save()
+        except pw.IntegrityError as e:
+            raise self._conflict(e)
+
+        for item in items:
+            signals.after_create.send(self.resource, item=item)
+        return items
+
+    def upsert_many(self, properties_list, commit=True):
+        if self._natural_key is None:
+            raise RuntimeError("'{}' has no natural key".format(self.resource.meta.name))
+
+        model_fields = self.model._meta.fields
+        key_attributes = [attribute for name, attribute in self._natural_key]
+
+        # peewee 2 has no INSERT ... ON CONFLICT DO UPDATE, so existing items are looked up with a single SELECT and
+        # written with an UPDATE or INSERT each, without loading them; many-to-many fields have no column
+        if any(attribute not in model_fields or isinstance(model_fields[attribute], pw.ForeignKeyField)
+               for attribute in key_attributes) \
+                or any(key not in model_fields
+                       or ManyToManyField is not None and isinstance(model_fields[key], ManyToManyField)
+                       for properties in properties_list for key in properties) \
+                or self._has_item_receivers(signals.before_create, signals.after_create,
+                                            signals.before_update, signals.after_update):
+            return super(PeeweeManager, self).upsert_many(properties_list, commit)
+
+        key_fields = [model_fields[attribute] for attribute in key_attributes]
+        keys = [tuple(properties.get(attribute) for attribute in key_attributes) for properties in properties_list]
+        condition = reduce(operator.or_, [
+            reduce(operator.and_, [field == value for field, value in zip(key_fields, key)]) for key in keys])
+
+        try:
+            with self.model._meta.database.atomic():
+                ids_by_key = {tuple(row[1:]): row[0]
+                              for row in self.model.select(self.id_column, *key_fields).where(condition).tuples()}
+
+                for key, properties in zip(keys, properties_list):
+                    if key not in ids_by_key:
+                        ids_by_key[key] = self.model.insert(**self._versioned_properties(properties)).execute()
+                        continue
+
+                    changes = {name: value for name, value in properties.items() if name not in key_attributes}
+                    if self.version_attribute is not None:
+                        changes[self.version_attribute] = model_fields[self.version_attribute] + 1
+                    if changes:
+                        self.model.update(**changes).where(self.id_column == ids_by_key[key]).execute()
+        except pw.IntegrityError as e:
+            raise self._conflict(e)
+
+        items_by_key = {tuple(getattr(item, attribute) for attribute in key_attributes): item
+                        for item in self.model.select().where(condition)}
+        return [items_by_key[key] for key in keys]
+
+    def read(self, id, attributes=None):
+        # peewee does not load fields that were not selected when they are accessed, so the full row is always read
         try:
             return self.model.get(self.id_column == id)
         except self.model.DoesNotExist:
             raise ItemNotFound(self.resource, id=id)
 
+    def read_many(self, ids):
+        if not ids:
+            return []
+        return self._items_in_order(ids, self.model.select().where(self.id_column << ids))
+
     def update(self, item, changes, commit=True):
+        changes = self._versioned_changes(item, changes)
         actual_changes = {
             key: value for key, value in changes.items()
-            if get_value(key, item, None) != value
+            if isinstance(value, fields.ToManyChanges) or get_value(key, item, None) != value
             }
 
         signals.before_update.send(
             self.resource, item=item, changes=actual_changes)
 
         for key, value in changes.items():
-            setattr(item, key, value)
+            if isinstance(value, fields.ToManyChanges):
+                self._update_to_many(item, key, value)
+            else:
+                setattr(item, key, value)
 
         try:
             item.save()
         except pw.IntegrityError as e:
-            if current_app.debug:
-                raise BackendConflict(debug_info=e.args)
-            raise BackendConflict()
+            raise self._conflict(e)
 
         signals.after_update.send(
             self.resource, item=item, changes=actual_changes)
         return item
 
+    def _is_bulk_update(self, changes):
+        model_fields = self.model._meta.fields
+
+        # many-to-many fields and changes to relations have no column to write to
+        return not self._has_item_receivers(signals.before_update, signals.after_update) and not any(
+            key not in model_fields or isinstance(value, fields.ToManyChanges)
+            or isinstance(value, fields.InPlaceChange) and value.operator != '$inc'
+            or ManyToManyField is not None and isinstance(model_fields[key], ManyToManyField)
+            for key, value in changes.items())
+
+    def _update_values(self, changes):
+        model_fields = self.model._meta.fields
+        values = {key: model_fields[key] + value.value if isinstance(value, fields.InPlaceChange) else value
+                  for key, value in changes.items()}
+
+        if self.version_attribute is not None:
+            values[self.version_attribute] = model_fields[self.version_attribute] + 1
+        return values
+
+    def _where_id_and_version(self, id, version=None):
+        condition = self.id_column == id
+        if version is not None:
+            condition &= self.model._meta.fields[self.version_attribute] == version
+        return condition
+
+    def update_by_id(self, id, changes, commit=True, version=None):
+        if not changes or not self._is_bulk_update(changes):
+            return super(PeeweeManager, self).update_by_id(id, changes, commit, version)
+
+        try:
+            count = self.model.update(**self._update_values(changes)) \
+                .where(self._where_id_and_version(id, version)) \
+                .execute()
+        except pw.IntegrityError as e:
+            raise self._conflict(e)
+
+        if not count:
+            raise self._not_written(id, version)
+        return self.read(id)
+
+    def update_where(self, where, changes, commit=True):
+        query = self.instances(where)
+
+        if not self._is_bulk_update(changes):
+            return self._update_items(list(query), where, changes, commit)
+
+        statement = self.model.update(**self._update_values(changes))
+        if where:
+            statement = PeeweeBaseFilter.apply(statement, where)
+
+        signals.before_bulk_update.send(self.resource, where=where, changes=changes)
+
+        try:
+            count = statement.execute()
+        except pw.IntegrityError as e:
+            raise self._conflict(e)
+
+        signals.after_bulk_update.send(self.resource, where=where, changes=changes, count=count)
+        return count
+
     def delete(self, item):
         signals.before_delete.send(
             self.resource, item=item)
@@ -248,4 +637,49 @@ class PeeweeManager(Manager):
         item.delete_instance()
 
         signals.after_delete.send(
-            self.resource, item=item)
\ No newline at end of file
+            self.resource, item=item)
+
+    def delete_by_id(self, id, version=None):
+        if self._has_item_receivers(signals.before_delete, signals.after_delete):
+            return super(PeeweeManager, self).delete_by_id(id, version)
+
+        try:
+            count = self.model.delete().where(self._where_id_and_version(id, version)).execute()
+        except pw.IntegrityError as e:
+            raise self._conflict(e)
+
+        if not count:
+            raise self._not_written(id, version)
+
+    def delete_where(self, where, limit=None, commit=True):
+        if limit is None and not self._has_item_receivers(signals.before_delete, signals.after_delete,
+                                                          signals.before_bulk_delete, signals.after_bulk_delete):
+            statement = self.model.delete()
+            if where:
+                statement = PeeweeBaseFilter.apply(statement, where)
+            return self._execute_delete([statement])
+
+        query = self.instances(where).select(self.id_column).order_by(self.id_column)
+        if limit is not None:
+            query = query.limit(limit)
+
+        ids = [id for id, in query.tuples()]
+
+        if not ids:
+            return 0
+
+        if self._has_item_receivers(signals.before_delete, signals.after_delete):
+            return self._delete_items(self.read_many(ids), ids)
+
+        signals.before_bulk_delete.send(self.resource, ids=ids)
+        self._execute_delete([self.model.delete().where(self.id_column << chunk)
+                              for chunk in chunked(ids, self.IDS_PER_STATEMENT)])
+        signals.after_bulk_delete.send(self.resource, ids=ids)
+        return len(ids)
+
+    def _execute_delete(self, statements):
+        try:
+            with self.model._meta.database.atomic():
+                return sum(statement.execute() for statement in statements)
+        except pw.IntegrityError as e:
+            raise self._conflict(e)
@@ -1,10 +1,11 @@
 import six
+from flask import g
 from sqlalchemy.orm.collections import InstrumentedList
 from werkzeug.exceptions import Forbidden
 from werkzeug.utils import cached_property
 from flask_principal import Permission, RoleNeed
 
-from flask_potion.manager import RelationalManager
+from flask_potion.manager import Manager, RelationalManager
 from flask_potion.fields import ToOne
 from flask_potion.instances import Pagination
 from .permission import HybridPermission
@@ -189,8 +190,30 @@ class PrincipalMixin(object):
 
         return query
 
-    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None):
-        query = getattr(item, attribute)
+    def _query_filter_write_permission(self, permission):
+        query = self._query()
+
+        if query is None:
+            return None
+
+        # items the user may read but not change are excluded from bulk changes:
+        query = self._query_filter_permission(query, permission)
+
+        if query is None and all(need.method == 'role' for need in permission.needs):
+            raise Forbidden()
+        return query
+
+    def _query_for_update(self):
+        return self._query_filter_write_permission(self._permissions['update'])
+
+    def _query_for_delete(self):
+        return self._query_filter_write_permission(self._permissions['delete'])
+
+    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None, where=None, sort=None):
+        query = self._query_relation(item, attribute, target_resource, where, sort)
+
+        if query is None:
+            query = getattr(item, attribute)
 
         if isinstance(query, InstrumentedList):
             if page and per_page:
@@ -211,16 +234,35 @@ class PrincipalMixin(object):
             raise Forbidden()
         return super(PrincipalMixin, self).create(properties, commit)
 
+    def create_many(self, properties_list, commit=True):
+        # backend managers insert the items in a batch without calling create(), so permissions are checked here;
+        # items written by a write-behind buffer have been checked when they were buffered.
+        if not getattr(g, 'potion_write_behind', False) \
+                and not all(self.can_create_item(properties) for properties in properties_list):
+            raise Forbidden()
+        return super(PrincipalMixin, self).create_many(properties_list, commit)
+
     def update(self, item, changes, *args, **kwargs):
         if not self.can_update_item(item, changes):
             raise Forbidden()
         return super(PrincipalMixin, self).update(item, changes, *args, **kwargs)
 
+    def update_by_id(self, id, changes, commit=True, version=None):
+        # the item is read first so that the permission can be checked against it
+        return Manager.update_by_id(self, id, changes, commit, version)
+
+    def upsert_many(self, properties_list, commit=True):
+        # items are looked up and then created or updated one by one, so that permissions are checked for each
+        return Manager.upsert_many(self, properties_list, commit)
+
     def delete(self, item):
         if not self.can_delete_item(item):
             raise Forbidden()
         return super(PrincipalMixin, self).delete(item)
 
+    def delete_by_id(self, id, version=None):
+        return Manager.delete_by_id(self, id, version)
+
 
 def principals(manager):
     if not issubclass(manager, RelationalManager):
@@ -1,5 +1,6 @@
 from flask import jsonify, current_app
-from werkzeug.exceptions import Conflict, BadRequest, NotFound, InternalServerError, UnsupportedMediaType
+from werkzeug.exceptions import Conflict, BadRequest, NotFound, InternalServerError, UnsupportedMediaType, \
+    PreconditionFailed as HTTPPreconditionFailed, NotImplemented as HTTPNotImplemented, ServiceUnavailable
 from werkzeug.http import HTTP_STATUS_CODES
 
 
@@ -111,9 +112,34 @@ class BackendConflict(PotionException):
         return dct
 
 
+class PreconditionFailed(PotionException):
+    werkzeug_exception = HTTPPreconditionFailed
+
+
 class PageNotFound(PotionException):
     werkzeug_exception = NotFound
 
 
+class OperationNotSupported(PotionException):
+    werkzeug_exception = HTTPNotImplemented
+
+
+class InvalidBatchRequest(PotionException):
+    werkzeug_exception = BadRequest
+
+    def __init__(self, message):
+        super(InvalidBatchRequest, self).__init__()
+        self.message = message
+
+    def as_dict(self):
+        dct = super(InvalidBatchRequest, self).as_dict()
+        dct['message'] = self.message
+        return dct
+
+
+class BufferFull(PotionException):
+    werkzeug_exception = ServiceUnavailable
+
+
 class InvalidJSON(PotionException):
     werkzeug_exception = BadRequest
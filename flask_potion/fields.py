@@ -7,9 +7,10 @@ from flask import current_app, request
 import six
 from werkzeug.utils import cached_property
 
-from flask_potion.utils import get_value, route_from
+from flask_potion.utils import get_value, id_from_uri
 from flask_potion.reference import ResourceReference, ResourceBound, _bind_schema
 from flask_potion.schema import Schema
+from flask_potion.exceptions import ValidationError
 
 class Raw(Schema):
     """
@@ -681,23 +682,197 @@ class ToOne(Raw, ResourceBound):
     def formatter(self, item):
         return self.formatter_key.format(item)
 
-    def converter(self, value):
+    @cached_property
+    def _foreign_key_getters(self):
+        return {}
+
+    def _foreign_key_getter(self, attribute):
+        try:
+            return self._foreign_key_getters[attribute]
+        except KeyError:
+            pass
+
+        getter = None
+        manager = getattr(self.resource, 'manager', None)
+
+        if manager is not None and hasattr(self.formatter_key, 'format_id'):
+            getter = manager._foreign_key_getter(attribute, self.target)
+
+        self._foreign_key_getters[attribute] = getter
+        return getter
+
+    def output(self, key, obj):
+        key = key if self.attribute is None else self.attribute
+        foreign_key = self._foreign_key_getter(key)
+
+        # format the reference from the id in the foreign-key column, without loading the referenced item:
+        if foreign_key is not None and isinstance(obj, self.resource.manager.model):
+            id = foreign_key(obj)
+            if id is not None:
+                return self.formatter_key.format_id(id)
+
+        return super(ToOne, self).output(key, obj)
+
+    def _converter_key(self, value):
         for python_type, json_type in (
                 (dict, 'object'),
                 (int, 'integer'),
                 ((list, tuple), 'array'),
                 (six.string_types, 'string')):
             if isinstance(value, python_type):
-                return self.target.meta.key_converters_by_type[json_type].convert(value)
+                return self.target.meta.key_converters_by_type[json_type]
+
+    def converter(self, value):
+        key = self._converter_key(value)
+        if key is not None:
+            return key.convert(value)
+
+    def convert_id(self, value):
+        """
+        Returns the id of the item referenced by ``value``, or ``None`` if the item has to be read to determine it.
+        """
+        key = self._converter_key(value)
+        if key is None:
+            return None
+
+        try:
+            return key.convert_id(value)
+        except NotImplementedError:
+            return None
 
 
 class ToMany(Array):
     """
     Like :class:`ToOne`, but for arrays of references.
+
+    In partial updates, a :class:`ToMany` field also accepts an object with ``"$add"`` and ``"$remove"`` arrays of
+    references, which is converted to :class:`ToManyChanges`.
     """
     def __init__(self, resource, **kwargs):
         super(ToMany, self).__init__(ToOne(resource, nullable=False), **kwargs)
 
+    @property
+    def changes_request(self):
+        references = {"type": "array", "items": self.container.request}
+        return {
+            "type": "object",
+            "properties": {
+                "$add": references,
+                "$remove": references
+            },
+            "additionalProperties": False
+        }
+
+
+class ToManyChanges(object):
+    """
+    Items to add to and remove from a :class:`ToMany` field, without replacing the whole collection.
+
+    :param target: the target resource
+    :param list add: ids of items to add
+    :param list remove: ids of items to remove
+    """
+
+    def __init__(self, target, add=(), remove=()):
+        self.target = target
+        self.add = list(add)
+        self.remove = list(remove)
+
+    def __eq__(self, other):
+        return isinstance(other, ToManyChanges) \
+            and (self.target, self.add, self.remove) == (other.target, other.add, other.remove)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<ToManyChanges add={!r} remove={!r}>'.format(self.add, self.remove)
+
+
+class InPlaceChange(object):
+    """
+    A change that is applied to the current value of an attribute, without replacing the whole value: ``"$inc"`` adds
+    a number to a number and ``"$push"`` appends an element to an array. Managers apply it in the update statement
+    where the backend supports it.
+
+    :param str operator: ``"$inc"`` or ``"$push"``
+    :param value: the number to add or the element to append
+    """
+
+    def __init__(self, operator, value):
+        self.operator = operator
+        self.value = value
+
+    def apply(self, current):
+        """
+        :param current: the current value of the attribute
+        :return: the new value of the attribute
+        """
+        if self.operator == '$inc':
+            return (current or 0) + self.value
+        return list(current or ()) + [self.value]
+
+    def __eq__(self, other):
+        return isinstance(other, InPlaceChange) and (self.operator, self.value) == (other.operator, other.value)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<InPlaceChange {}={!r}>'.format(self.operator, self.value)
+
+
+class AttributeChange(Schema, ResourceBound):
+    """
+    Converts either a new value for a field or, for :class:`Number`, :class:`Integer` and :class:`Array` fields, an
+    in-place change in the form ``{"$inc": number}`` or ``{"$push": element}``, which is converted to
+    :class:`InPlaceChange`. The bounds of the field are not checked against the result of an in-place change.
+
+    Formats values using the field.
+
+    :param Raw field: the field of the attribute
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def bind(self, resource):
+        self.field = _bind_schema(self.field, resource)
+        return self
+
+    @cached_property
+    def _operators(self):
+        field = self.field
+        if isinstance(field, Array):
+            return {"$push": field.container}
+        if isinstance(field, Integer):
+            return {"$inc": Integer()}
+        if isinstance(field, Number):
+            return {"$inc": Number()}
+        return {}
+
+    def schema(self):
+        request_schema = self.field.request
+
+        if self._operators:
+            request_schema = {"anyOf": [request_schema] + [{
+                "type": "object",
+                "properties": {operator: field.request},
+                "required": [operator],
+                "additionalProperties": False
+            } for operator, field in self._operators.items()]}
+        return self.field.response, request_schema
+
+    def format(self, value):
+        return self.field.format(value)
+
+    def convert(self, instance, update=False):
+        if isinstance(instance, dict) and len(instance) == 1:
+            for operator, field in self._operators.items():
+                if operator in instance:
+                    return InPlaceChange(operator, field.convert(instance[operator]))
+        return self.field.convert(instance, update)
+
 
 class Inline(Raw, ResourceBound):
     """
@@ -750,6 +925,49 @@ class Inline(Raw, ResourceBound):
         return self.target.schema.convert(item, update=update, patchable=self.patchable)
 
 
+class BulkInline(Inline):
+    """
+    Like :class:`Inline`, but also converts and formats arrays of items, e.g. for creating several items with one
+    request. Each element of an array is validated on its own; validation errors are reported with the index of the
+    element in their path.
+
+    :param resource: a resource reference as in :class:`ToOne`
+    :param bool patchable: whether to allow partial objects
+    """
+
+    def schema(self):
+        response_schema, request_schema = super(BulkInline, self).schema()
+        return {"anyOf": [response_schema, {"type": "array", "items": response_schema}]}, \
+               {"anyOf": [request_schema, {"type": "array", "items": request_schema}]}
+
+    def format(self, item):
+        if isinstance(item, list):
+            return [super(BulkInline, self).format(i) for i in item]
+        return super(BulkInline, self).format(item)
+
+    def parse_request(self, request):
+        # items are written in full, so a PUT is validated against the schema for creating items
+        return self.convert(request.json, update=request.method == 'PATCH')
+
+    def convert(self, item, update=False):
+        if not isinstance(item, list):
+            return super(BulkInline, self).convert(item, update)
+
+        items = []
+        errors = []
+        for index, value in enumerate(item):
+            try:
+                items.append(super(BulkInline, self).convert(value, update))
+            except ValidationError as e:
+                for error in e.errors:
+                    error.path.appendleft(index)
+                    errors.append(error)
+
+        if errors:
+            raise ValidationError(errors)
+        return items
+
+
 class ItemType(Raw):
     """
     A string field that formats the name of a resource; read-only.
@@ -784,8 +1002,4 @@ class ItemUri(Raw):
         return '{}/{}'.format(self.target.route_prefix, value)
 
     def converter(self, value):
-        try:
-            endpoint, args = route_from(value, 'GET')
-        except Exception as e:
-            raise e
-        return self.target.manager.id_field.convert(args['id'])
+        return self.target.manager.id_field.convert(id_from_uri(value, self.target))
@@ -4,10 +4,26 @@ from math import ceil
 from flask import json, request, current_app
 from werkzeug.utils import cached_property
 from .filters import convert_filters
-from .exceptions import InvalidJSON
-from .fields import ToMany
-from .reference import ResourceBound
-from .schema import Schema
+from .exceptions import InvalidJSON, RequestMustBeJSON
+from .fields import Array, Inline, ToOne, ToMany
+from .reference import ResourceBound, ResourceReference
+from .schema import Schema, SchemaImpl, FieldSet
+from .utils import get_value
+
+
+class _PrefetchedReferences(object):
+    """
+    Outputs the references of a :class:`fields.ToMany` field from ids read for a whole page of items at once.
+    """
+    io = "r"
+
+    def __init__(self, key, ids, id_attribute):
+        self.key = key
+        self.ids = ids
+        self.id_attribute = id_attribute
+
+    def output(self, name, item):
+        return [self.key.format_id(id) for id in self.ids.get(get_value(self.id_attribute, item, None), ())]
 
 
 class PaginationMixin(object):
@@ -55,15 +71,29 @@ class Instances(PaginationMixin, Schema, ResourceBound):
     This is what implements all of the pagination, filter, and sorting logic.
 
     Works like a field, but reads 'where' and 'sort' query string parameters as well as link headers.
+
+    The 'embed' query string parameter is a comma-separated list of :class:`fields.ToOne` and :class:`fields.ToMany`
+    fields that are loaded together with the items and formatted inline using the schema of the target resource.
+
+    :param resource: the resource whose items are listed, if not the resource the schema is bound to
     """
-    query_params = ('where', 'sort')
+    query_params = ('where', 'sort', 'embed')
+
+    def __init__(self, resource=None):
+        self.reference = ResourceReference(resource) if resource is not None else None
 
     def rebind(self, resource):
-        return self.__class__().bind(resource)
+        return self.__class__(self.reference.value if self.reference else None).bind(resource)
+
+    @cached_property
+    def target(self):
+        if self.reference is None:
+            return self.resource
+        return self.reference.resolve(self.resource)
 
     @cached_property
     def _pagination_types(self):
-        return self.resource.manager.PAGINATION_TYPES
+        return self.target.manager.PAGINATION_TYPES
 
     def _field_filters_schema(self, filters):
         if len(filters) == 1:
@@ -73,13 +103,54 @@ class Instances(PaginationMixin, Schema, ResourceBound):
 
     @cached_property
     def _filters(self):
-        return self.resource.manager.filters
+        return self.target.manager.filters
 
     @cached_property
     def _sort_fields(self):
         return {
-            name: field for name, field in self.resource.schema.fields.items()
-            if name in self._filters and self.resource.manager._is_sortable_field(field)
+            name: field for name, field in self.target.schema.fields.items()
+            if name in self._filters and self.target.manager._is_sortable_field(field)
+        }
+
+    @cached_property
+    def _embed_fields(self):
+        return {
+            name: field for name, field in self.target.schema.fields.items()
+            if 'r' in field.io and isinstance(field, (ToOne, ToMany))
+        }
+
+    @cached_property
+    def _embedded_schemas(self):
+        return {}
+
+    def _embedded_schema(self, embed):
+        try:
+            return self._embedded_schemas[embed]
+        except KeyError:
+            pass
+
+        fields = dict(self.target.schema.fields)
+        for name in embed:
+            field = fields[name]
+            if isinstance(field, ToMany):
+                fields[name] = Array(Inline(field.container.target), attribute=field.attribute, io="r")
+            else:
+                fields[name] = Inline(field.target, attribute=field.attribute, nullable=field.nullable, io="r")
+
+        schema = self._embedded_schemas[embed] = FieldSet(fields).bind(self.target)
+        return schema
+
+    @cached_property
+    def _embed_schema(self):
+        if not self._embed_fields:
+            return {"type": "array", "maxItems": 0}
+        return {
+            "type": "array",
+            "items": {
+                "type": "string",
+                "enum": sorted(self._embed_fields)
+            },
+            "uniqueItems": True
         }
 
     @cached_property
@@ -128,6 +199,9 @@ class Instances(PaginationMixin, Schema, ResourceBound):
             "additionalProperties": True
         }
 
+        if 'embed' in self.query_params:
+            request_schema["properties"]["embed"] = self._embed_schema
+
         response_schema = {
             "type": "array",
             "items": {"$ref": "#"}
@@ -144,6 +218,10 @@ class Instances(PaginationMixin, Schema, ResourceBound):
             field = self._sort_fields[name]
             yield field, field.attribute or name, reverse
 
+    @staticmethod
+    def _parse_embed(value):
+        return [name.strip() for name in value.split(',') if name.strip()] if value else []
+
     def parse_request(self, request):
 
         # TODO convert instances to FieldSet
@@ -156,19 +234,301 @@ class Instances(PaginationMixin, Schema, ResourceBound):
         except ValueError:
             raise InvalidJSON()
 
-        result = self.convert({
+        embed = self._parse_embed(request.args.get('embed')) if 'embed' in self.query_params else None
+
+        instance = {
             "page": page,
             "per_page": per_page,
             "where": where,
             "sort": sort
-        })
+        }
+
+        # only passed on when requested, so that routes with Instances schemas need not accept 'embed':
+        if embed:
+            instance['embed'] = embed
+
+        result = self.convert(instance)
 
         result['where'] = tuple(self._convert_filters(result['where']))
         result['sort'] = tuple(self._convert_sort(result['sort']))
+
+        if embed:
+            result['embed'] = tuple(result['embed'])
         return result
 
     def format(self, items):
-        return [self.resource.schema.format(item) for item in items]
+        embed = tuple(name for name in self._parse_embed(request.args.get('embed')) if name in self._embed_fields)
+
+        if embed:
+            schema = self._embedded_schema(embed)
+        else:
+            schema = self.target.schema
+
+        items = list(items)
+        schema = self._with_prefetched_references(schema, items)
+        return [schema.format(item) for item in items]
+
+    def _with_prefetched_references(self, schema, items):
+        if not items:
+            return schema
+
+        manager = self.target.manager
+        fields = None
+
+        for name, field in schema.fields.items():
+            if 'r' not in field.io \
+                    or not isinstance(field, ToMany) \
+                    or not isinstance(field.container, ToOne) \
+                    or not hasattr(field.container.formatter_key, 'format_id'):
+                continue
+
+            ids = manager._reference_ids(items, field.attribute or name, field.container.target)
+
+            if ids is not None:
+                fields = fields or dict(schema.fields)
+                fields[name] = _PrefetchedReferences(field.container.formatter_key, ids, manager.id_attribute)
+
+        if fields is None:
+            return schema
+        return FieldSet(fields)
+
+
+class RelationTargets(ToMany):
+    """
+    Reads a reference, or an array of references, to items of the target resource of a :class:`routes.Relation`.
+
+    A single reference is converted to the referenced item. An array of references is converted to a list of item
+    ids; the items are only read if they are referenced by a natural key.
+    """
+
+    def __init__(self, resource, **kwargs):
+        super(RelationTargets, self).__init__(resource, **kwargs)
+        container = self.container
+        self._schema = lambda: ({"anyOf": [container.response, {"type": "array", "items": container.response}]},
+                                {"anyOf": [container.request, {"type": "array", "items": container.request}]})
+
+    def _is_many(self, value):
+        if not isinstance(value, list):
+            return False
+        # an array may also be a natural key of the target resource:
+        return 'array' not in self.container.target.meta.key_converters_by_type \
+            or all(isinstance(v, dict) for v in value)
+
+    def formatter(self, value):
+        if not isinstance(value, list):
+            return self.container.format(value)
+
+        key = self.container.formatter_key
+        if hasattr(key, 'format_id'):
+            return [key.format_id(id) for id in value]
+        return [self.container.format(item) for item in self.container.target.manager.read_many(value)]
+
+    def converter(self, value):
+        if not self._is_many(value):
+            return self.container.converter(value)
+
+        return FieldSet._reference_ids(self.container, value)
+
+
+class RelationFilters(Instances):
+    """
+    Reads the 'page', 'per_page', 'where' and 'sort' query string parameters of a :class:`routes.Relation` listing.
+    Filters and sort fields are those of the target resource of the relation.
+    """
+    query_params = ('where', 'sort')
+
+
+class BulkChanges(Instances):
+    """
+    Reads changes to apply to every item matching a condition: the changes from the request body, validated in the
+    same way as a partial update of a single item, and the condition from the ``where`` query string parameter, in the
+    same format as for :class:`Instances`. The condition must not be empty.
+
+    Formats the number of items changed.
+    """
+    query_params = ('where',)
+
+    @cached_property
+    def _where(self):
+        return SchemaImpl(dict(self._filter_schema, minProperties=1))
+
+    def schema(self):
+        response_schema = {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer"}
+            }
+        }
+        return response_schema, self.target.schema.patchable.update
+
+    def parse_request(self, request):
+        if request.mimetype != 'application/json':
+            raise RequestMustBeJSON()
+
+        try:
+            where = json.loads(request.args.get('where', '{}'))
+        except ValueError:
+            raise InvalidJSON()
+
+        where = self._where.convert(where)
+        changes = self.target.schema.convert(request.json, update=True, patchable=True)
+
+        return {
+            "changes": changes,
+            "where": tuple(self._convert_filters(where))
+        }
+
+    def format(self, count):
+        return {"count": count}
+
+
+class BulkDeletion(Instances):
+    """
+    Reads the condition matching the items to delete from the ``where`` query string parameter, in the same format as
+    for :class:`Instances`, and ``limit``, the maximum number of items to delete at once. The condition must not be
+    empty.
+
+    Formats the number of items deleted.
+    """
+    query_params = ('where', 'limit')
+
+    def schema(self):
+        request_schema = {
+            "type": "object",
+            "properties": {
+                "where": dict(self._filter_schema, minProperties=1),
+                "limit": {
+                    "type": "integer",
+                    "minimum": 1
+                }
+            },
+            "required": ["where"],
+            "additionalProperties": True
+        }
+
+        response_schema = {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer"}
+            }
+        }
+
+        return response_schema, request_schema
+
+    def parse_request(self, request):
+        try:
+            limit = request.args.get('limit', None, type=int)
+            where = json.loads(request.args.get('where', '{}'))
+        except ValueError:
+            raise InvalidJSON()
+
+        instance = {"where": where}
+        if limit is not None:
+            instance["limit"] = limit
+
+        result = self.convert(instance)
+        result['where'] = tuple(self._convert_filters(result['where']))
+        return result
+
+    def format(self, count):
+        return {"count": count}
+
+
+class Facets(Instances):
+    """
+    Counts the distinct values of filterable fields among the items matching a ``where`` condition.
+
+    Reads the ``where`` query string parameter in the same way as :class:`Instances` as well as ``fields``, a
+    JSON array of names of the fields to count, and ``limit``, the maximum number of values returned for each field.
+    """
+    query_params = ('where', 'fields', 'limit')
+    default_limit = 10
+
+    @cached_property
+    def _facet_fields(self):
+        return {
+            name: field for name, field in self.target.schema.fields.items()
+            if name in self._filters and self.target.manager._is_facetable_field(field)
+        }
+
+    @cached_property
+    def _fields_schema(self):
+        if not self._facet_fields:
+            return {"type": "array", "maxItems": 0}
+        return {
+            "type": "array",
+            "items": {
+                "type": "string",
+                "enum": sorted(self._facet_fields)
+            },
+            "uniqueItems": True
+        }
+
+    def schema(self):
+        request_schema = {
+            "type": "object",
+            "properties": {
+                "where": self._filter_schema,
+                "fields": self._fields_schema,
+                "limit": {
+                    "type": "integer",
+                    "minimum": 1,
+                    "maximum": current_app.config['POTION_MAX_PER_PAGE'],
+                    "default": self.default_limit
+                }
+            },
+            "additionalProperties": True
+        }
+
+        response_schema = {
+            "type": "object",
+            "additionalProperties": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "value": {},
+                        "count": {"type": "integer"}
+                    }
+                }
+            }
+        }
+
+        return response_schema, request_schema
+
+    def parse_request(self, request):
+        try:
+            limit = request.args.get('limit', self.default_limit, type=int)
+            where = json.loads(request.args.get('where', '{}'))
+            fields = json.loads(request.args.get('fields', 'null'))
+        except ValueError:
+            raise InvalidJSON()
+
+        if fields is None:
+            fields = sorted(self._facet_fields)
+
+        result = self.convert({
+            "where": where,
+            "fields": fields,
+            "limit": limit
+        })
+
+        result['where'] = tuple(self._convert_filters(result['where']))
+        result['fields'] = collections.OrderedDict((name, self._facet_fields[name]) for name in result['fields'])
+        return result
+
+    def _format_value(self, field, value):
+        if value is None:
+            return None
+        if isinstance(field, ToOne):
+            return {"$ref": '{}/{}'.format(field.target.route_prefix, value)}
+        return field.format(value)
+
+    def format(self, facets):
+        return collections.OrderedDict(
+            (name, [{"value": self._format_value(self._facet_fields[name], value), "count": count}
+                    for value, count in values])
+            for name, values in facets.items())
 
 
 class Pagination(object):
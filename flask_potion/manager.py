@@ -1,10 +1,18 @@
+import collections
+from contextlib import contextmanager
+import copy
 import datetime
 import six
 from werkzeug.utils import cached_property
-from .fields import String, Boolean, Number, Integer, Date, DateTime, DateString, DateTimeString, Array, Object, Uri, ItemUri, ItemType
+from .fields import String, Boolean, Number, Integer, Date, DateTime, DateString, DateTimeString, Array, Object, Uri, ItemUri, ItemType, ToOne, \
+    InPlaceChange
 from .instances import Pagination
-from .exceptions import ItemNotFound
-from .filters import FILTER_NAMES, FILTERS_BY_TYPE, filters_for_fields
+from .exceptions import ItemNotFound, PreconditionFailed, OperationNotSupported
+from .filters import FILTER_NAMES, FILTERS_BY_TYPE, Condition, filters_for_fields
+from .signals import before_bulk_add_to_relation, after_bulk_add_to_relation, before_bulk_remove_from_relation, \
+    after_bulk_remove_from_relation, before_bulk_update, after_bulk_update, before_bulk_delete, after_bulk_delete, \
+    before_update, after_update, before_delete, after_delete
+from .utils import get_value
 import decimal
 
 class Manager(object):
@@ -17,9 +25,13 @@ class Manager(object):
     FILTERS_BY_TYPE = FILTERS_BY_TYPE
     PAGINATION_TYPES = (Pagination,)
 
+    #: the maximum number of ids written to one statement, e.g. ``IN (...)``
+    IDS_PER_STATEMENT = 500
+
     def __init__(self, resource, model):
         self.resource = resource
         self.filters = {}
+        self.version_attribute = resource.meta.get('version_attribute')
 
         # attach manager to the resource (key converters require backref)
         resource.manager = self
@@ -64,6 +76,55 @@ class Manager(object):
     def _is_sortable_field(self, field):
         return isinstance(field, (String, Boolean, Number, Integer, Date, DateTime, DateString, DateTimeString, Uri, ItemUri))
 
+    def _is_facetable_field(self, field):
+        return isinstance(field, ToOne) or self._is_sortable_field(field)
+
+    def _foreign_key_getter(self, attribute, target_resource):
+        """
+        Returns a function that reads the id of the item referenced by the ``attribute`` relationship of an item
+        without loading the referenced item, or ``None`` if the backend cannot do so.
+
+        :param str attribute: name of the relationship attribute
+        :param target_resource: the referenced resource
+        """
+        return None
+
+    def _reference_ids(self, items, attribute, target_resource):
+        """
+        Reads the ids of the items referenced by the to-many relationship ``attribute`` of several items at once,
+        without loading the referenced items.
+
+        :param list items: a list of items
+        :param str attribute: name of the relationship attribute
+        :param target_resource: the referenced resource
+        :return: a dictionary of {item id: [referenced ids]} pairs, or ``None`` if the backend cannot do so
+        """
+        return None
+
+    def _attributes_for_fields(self, names):
+        fields = self.resource.schema.fields
+        return tuple(fields[name].attribute or name if name in fields else name for name in names)
+
+    @cached_property
+    def eager_load(self):
+        """
+        Attributes of the relations listed in ``Meta.eager_load``, which are loaded together with the items.
+        """
+        return self._attributes_for_fields(self.resource.meta.eager_load or ())
+
+    @cached_property
+    def _natural_key(self):
+        """
+        A tuple of ``(name, attribute)`` pairs for the fields of ``Meta.natural_key``, or ``None``.
+        """
+        natural_key = self.resource.meta.natural_key
+
+        if not natural_key:
+            return None
+
+        names = (natural_key,) if isinstance(natural_key, six.string_types) else tuple(natural_key)
+        return tuple(zip(names, self._attributes_for_fields(names)))
+
     def _init_key_converters(self, resource, meta):
         if 'natural_key' in meta:
             from flask_potion.natural_keys import PropertyKey, PropertiesKey
@@ -108,7 +169,7 @@ class Manager(object):
     def get_field_comparators(self, field):
         pass
 
-    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None):
+    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None, where=None, sort=None):
         """
 
         :param item:
@@ -116,6 +177,8 @@ class Manager(object):
         :param target_resource:
         :param page:
         :param per_page:
+        :param where: conditions using the filters of the target resource
+        :param sort: sort fields of the target resource
         :return:
         """
         raise NotImplementedError()
@@ -142,13 +205,61 @@ class Manager(object):
         """
         raise NotImplementedError()
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
+    def relation_add_many(self, item, attribute, target_resource, target_ids):
+        """
+        Adds several items to a relation at once. The default implementation reads the target items and adds them one
+        by one using :meth:`relation_add`; backend managers should override it to write to the database directly.
+
+        :param item:
+        :param attribute:
+        :param target_resource:
+        :param list target_ids: ids of the items to add
+        :raises exceptions.ItemNotFound: if any of the target items does not exist
+        """
+        target_items = target_resource.manager.read_many(target_ids)
+
+        before_bulk_add_to_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+        for target_item in target_items:
+            self.relation_add(item, attribute, target_resource, target_item)
+        after_bulk_add_to_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+    def relation_remove_many(self, item, attribute, target_resource, target_ids):
+        """
+        Removes several items from a relation at once. The default implementation reads the target items and removes
+        them one by one using :meth:`relation_remove`; backend managers should override it to write to the database
+        directly.
+
+        :param item:
+        :param attribute:
+        :param target_resource:
+        :param list target_ids: ids of the items to remove
+        :raises exceptions.ItemNotFound: if any of the target items does not exist
+        """
+        target_items = target_resource.manager.read_many(target_ids)
+
+        before_bulk_remove_from_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+        for target_item in target_items:
+            self.relation_remove(item, attribute, target_resource, target_item)
+        after_bulk_remove_from_relation.send(self.resource, item=item, attribute=attribute, child_ids=target_ids)
+
+    def _update_to_many(self, item, attribute, changes):
+        """
+        Applies a :class:`fields.ToManyChanges` object from a partial update using :meth:`relation_remove_many`
+        and :meth:`relation_add_many`.
+        """
+        if changes.remove:
+            self.relation_remove_many(item, attribute, changes.target, changes.remove)
+        if changes.add:
+            self.relation_add_many(item, attribute, changes.target, changes.add)
+
+    def paginated_instances(self, page, per_page, where=None, sort=None, embed=None):
         """
 
         :param page:
         :param per_page:
         :param where:
         :param sort:
+        :param embed: names of relation fields to load together with the items, in addition to ``Meta.eager_load``
         :return: a :class:`Pagination` object or similar
         """
         pass
@@ -175,6 +286,55 @@ class Manager(object):
         except IndexError:
             raise ItemNotFound(self.resource, where=where)
 
+    def facets(self, fields, where=None, limit=None):
+        """
+        Counts the distinct values of each field among the items matching ``where``.
+
+        This default implementation counts the values of all matching instances in Python; backend managers
+        should override it to count in the data store instead. Values of :class:`fields.ToOne` fields are counted by
+        the id of the referenced item.
+
+        :param dict fields: a dictionary of {name: field} pairs
+        :param where:
+        :param int limit: maximum number of values to return per field
+        :return: a dictionary of {name: [(value, count), ..]} pairs, with values ordered by descending count
+        """
+        counters = {name: collections.Counter() for name in fields}
+
+        for item in self.instances(where=where):
+            for name, field in fields.items():
+                value = get_value(field.attribute or name, item, None)
+
+                if isinstance(field, ToOne) and value is not None:
+                    value = get_value(field.target.manager.id_attribute, value, None)
+
+                counters[name][value] += 1
+
+        return {name: counter.most_common(limit) for name, counter in counters.items()}
+
+    def explain(self, page, per_page, where=None, sort=None):
+        """
+        Describes how the backend would run the query of :meth:`paginated_instances` with the same arguments.
+
+        :param page:
+        :param per_page:
+        :param where:
+        :param sort:
+        :return: a dictionary with the compiled ``statement``, its bound ``parameters`` and the query ``plan``
+        :raises exceptions.OperationNotSupported: if the manager cannot describe its queries
+        """
+        raise OperationNotSupported()
+
+    def can_create_item(self, properties):
+        """
+        Returns whether an item may be created by the current request. Items buffered by a
+        :class:`WriteBehindBuffer` are checked with this method before they are acknowledged, since they are created
+        later, without a request. Always ``True`` by default; managers that check permissions override it.
+
+        :param properties:
+        """
+        return True
+
     def create(self, properties, commit=True):
         """
 
@@ -184,14 +344,89 @@ class Manager(object):
         """
         pass
 
-    def read(self, id):
+    def create_many(self, properties_list, commit=True):
+        """
+        Creates several items in one transaction. The default implementation creates the items one by one using
+        :meth:`create`; backend managers should override it to insert the items in a batch.
+
+        :param list properties_list: a list of properties, one for each item
+        :param commit:
+        :return: a list of the created items
+        """
+        if not commit:
+            return [self.create(properties, commit=False) for properties in properties_list]
+
+        with self.transaction():
+            return [self.create(properties, commit=False) for properties in properties_list]
+
+    def upsert(self, properties, commit=True):
+        """
+        Creates an item, or updates the item with the same natural key if one exists.
+
+        :param properties:
+        :param commit:
+        :return: the created or updated item
+        """
+        return self.upsert_many([properties], commit)[0]
+
+    def upsert_many(self, properties_list, commit=True):
+        """
+        Creates or updates several items by their natural key, as defined in ``Meta.natural_key``. The default
+        implementation looks up each item and then creates or updates it; backend managers should override it to
+        write all items with an ``INSERT`` that updates conflicting rows.
+
+        :param list properties_list: a list of properties, one for each item
+        :param commit:
+        :return: a list of the created or updated items
+        """
+        if self._natural_key is None:
+            raise RuntimeError("'{}' has no natural key".format(self.resource.meta.name))
+
+        if not commit:
+            return [self._upsert_item(properties) for properties in properties_list]
+
+        with self.transaction():
+            return [self._upsert_item(properties) for properties in properties_list]
+
+    def _upsert_item(self, properties, commit=False):
+        where = [Condition(name, self.filters[name][None], properties.get(attribute))
+                 for name, attribute in self._natural_key]
+
+        try:
+            item = self.first(where=where)
+        except ItemNotFound:
+            return self.create(properties, commit=commit)
+        return self.update(item, properties, commit=commit)
+
+    def read(self, id, attributes=None):
         """
 
         :param id:
+        :param attributes: if given, the names of the only attributes the caller reads from the item. Managers may
+            then load only these attributes; others may be missing or loaded when they are accessed.
         :return:
         """
         pass
 
+    def read_many(self, ids):
+        """
+        Reads several items at once. The default implementation reads the items one by one; backend managers should
+        override it to read all of them with a single query.
+
+        :param list ids: a list of item ids
+        :return: a list of items in the same order as ``ids``
+        :raises exceptions.ItemNotFound: if any of the items does not exist
+        """
+        return [self.read(id) for id in ids]
+
+    def _items_in_order(self, ids, items):
+        items_by_id = {get_value(self.id_attribute, item, None): item for item in items}
+
+        for id in ids:
+            if id not in items_by_id:
+                raise ItemNotFound(self.resource, id=id)
+        return [items_by_id[id] for id in ids]
+
     def update(self, item, changes, commit=True):
         """
 
@@ -202,6 +437,100 @@ class Manager(object):
         """
         pass
 
+    def update_by_id(self, id, changes, commit=True, version=None):
+        """
+        Applies changes to the item with the given id and returns the updated item.
+
+        The default implementation reads the item and then updates it using :meth:`update`; backend managers
+        may override it to write the changes without reading the item first.
+
+        :param id:
+        :param dict changes: converted changes, as for :meth:`update`; values may also be
+            :class:`fields.InPlaceChange` objects
+        :param commit:
+        :param version: if given, the item is only updated if this is its current version
+        :raises exceptions.ItemNotFound:
+        :raises exceptions.PreconditionFailed: if the item has a different version
+        :return: the updated item
+        """
+        item = self.read(id)
+        self._check_version(item, version)
+        return self.update(item, self._apply_in_place_changes(item, changes), commit)
+
+    def _apply_in_place_changes(self, item, changes):
+        """
+        Returns the changes with the new value of any :class:`fields.InPlaceChange`, for writing the whole value.
+        """
+        return {key: value.apply(get_value(key, item, None)) if isinstance(value, InPlaceChange) else value
+                for key, value in changes.items()}
+
+    def _check_version(self, item, version):
+        if version is not None and get_value(self.version_attribute, item, None) != version:
+            raise PreconditionFailed()
+
+    def _versioned_properties(self, properties):
+        """
+        Returns the properties for creating an item, including the initial version if the resource has a
+        ``Meta.version_attribute`` and the properties do not contain one.
+        """
+        if self.version_attribute is None or properties.get(self.version_attribute) is not None:
+            return properties
+        return dict(properties, **{self.version_attribute: 1})
+
+    def _versioned_changes(self, item, changes):
+        """
+        Returns the changes for updating an item, including a new version if the resource has a
+        ``Meta.version_attribute``.
+        """
+        if self.version_attribute is None:
+            return changes
+        return dict(changes, **{self.version_attribute: (get_value(self.version_attribute, item, None) or 0) + 1})
+
+    def _not_written(self, id, version=None):
+        """
+        Returns the exception to raise when writing to an item by id and version has changed nothing.
+        """
+        if version is not None:
+            try:
+                self.read(id)
+            except ItemNotFound:
+                pass
+            else:
+                return PreconditionFailed()
+        return ItemNotFound(self.resource, id=id)
+
+    def update_where(self, where, changes, commit=True):
+        """
+        Applies the same changes to every item matching ``where`` and returns the number of items changed.
+
+        The default implementation updates the matching items one by one using :meth:`update`; backend managers
+        should override it to write all of them with a single statement.
+
+        :param where: a tuple of conditions, as in :meth:`instances`
+        :param dict changes: converted changes, as for :meth:`update`
+        :param commit:
+        :return: the number of items changed
+        """
+        return self._update_items(list(self.instances(where=where)), where, changes, commit)
+
+    def _update_items(self, items, where, changes, commit=True):
+        before_bulk_update.send(self.resource, where=where, changes=changes)
+
+        if commit:
+            with self.transaction():
+                for item in items:
+                    self.update(item, changes, commit=False)
+        else:
+            for item in items:
+                self.update(item, changes, commit=False)
+
+        after_bulk_update.send(self.resource, where=where, changes=changes, count=len(items))
+        return len(items)
+
+    def _has_item_receivers(self, *signals):
+        # per-item signals cannot be sent when items are changed without being read
+        return any(signal.has_receivers_for(self.resource) for signal in signals)
+
     def delete(self, item):
         """
 
@@ -210,20 +539,93 @@ class Manager(object):
         """
         pass
 
-    def delete_by_id(self, id):
+    def delete_where(self, where, limit=None, commit=True):
+        """
+        Deletes the items matching ``where`` and returns the number of items deleted.
+
+        The default implementation deletes the matching items one by one using :meth:`delete`; backend managers
+        should override it to delete all of them with a single statement. The ids of the items only need to be read
+        first when there is a ``limit`` or when receivers of the delete or bulk delete signals are connected.
+
+        :param where: a tuple of conditions, as in :meth:`instances`
+        :param int limit: the maximum number of items to delete
+        :param commit:
+        :return: the number of items deleted
+        """
+        items = list(self.instances(where=where))
+        if limit is not None:
+            items = items[:limit]
+        return self._delete_items(items, [get_value(self.id_attribute, item, None) for item in items])
+
+    def _delete_items(self, items, ids):
+        before_bulk_delete.send(self.resource, ids=ids)
+        for item in items:
+            self.delete(item)
+        after_bulk_delete.send(self.resource, ids=ids)
+        return len(ids)
+
+    def delete_by_id(self, id, version=None):
         """
 
         :param id:
+        :param version: if given, the item is only deleted if this is its current version
+        :raises exceptions.ItemNotFound:
+        :raises exceptions.PreconditionFailed: if the item has a different version
         :return:
         """
-        return self.delete(self.read(id))
+        item = self.read(id)
+        self._check_version(item, version)
+        return self.delete(item)
+
+    def snapshot(self, value):
+        """
+        Returns a copy of an item, or of any other value of a signal argument, that does not share state with the
+        request, so that it can be passed to signal receivers on another thread.
+
+        The default implementation returns a deep copy; backend managers override it to copy the loaded attributes of
+        their model instances into a new, detached instance.
+
+        :param value: an item or other value
+        :return: a copy of the value
+        """
+        return copy.deepcopy(value)
+
+    def begin(self):
+        """
+        Starts a transaction. Until the transaction is committed or rolled back, changes written with ``commit=True``
+        are not committed. Transactions can be nested; only committing the outermost transaction commits the changes.
+
+        Noop by default, for backends without transactions.
+        """
+        pass
 
     def commit(self):
+        """
+        Commits the innermost transaction started with :meth:`begin`, or any pending changes if no transaction has
+        been started.
+        """
         pass
 
-    def begin(self):
+    def rollback(self):
+        """
+        Rolls back all changes since the outermost transaction was started with :meth:`begin` and ends the transaction.
+        """
         pass
 
+    @contextmanager
+    def transaction(self):
+        """
+        A context manager that runs a block in a transaction using :meth:`begin`, then :meth:`commit` if the block
+        succeeds or :meth:`rollback` if it raises an exception.
+        """
+        self.begin()
+        try:
+            yield
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
+
 
 class RelationalManager(Manager):
     """
@@ -236,9 +638,76 @@ class RelationalManager(Manager):
     def _query(self):
         raise NotImplementedError()
 
+    def _query_for_update(self):
+        """
+        Returns a query for the items that may be updated; the same as :meth:`_query` by default.
+        """
+        return self._query()
+
+    def _bulk_update_values(self, changes):
+        """
+        Translates changes into values that can be written to all items of a query at once.
+
+        :param dict changes:
+        :return: the values for :meth:`_query_update`, or ``None`` if the items need to be updated one by one
+        """
+        return None
+
+    def _query_update(self, query, values, commit=True):
+        """
+        Writes values to all items of a query with a single statement.
+
+        :return: the number of items changed
+        """
+        raise NotImplementedError()
+
+    def _query_for_delete(self):
+        """
+        Returns a query for the items that may be deleted; the same as :meth:`_query` by default.
+        """
+        return self._query()
+
+    def _query_get_ids(self, query, limit=None):
+        """
+        :return: a list of the ids of the items of a query, at most ``limit`` of them
+        """
+        raise NotImplementedError()
+
+    def _delete_ids(self, ids, commit=True):
+        """
+        Deletes items by id with a single statement for every :attr:`IDS_PER_STATEMENT` ids.
+
+        :return: ``False`` if the items need to be deleted one by one
+        """
+        return False
+
+    def _query_update_by_id(self, query, id, values, commit=True):
+        """
+        Writes values to the item with the given id, if it is part of the query, and returns the updated item.
+
+        The default implementation writes the values using :meth:`_query_update` and then reads the item; backend
+        managers may override it to return the item from the same statement.
+
+        :return: the updated item, or ``None`` if the query has no such item
+        """
+        if not self._query_update(query, values, commit):
+            return None
+        return self.read(id)
+
+    def _query_delete(self, query, commit=True):
+        """
+        Deletes all items of a query with a single statement.
+
+        :return: the number of items deleted, or ``None`` if the items need to be deleted one by one
+        """
+        return None
+
     def _query_filter(self, query, expression):
         raise NotImplementedError()
 
+    def _expression_for_version(self, version):
+        raise NotImplementedError()
+
     def _query_filter_by_id(self, query, id):
         """
 
@@ -279,11 +748,36 @@ class RelationalManager(Manager):
     def _query_get_first(self, query):
         raise NotImplementedError()
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
+    def _query_eager_load(self, query, attributes):
+        """
+        Returns a query that loads the given relationship attributes together with the items. Noop by default.
+
+        :param query:
+        :param attributes: a tuple of relationship attribute names
+        :return:
+        """
+        return query
+
+    def _query_load_only(self, query, attributes):
+        """
+        Returns a query that loads only the given attributes of the items, and their ids. Noop by default.
+
+        :param query:
+        :param attributes: a tuple of attribute names
+        :return:
+        """
+        return query
+
+    def paginated_instances(self, page, per_page, where=None, sort=None, embed=None):
         instances = self.instances(where=where, sort=sort)
         if isinstance(instances, list):
             return Pagination.from_list(instances, page, per_page)
-        return self._query_get_paginated_items(instances, page, per_page)
+
+        attributes = self.eager_load
+        if embed:
+            attributes += tuple(a for a in self._attributes_for_fields(embed) if a not in attributes)
+
+        return self._query_get_paginated_items(self._query_eager_load(instances, attributes), page, per_page)
 
     def instances(self, where=None, sort=None):
         query = self._query()
@@ -300,6 +794,97 @@ class RelationalManager(Manager):
 
         return query
 
+    def update_where(self, where, changes, commit=True):
+        query = self._query_for_update()
+
+        if query is None:
+            return 0
+
+        if where:
+            expressions = [self._expression_for_condition(condition) for condition in where]
+            query = self._query_filter(query, self._and_expression(expressions))
+
+        values = None if self._has_item_receivers(before_update, after_update) else self._bulk_update_values(changes)
+
+        if values is None:
+            return self._update_items(self._query_get_all(query), where, changes, commit)
+
+        before_bulk_update.send(self.resource, where=where, changes=changes)
+        count = self._query_update(query, values, commit)
+        after_bulk_update.send(self.resource, where=where, changes=changes, count=count)
+        return count
+
+    def update_by_id(self, id, changes, commit=True, version=None):
+        values = None if self._has_item_receivers(before_update, after_update) else self._bulk_update_values(changes)
+
+        if not values:
+            return super(RelationalManager, self).update_by_id(id, changes, commit, version)
+
+        query = self._query_for_update()
+
+        if query is None:
+            raise ItemNotFound(self.resource, id=id)
+
+        item = self._query_update_by_id(self._query_filter_by_id_and_version(query, id, version), id, values, commit)
+
+        if item is None:
+            raise self._not_written(id, version)
+        return item
+
+    def _query_filter_by_id_and_version(self, query, id, version=None):
+        expression = self._expression_for_ids([id])
+        if version is not None:
+            expression = self._and_expression([expression, self._expression_for_version(version)])
+        return self._query_filter(query, expression)
+
+    def delete_where(self, where, limit=None, commit=True):
+        query = self._query_for_delete()
+
+        if query is None:
+            return 0
+
+        if where:
+            expressions = [self._expression_for_condition(condition) for condition in where]
+            query = self._query_filter(query, self._and_expression(expressions))
+
+        if limit is None and not self._has_item_receivers(before_delete, after_delete,
+                                                          before_bulk_delete, after_bulk_delete):
+            count = self._query_delete(query, commit)
+
+            if count is not None:
+                return count
+
+        ids = self._query_get_ids(query, limit)
+
+        if not ids:
+            return 0
+
+        if self._has_item_receivers(before_delete, after_delete):
+            return self._delete_items(self.read_many(ids), ids)
+
+        before_bulk_delete.send(self.resource, ids=ids)
+        if not self._delete_ids(ids, commit):
+            for item in self.read_many(ids):
+                self.delete(item)
+        after_bulk_delete.send(self.resource, ids=ids)
+        return len(ids)
+
+    def delete_by_id(self, id, version=None):
+        if self._has_item_receivers(before_delete, after_delete):
+            return super(RelationalManager, self).delete_by_id(id, version)
+
+        query = self._query_for_delete()
+
+        if query is None:
+            raise ItemNotFound(self.resource, id=id)
+
+        count = self._query_delete(self._query_filter_by_id_and_version(query, id, version))
+
+        if count is None:
+            return super(RelationalManager, self).delete_by_id(id, version)
+        if not count:
+            raise self._not_written(id, version)
+
     def first(self, where=None, sort=None):
         """
         :param where:
@@ -312,9 +897,24 @@ class RelationalManager(Manager):
         except IndexError:
             raise ItemNotFound(self.resource, where=where)
 
-    def read(self, id):
+    def read(self, id, attributes=None):
         query = self._query()
 
         if query is None:
             raise ItemNotFound(self.resource, id=id)
+
+        if attributes is None:
+            query = self._query_eager_load(query, self.eager_load)
+        else:
+            query = self._query_load_only(query, attributes)
         return self._query_filter_by_id(query, id)
+
+    def read_many(self, ids):
+        if not ids:
+            return []
+
+        query = self._query()
+
+        if query is None:
+            raise ItemNotFound(self.resource, id=ids[0])
+        return self._items_in_order(ids, self._query_get_all(self._query_filter(query, self._expression_for_ids(ids))))
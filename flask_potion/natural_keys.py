@@ -7,7 +7,7 @@ from .filters import Condition
 from .schema import Schema
 from .reference import ResourceBound
 from .exceptions import ItemNotFound
-from .utils import route_from, get_value
+from .utils import id_from_uri, get_value
 
 
 class Key(Schema, ResourceBound):
@@ -24,6 +24,14 @@ class Key(Schema, ResourceBound):
     def schema(self):
         raise NotImplementedError()
 
+    def convert_id(self, value):
+        """
+        Returns the id of the item referenced by ``value`` without reading the item.
+
+        :raises NotImplementedError: if the id cannot be determined without reading the item
+        """
+        raise NotImplementedError()
+
 
 class RefKey(Key):
 
@@ -50,14 +58,15 @@ class RefKey(Key):
     def format(self, item):
         return {"$ref": self._item_uri(self.resource, item)}
 
-    def convert(self, value):
-        try:
-            endpoint, args = route_from(value["$ref"], 'GET')
-        except Exception as e:
-            raise e
+    def format_id(self, id):
+        return {"$ref": '{}/{}'.format(self.resource.route_prefix, id)}
+
+    def convert_id(self, value):
         # XXX verify endpoint is correct (it should be)
-        # assert resource.endpoint == endpoint
-        return self.resource.manager.read(args['id'])
+        return id_from_uri(value["$ref"], self.resource)
+
+    def convert(self, value):
+        return self.resource.manager.read(self.convert_id(value))
 
 
 class PropertyKey(Key):
@@ -126,5 +135,11 @@ class IDKey(Key):
     def format(self, item):
         return self.id_field.output(self.resource.manager.id_attribute, item)
 
+    def format_id(self, id):
+        return self.id_field.format(id)
+
+    def convert_id(self, value):
+        return self.id_field.convert(value)
+
     def convert(self, value):
-        return self.resource.manager.read(self.id_field.convert(value))
+        return self.resource.manager.read(self.convert_id(value))
@@ -4,14 +4,18 @@ from operator import attrgetter
 import itertools
 
 import six
+from flask import current_app, request
+from werkzeug.exceptions import Forbidden
 
 from .natural_keys import RefKey, IDKey, PropertyKey, PropertiesKey
-from .fields import ItemType, ItemUri, Integer, Inline
+from .fields import ItemType, ItemUri, Integer, Inline, BulkInline
+from .exceptions import PreconditionFailed
 from .reference import ResourceBound
-from .instances import Instances
-from .utils import AttributeDict
+from .instances import Instances, Facets, BulkChanges, BulkDeletion
+from .utils import AttributeDict, get_value
 from .routes import Route
 from .schema import FieldSet
+from .write_behind import WriteBehindBuffer
 
 
 class ResourceMeta(type):
@@ -51,6 +55,10 @@ class ResourceMeta(type):
         else:
             meta['name'] = name.lower()
 
+        # the version of an item is only changed by the manager
+        if meta.get('version_attribute') and meta.version_attribute not in meta.get('read_only_fields', ()):
+            meta['read_only_fields'] = tuple(meta.get('read_only_fields', ())) + (meta.version_attribute,)
+
         schema = {}
         for base in bases:
             if hasattr(base, 'Schema'):
@@ -179,7 +187,7 @@ class Resource(six.with_metaclass(ResourceMeta, object)):
             if value:
                 schema[property] = value
 
-        links = [route for name, route in sorted(self.routes.items())]
+        links = [route for name, route in sorted(self.routes.items()) if current_app.debug or not route.debug_only]
 
         if self.schema:
             schema['type'] = "object"
@@ -205,6 +213,16 @@ class ModelResourceMeta(ResourceMeta):
     def __new__(mcs, name, bases, members):
         class_ = super(ModelResourceMeta, mcs).__new__(mcs, name, bases, members)
 
+        # items can only be upserted by their natural key:
+        if not class_.meta.get('natural_key'):
+            class_.routes.pop('upsert', None)
+
+        # changes to every item matching a condition need to be enabled explicitly:
+        if not class_.meta.get('bulk_update'):
+            class_.routes.pop('bulkUpdate', None)
+        if not class_.meta.get('bulk_delete'):
+            class_.routes.pop('bulkDestroy', None)
+
         if 'Meta' in members:
             meta = class_.meta
             changes = members['Meta'].__dict__
@@ -212,6 +230,13 @@ class ModelResourceMeta(ResourceMeta):
             if 'model' in changes or 'model' in meta and 'manager' in changes:
                 if meta.manager is not None:
                     class_.manager = meta.manager(class_, meta.model)
+
+            if 'write_behind' in changes:
+                options = meta.write_behind
+                if options:
+                    class_.write_behind = WriteBehindBuffer(class_, **(options if isinstance(options, dict) else {}))
+                else:
+                    class_.write_behind = None
         return class_
 
 
@@ -220,10 +245,45 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
 
     .. method:: create
 
-        A link --- part of a :class:`Route` at the root of the resource --- for creating new items.
+        A link --- part of a :class:`Route` at the root of the resource --- for creating new items. Accepts either
+        a single item or an array of items, which are created together using :meth:`Manager.create_many`.
+
+        With ``Meta.write_behind``, items are buffered and created in batches by a :class:`WriteBehindBuffer` instead,
+        and the request is acknowledged with ``202 Accepted``. ``Meta.write_behind`` is either ``True`` or a dictionary
+        of options for the buffer. Permissions are checked with :meth:`Manager.can_create_item` before the items are
+        buffered, as the batches are written without a request context.
 
         :param properties:
-        :return: created item
+        :return: created item, or a list of created items
+
+    .. method:: upsert
+
+        A link --- part of a :class:`Route` at the root of the resource --- for creating items or updating the items
+        with the same natural key, as defined in ``Meta.natural_key``, using :meth:`Manager.upsert_many`. Accepts either
+        a single item or an array of items. Only resources with a natural key have this route.
+
+        :param properties:
+        :return: created or updated item, or a list of them
+
+    .. method:: bulk_update
+
+        A link --- part of a :class:`Route` at the root of the resource --- for applying the same changes to every item
+        matching the ``where`` query string parameter, using :meth:`Manager.update_where`. Only resources with
+        ``Meta.bulk_update`` have this route.
+
+        :param changes:
+        :param where:
+        :return: the number of items changed
+
+    .. method:: bulk_destroy
+
+        A link --- part of a :class:`Route` at the root of the resource --- for deleting every item matching the
+        ``where`` query string parameter, or at most ``limit`` of them, using :meth:`Manager.delete_where`. Only
+        resources with ``Meta.bulk_delete`` have this route.
+
+        :param where:
+        :param int limit:
+        :return: the number of items deleted
 
     .. method:: instances
 
@@ -233,8 +293,26 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
         :param sort:
         :param int page:
         :param int per_page:
+        :param embed: relation fields to load together with the items and to format inline
         :return: list of items
 
+    .. method:: facets
+
+        A link --- part of a :class:`Route` at ``/facets`` --- for counting the distinct values of filterable fields.
+
+        :param fields: names of the fields to count
+        :param where:
+        :param int limit: maximum number of values per field
+        :return: a dictionary of value counts for each field
+
+    .. method:: explain
+
+        A link --- part of a :class:`Route` at ``/explain`` --- for inspecting the query that :meth:`instances` would run
+        with the same arguments. Only available when the application is in debug mode, and responds with
+        ``501 Not Implemented`` if the manager cannot describe its queries.
+
+        :return: the compiled statement, its parameters and the query plan of the backend
+
     .. method:: read
 
         A link --- part of a :class:`Route` at ``/<{Resource.meta.id_converter}:id>`` --- for reading a specific item.
@@ -250,6 +328,10 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
         :param properties: changes
         :return: item
 
+        With ``Meta.version_attribute``, items are returned with an ``ETag`` header containing their version. An
+        update or delete request with an ``If-Match`` header is only applied if the item still has that version, in the
+        same statement as the write where the manager supports it; otherwise it fails with ``412 Precondition Failed``.
+
     .. method:: destroy
 
         A link --- part of a :class:`Route` at ``/<{Resource.meta.id_converter}:id>`` --- for deleting a specific item.
@@ -259,6 +341,7 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
 
     """
     manager = None
+    write_behind = None
 
     @Route.GET('', rel="instances")
     def instances(self, **kwargs):
@@ -269,32 +352,109 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
 
     @instances.POST(rel="create")
     def create(self, properties):  # XXX need some way for field bindings to be dynamic/work dynamically.
+        if self.write_behind is not None:
+            items, data = (properties, request.json) if isinstance(properties, list) else ([properties], [request.json])
+
+            # the buffered items are created without a request, so permissions are checked before they are buffered
+            if not all(self.manager.can_create_item(item) for item in items):
+                raise Forbidden()
+
+            self.write_behind.append(items, data)
+            return current_app.response_class(status=202)
+
+        if isinstance(properties, list):
+            return self.manager.create_many(properties)
         item = self.manager.create(properties)
-        return item  # TODO consider 201 Created
+        return self._with_etag(item)  # TODO consider 201 Created
+
+    create.request_schema = create.response_schema = BulkInline('self')
+
+    @instances.PUT(rel="upsert")
+    def upsert(self, properties):
+        if isinstance(properties, list):
+            return self.manager.upsert_many(properties)
+        return self.manager.upsert(properties)
 
-    create.request_schema = create.response_schema = Inline('self')
+    upsert.request_schema = upsert.response_schema = BulkInline('self')
+
+    @instances.PATCH(rel="bulkUpdate")
+    def bulk_update(self, changes, where):
+        if not changes:
+            return 0
+        return self.manager.update_where(where, changes)
+
+    bulk_update.request_schema = bulk_update.response_schema = BulkChanges()
+
+    @instances.DELETE(rel="bulkDestroy")
+    def bulk_destroy(self, where, limit=None):
+        return self.manager.delete_where(where, limit=limit)
+
+    bulk_destroy.request_schema = bulk_destroy.response_schema = BulkDeletion()
+
+    @Route.GET('/facets', rel="facets")
+    def facets(self, fields, where=None, limit=None):
+        return self.manager.facets(fields, where=where, limit=limit)
+
+    facets.request_schema = facets.response_schema = Facets()
+
+    @Route.GET('/explain', rel="explain")
+    def explain(self, page, per_page, where=None, sort=None, embed=None):
+        return self.manager.explain(page, per_page, where=where, sort=sort)
+
+    explain.request_schema = Instances()
+    explain.debug_only = True
 
     @Route.GET(lambda r: '/<{}:id>'.format(r.meta.id_converter), rel="self", attribute="instance")
     def read(self, id):
-        return self.manager.read(id)
+        return self._with_etag(self.manager.read(id))
 
     read.request_schema = None
     read.response_schema = Inline('self')
 
     @read.PATCH(rel="update")
     def update(self, properties, id):
-        item = self.manager.read(id)
-        updated_item = self.manager.update(item, properties)
-        return updated_item
+        return self._with_etag(self.manager.update_by_id(id, properties, version=self._if_match_version()))
 
     update.request_schema = Inline('self', patchable=True)
     update.response_schema = update.request_schema
 
     @update.DELETE(rel="destroy")
     def destroy(self, id):
-        self.manager.delete_by_id(id)
+        self.manager.delete_by_id(id, version=self._if_match_version())
         return None, 204
 
+    def _with_etag(self, item):
+        """
+        Returns the item with an ``ETag`` header containing its version, if the resource has a
+        ``Meta.version_attribute``.
+        """
+        if self.meta.version_attribute is None:
+            return item
+
+        version = get_value(self.meta.version_attribute, item, None)
+        if version is None:
+            return item
+        return item, 200, {'ETag': '"{}"'.format(version)}
+
+    def _if_match_version(self):
+        """
+        Returns the version the client expects the item to have from the ``If-Match`` header, or ``None`` if the
+        resource has no ``Meta.version_attribute`` or the header is missing.
+
+        :raises exceptions.PreconditionFailed: if the header does not contain exactly one version
+        """
+        if self.meta.version_attribute is None or not request.if_match or request.if_match.star_tag:
+            return None
+
+        # an item has a single version, so a list of ETags cannot be checked in one conditional write
+        etags = request.if_match.as_set()
+        if len(etags) == 1:
+            try:
+                return int(etags.pop())
+            except ValueError:
+                pass
+        raise PreconditionFailed()
+
     class Schema:
         pass
 
@@ -322,4 +482,9 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
             RefKey(),
             IDKey()
         )
-        natural_key = None
\ No newline at end of file
+        natural_key = None
+        eager_load = ()
+        write_behind = False
+        version_attribute = None
+        bulk_update = False
+        bulk_delete = False
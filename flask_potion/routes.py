@@ -3,16 +3,19 @@ import sys
 from collections import OrderedDict
 from types import MethodType
 
-from flask import request
+from flask import request, current_app
 from werkzeug.utils import cached_property
+from werkzeug.wrappers import BaseResponse
 
+from flask_potion.exceptions import PageNotFound
 from flask_potion.reference import _bind_schema
-from flask_potion.fields import ToOne, Integer
-from flask_potion.fields import _field_from_object
-from flask_potion.instances import Instances, RelationInstances
+from flask_potion.fields import _field_from_object, Inline, AttributeChange
+from flask_potion.instances import Instances, RelationInstances, RelationFilters, RelationTargets, BulkChanges, \
+    BulkDeletion
+from flask_potion.natural_keys import RefKey
 from flask_potion.reference import ResourceBound, ResourceReference
 from flask_potion.schema import Schema, FieldSet
-from flask_potion.utils import get_value
+from flask_potion.utils import get_value, unpack
 
 HTTP_METHODS = ('GET', 'PUT', 'POST', 'PATCH', 'DELETE')
 
@@ -70,6 +73,11 @@ class Route(object):
 
         response schema (not resource-bound)
 
+    .. attribute:: debug_only
+
+        If ``True``, the route responds with ``404 Not Found`` and is left out of the resource schema unless the
+        application is in debug mode. ``False`` by default.
+
 
     .. decoratormethod:: METHOD(rule=None, attribute=None, rel=None, title=None, description=None, schema=None, response_schema=None, format_response=True)
 
@@ -114,6 +122,8 @@ class Route(object):
 
     """
 
+    debug_only = False
+
     def __init__(self,
                  method=None,
                  view_func=None,
@@ -260,6 +270,9 @@ class Route(object):
         view_func = self.view_func
 
         def view(*args, **kwargs):
+            if self.debug_only and not current_app.debug:
+                raise PageNotFound()
+
             instance = resource()
             if isinstance(request_schema, (FieldSet, Instances)):
                 kwargs.update(request_schema.parse_request(request))
@@ -268,14 +281,46 @@ class Route(object):
 
             response = view_func(instance, *args, **kwargs)
             # TODO add 'describedBy' link header if response schema is a ToOne/ToMany/Instances field.
-            if response_schema is None or not self.format_response:
+            if response_schema is None or not self.format_response or isinstance(response, BaseResponse):
                 return response
+            elif request.method != 'GET' and not isinstance(response_schema, (BulkChanges, BulkDeletion)) \
+                    and _prefers_minimal_return():
+                return _minimal_response(response, response_schema, resource, created=self.rel == 'create')
             else:
                 return response_schema.format_response(response)
 
         return view
 
 
+def _prefers_minimal_return():
+    """
+    Whether the client asked to skip the response body with a ``Prefer: return=minimal`` header (RFC 7240).
+    """
+    for preference in request.headers.get('Prefer', '').split(','):
+        if preference.split(';')[0].replace(' ', '').lower() in ('return=minimal', 'return="minimal"'):
+            return True
+    return False
+
+
+def _minimal_response(response, response_schema, resource, created=False):
+    """
+    Returns an empty response in place of the formatted response of a write route: ``201 Created`` for a route that
+    creates items and ``204 No Content`` otherwise, with a ``Location`` header if the response is a single item of the
+    resource. Responses of bulk changes and deletions are not affected, as they only contain the number of items.
+    """
+    data, code, headers = unpack(response)
+    headers = dict(headers, **{'Preference-Applied': 'return=minimal'})
+
+    if code == 200:
+        code = 201 if created else 204
+
+    if isinstance(response_schema, Inline) and response_schema.target is resource \
+            and data is not None and not isinstance(data, list):
+        headers['Location'] = RefKey().bind(resource).format(data)['$ref']
+
+    return current_app.response_class(status=code, headers=headers)
+
+
 def _route_decorator(method):
     @classmethod
     def decorator(cls, *args, **kwargs):
@@ -301,8 +346,16 @@ class ItemRoute(Route):
     - :meth:`rule_factory` is changed to prefix ``<{id_converter}:id>`` with any rule.
     - It changes the implementation of :meth:`view_factory` so that it passes the resolved resource item matching *id*
       as the first positional argument to the view function.
+
+    :param item_attributes: an optional list of the only item attributes the view function reads. The manager may then
+        load only these attributes; see :meth:`Manager.read`. Only then is ``attributes`` passed to
+        :meth:`Manager.read`, so managers that override it without that argument must not be used with such routes.
     """
 
+    def __init__(self, *args, **kwargs):
+        self.item_attributes = kwargs.pop('item_attributes', None)
+        super(ItemRoute, self).__init__(*args, **kwargs)
+
     def rule_factory(self, resource, relative=False):
         rule = self.rule
         id_matcher = '<{}:id>'.format(resource.meta.id_converter)
@@ -322,12 +375,24 @@ class ItemRoute(Route):
 
         def view(*args, **kwargs):
             id = kwargs.pop('id')  # Py2.7 -- could use (*args, id, **kwargs) otherwise
-            item = resource.manager.read(id)
+            if self.item_attributes is None:
+                item = resource.manager.read(id)
+            else:
+                item = resource.manager.read(id, attributes=self.item_attributes)
             return original_view(item, *args, **kwargs)
 
         return view
 
 
+class _ItemIdRoute(ItemRoute):
+    """
+    An :class:`ItemRoute` that passes the *id* to the view function as a keyword argument instead of reading the item
+    first, for views that write to the item through the manager.
+    """
+
+    view_factory = Route.view_factory
+
+
 class RouteSet(object):
     """
     An abstract class for combining related routes into one, which can also be used as a route factory.
@@ -343,6 +408,12 @@ class RouteSet(object):
 class ItemAttributeRoute(RouteSet):
     """
 
+    Numbers can be incremented with ``{"$inc": number}`` and elements appended to arrays with
+    ``{"$push": element}``, as described in :class:`fields.AttributeChange`. The new value is written without reading
+    the item first, and in place where the manager supports it, so concurrent changes are not lost.
+
+    Reading the attribute loads only that attribute of the item, where the manager supports it.
+
     :param fields.Raw cls_or_instance: a field class or instance
     :param str attribute: defaults to the field's ``attribute`` attribute
     :param str io: ``r``, ``u``, or ``ru`` - defaults to the field's ``io`` attribute
@@ -366,19 +437,19 @@ class ItemAttributeRoute(RouteSet):
             yield route.for_method('GET',
                                    read_attribute,
                                    response_schema=field,
-                                   rel=to_camel_case('read_{}'.format(route.attribute)))
+                                   rel=to_camel_case('read_{}'.format(route.attribute)),
+                                   item_attributes=(attribute,))
 
         if "u" in io:
-            def update_attribute(resource, item, value):
-                attribute = field.attribute or route.attribute
-                item = resource.manager.update(item, {attribute: value})
+            def update_attribute(resource, value, id):
+                item = resource.manager.update_by_id(id, {attribute: value})
                 return get_value(attribute, item, field.default)
 
-            yield route.for_method('POST',
-                                   update_attribute,
-                                   schema=field,
-                                   response_schema=field,
-                                   rel=to_camel_case('update_{}'.format(route.attribute)))
+            yield _ItemIdRoute(attribute=self.attribute).for_method('POST',
+                                                                    update_attribute,
+                                                                    schema=AttributeChange(field),
+                                                                    response_schema=field,
+                                                                    rel=to_camel_case('update_{}'.format(route.attribute)))
 
 
 class Relation(RouteSet, ResourceBound):
@@ -405,40 +476,53 @@ class Relation(RouteSet, ResourceBound):
         relations_route = ItemRoute(rule=rule)
 
         if "r" in io:
-            def relation_instances(resource, item, page, per_page):
+            def relation_instances(resource, item, page, per_page, where=None, sort=None):
                 return resource.manager.relation_instances(item,
                                                            self.attribute,
                                                            self.target,
                                                            page,
-                                                           per_page)
+                                                           per_page,
+                                                           where=where,
+                                                           sort=sort)
 
             yield relations_route.for_method('GET',
                                              relation_instances,
                                              rel=self.attribute,
                                              response_schema=RelationInstances(self.target),
-                                             schema=FieldSet({
-                                                 "page": Integer(minimum=1, default=1),
-                                                 "per_page": Integer(minimum=1,
-                                                                     default=20,  # FIXME use API reference
-                                                                     maximum=50)
-                                             }))
+                                             schema=RelationFilters(self.target))
 
         if "w" in io or "u" in io:
-            def relation_add(resource, item, target_item):
-                resource.manager.relation_add(item, self.attribute, self.target, target_item)
-                resource.manager.commit()
-                return target_item
+            def relation_add(resource, item, targets):
+                with resource.manager.transaction():
+                    if isinstance(targets, list):
+                        resource.manager.relation_add_many(item, self.attribute, self.target, targets)
+                    else:
+                        resource.manager.relation_add(item, self.attribute, self.target, targets)
+                return targets
 
             yield relations_route.for_method('POST',
                                              relation_add,
                                              rel=to_camel_case('add_{}'.format(self.attribute)),
-                                             response_schema=ToOne(self.target),
-                                             schema=ToOne(self.target))
+                                             response_schema=RelationTargets(self.target),
+                                             schema=RelationTargets(self.target))
+
+            def relation_remove_many(resource, item, targets):
+                with resource.manager.transaction():
+                    if isinstance(targets, list):
+                        resource.manager.relation_remove_many(item, self.attribute, self.target, targets)
+                    else:
+                        resource.manager.relation_remove(item, self.attribute, self.target, targets)
+                return None, 204
+
+            yield relations_route.for_method('DELETE',
+                                             relation_remove_many,
+                                             rel=to_camel_case('bulk_remove_{}'.format(self.attribute)),
+                                             schema=RelationTargets(self.target))
 
             def relation_remove(resource, item, target_id):
                 target_item = self.target.manager.read(target_id)
-                resource.manager.relation_remove(item, self.attribute, self.target, target_item)
-                resource.manager.commit()
+                with resource.manager.transaction():
+                    resource.manager.relation_remove(item, self.attribute, self.target, target_item)
                 return None, 204
 
             yield relation_route.for_method('DELETE',
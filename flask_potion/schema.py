@@ -5,7 +5,7 @@ from werkzeug.utils import cached_property
 from jsonschema import Draft4Validator, ValidationError, FormatChecker
 
 from flask_potion.reference import ResourceBound
-from flask_potion.utils import unpack
+from flask_potion.utils import unpack, get_value
 from flask_potion.exceptions import ValidationError as PotionValidationError, RequestMustBeJSON
 
 
@@ -184,7 +184,7 @@ class FieldSet(Schema, ResourceBound):
             "type": "object",
             "additionalProperties": False,
             "properties": OrderedDict((
-                (key, field.request) for key, field in self.fields.items() if 'u' in field.io))
+                (key, self._update_request(field, patchable)) for key, field in self.fields.items() if 'u' in field.io))
         }
 
         # TODO figure out logic for required
@@ -198,6 +198,13 @@ class FieldSet(Schema, ResourceBound):
         return read_schema, create_schema, update_schema
 
 
+    @staticmethod
+    def _update_request(field, patchable):
+        from flask_potion.fields import ToOne, ToMany
+        if patchable and isinstance(field, ToMany) and isinstance(field.container, ToOne):
+            return {"anyOf": [field.request, field.changes_request]}
+        return field.request
+
     def schema(self):
         return self._schema()
 
@@ -223,6 +230,8 @@ class FieldSet(Schema, ResourceBound):
         else:
             object_ = super(FieldSet, self).convert(instance, update)
 
+        references = {}
+
         for key, field in self.fields.items():
             if update and 'u' not in field.io or not update and 'c' not in field.io:
                 continue
@@ -235,6 +244,12 @@ class FieldSet(Schema, ResourceBound):
 
             try:
                 value = object_[key]
+
+                # references are resolved together once all fields have been read
+                if self._is_reference_field(field) and value is not None:
+                    references[field.attribute or key] = (field, value)
+                    continue
+
                 value = field.convert(value, validate=False)
             except KeyError:
                 if patchable:
@@ -248,8 +263,75 @@ class FieldSet(Schema, ResourceBound):
                     value = None
 
             result[field.attribute or key] = value
+
+        if references:
+            result.update(self._convert_references(references))
+        return result
+
+    @staticmethod
+    def _is_reference_field(field):
+        from flask_potion.fields import ToOne, ToMany
+        return isinstance(field, ToOne) or isinstance(field, ToMany) and isinstance(field.container, ToOne)
+
+    @staticmethod
+    def _convert_references(references):
+        """
+        Resolves the values of :class:`fields.ToOne` and :class:`fields.ToMany` fields, reading all items
+        referenced by id with one :meth:`Manager.read_many` call per target resource.
+
+        :param dict references: a dictionary of {attribute: (field, value)} pairs
+        :return: a dictionary of {attribute: converted value} pairs
+        """
+        from flask_potion.fields import ToMany, ToManyChanges
+
+        result = {}
+        ids_by_target = OrderedDict()
+        pending = {}
+
+        for attribute, (field, value) in references.items():
+            if isinstance(field, ToMany) and isinstance(value, dict):
+                to_one = field.container
+                result[attribute] = ToManyChanges(to_one.target,
+                                                  add=FieldSet._reference_ids(to_one, value.get('$add', ())),
+                                                  remove=FieldSet._reference_ids(to_one, value.get('$remove', ())))
+                continue
+
+            to_one, values = (field.container, value) if isinstance(field, ToMany) else (field, [value])
+            ids = [to_one.convert_id(v) for v in values]
+
+            # references by natural key cannot be resolved in bulk
+            if None in ids:
+                result[attribute] = field.convert(value, validate=False)
+                continue
+
+            target_ids = ids_by_target.setdefault(to_one.target, OrderedDict())
+            target_ids.update((id, None) for id in ids)
+            pending[attribute] = (field, to_one.target, ids)
+
+        items_by_target = {}
+        for target, ids in ids_by_target.items():
+            ids = list(ids)
+            items_by_target[target] = dict(zip(ids, target.manager.read_many(ids)))
+
+        for attribute, (field, target, ids) in pending.items():
+            items = [items_by_target[target][id] for id in ids]
+            result[attribute] = items if isinstance(field, ToMany) else items[0]
         return result
 
+    @staticmethod
+    def _reference_ids(to_one, values):
+        id_attribute = to_one.target.manager.id_attribute
+        ids = OrderedDict()
+
+        for value in values:
+            id = to_one.convert_id(value)
+
+            # references by natural key have to be read to determine the id
+            if id is None:
+                id = get_value(id_attribute, to_one.convert(value, validate=False), None)
+            ids[id] = None
+        return list(ids)
+
     def parse_request(self, request):
         if request.method in ('POST', 'PATCH', 'PUT', 'DELETE'):
             if request.mimetype != 'application/json':
@@ -1,23 +1,226 @@
+import threading
+
+from blinker import NamedSignal
+from flask import current_app, g, has_app_context
 from flask.signals import Namespace
+from six.moves import queue
+
+from flask_potion.fields import ToManyChanges
 
 _potion = Namespace()
 
+
+class AsyncDispatcher(object):
+    """
+    Sends the ``after_*`` signals to their receivers on a pool of worker threads, so that slow receivers do not delay
+    the response. Enable it with ``Api(app, signal_dispatcher=AsyncDispatcher())``; the ``before_*`` signals are
+    always sent synchronously.
+
+    Receivers are called within an application context, but not within the request, and signals may be received in
+    a different order than they were sent. Items are never shared with the request: the ``item`` and ``child``
+    arguments, and the values of ``changes`` --- including the items in lists and in :class:`fields.ToManyChanges` ---
+    are snapshots taken with :meth:`Manager.snapshot` of the sender's manager when the signal is sent. Snapshots of database models are detached and only have the column attributes
+    that were loaded after the change was committed; receivers must not rely on relationships or lazy loading, and
+    should read the item again by its id if they need more.
+
+    :param int workers: the number of worker threads
+    :param int max_pending: the maximum number of signals waiting to be sent. Once it is reached, sending a signal
+        blocks until a worker is free.
+    :param on_error: an optional function called with ``(signal, sender, receiver, exception)`` when a receiver raises
+        an exception. By default, the exception is logged with the application logger.
+    """
+
+    def __init__(self, workers=4, max_pending=1000, on_error=None):
+        self.workers = workers
+        self.on_error = on_error
+        self._queue = queue.Queue(max_pending)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def dispatch(self, signal, sender, kwargs):
+        if not self._threads:
+            self._start()
+        self._queue.put((current_app._get_current_object(), signal, sender, self._snapshot(sender, kwargs)))
+
+    @staticmethod
+    def _snapshot(sender, kwargs):
+        manager = getattr(sender, 'manager', None)
+        if manager is None:
+            return kwargs
+
+        kwargs = dict(kwargs)
+        for key in ('item', 'child'):
+            if key in kwargs:
+                kwargs[key] = AsyncDispatcher._snapshot_value(manager, kwargs[key])
+        if isinstance(kwargs.get('changes'), dict):
+            kwargs['changes'] = {key: AsyncDispatcher._snapshot_value(manager, value)
+                                 for key, value in kwargs['changes'].items()}
+        return kwargs
+
+    @staticmethod
+    def _snapshot_value(manager, value):
+        # the items of to-many changes are snapshotted one by one
+        if isinstance(value, (list, tuple)):
+            return [AsyncDispatcher._snapshot_value(manager, element) for element in value]
+        if isinstance(value, ToManyChanges):
+            return ToManyChanges(value.target,
+                                 add=AsyncDispatcher._snapshot_value(manager, value.add),
+                                 remove=AsyncDispatcher._snapshot_value(manager, value.remove))
+        return manager.snapshot(value)
+
+    def flush(self):
+        """
+        Blocks until all pending signals have been sent, e.g. before checking the effects of receivers in tests.
+        """
+        self._queue.join()
+
+    def shutdown(self):
+        """
+        Sends the pending signals and stops the worker threads.
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name='potion-signals-{}'.format(i))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                self._send(*task)
+            finally:
+                self._queue.task_done()
+
+    def _send(self, app, signal, sender, kwargs):
+        with app.app_context():
+            for receiver in signal.receivers_for(sender):
+                try:
+                    receiver(sender, **kwargs)
+                except Exception as e:
+                    try:
+                        if self.on_error is None:
+                            raise
+                        self.on_error(signal, sender, receiver, e)
+                    except Exception:
+                        app.logger.exception('Error in receiver of {}'.format(signal.name))
+
+
+class _AfterSignal(NamedSignal):
+    """
+    A signal sent after a change has been written. Within a unit of work, sending is deferred until the unit of work
+    has been committed. With an :class:`AsyncDispatcher`, receivers are called on a worker thread.
+    """
+
+    def send(self, *sender, **kwargs):
+        if not has_app_context():
+            return super(_AfterSignal, self).send(*sender, **kwargs)
+
+        deferred = getattr(g, 'potion_deferred_signals', None)
+
+        if deferred is not None:
+            deferred.append((self, sender, kwargs))
+            return []
+
+        dispatcher = current_app.extensions.get('potion_signal_dispatcher')
+
+        if dispatcher is not None and self.receivers:
+            dispatcher.dispatch(self, sender[0] if sender else None, kwargs)
+            return []
+        return super(_AfterSignal, self).send(*sender, **kwargs)
+
+
+def _after_signal(name):
+    return _potion.setdefault(name, _AfterSignal(name))
+
+
+def _in_unit_of_work():
+    return has_app_context() and hasattr(g, 'potion_deferred_signals')
+
+
+def _defer_signals():
+    """
+    Starts deferring the ``after_*`` signals, or nests within signals that are already deferred.
+    """
+    if _in_unit_of_work():
+        g.potion_signal_deferrals += 1
+    else:
+        g.potion_deferred_signals = []
+        g.potion_signal_deferrals = 1
+
+
+def _send_deferred_signals():
+    """
+    Sends the deferred signals once the outermost deferral has ended.
+    """
+    if not _in_unit_of_work():
+        return
+
+    g.potion_signal_deferrals -= 1
+    if g.potion_signal_deferrals:
+        return
+
+    deferred = g.potion_deferred_signals
+    del g.potion_deferred_signals
+
+    for signal, sender, kwargs in deferred:
+        signal.send(*sender, **kwargs)
+
+
+def _discard_deferred_signals():
+    """
+    Discards the deferred signals and ends all deferrals, as rolling back ends the outermost transaction.
+    """
+    if _in_unit_of_work():
+        del g.potion_deferred_signals
+
 before_create = _potion.signal('before-create')
 
-after_create = _potion.signal('after-create')
+after_create = _after_signal('after-create')
 
 before_update = _potion.signal('before-update')
 
-after_update = _potion.signal('after-update')
+after_update = _after_signal('after-update')
 
 before_delete = _potion.signal('before-delete')
 
-after_delete = _potion.signal('after-delete')
+after_delete = _after_signal('after-delete')
 
 before_add_to_relation = _potion.signal('before-add-to-relation')
 
-after_add_to_relation = _potion.signal('after-add-to-relation')
+after_add_to_relation = _after_signal('after-add-to-relation')
 
 before_remove_from_relation = _potion.signal('before-remove-from-relation')
 
-after_remove_from_relation = _potion.signal('after-remove-from-relation')
\ No newline at end of file
+after_remove_from_relation = _after_signal('after-remove-from-relation')
+
+before_bulk_add_to_relation = _potion.signal('before-bulk-add-to-relation')
+
+after_bulk_add_to_relation = _after_signal('after-bulk-add-to-relation')
+
+before_bulk_remove_from_relation = _potion.signal('before-bulk-remove-from-relation')
+
+after_bulk_remove_from_relation = _after_signal('after-bulk-remove-from-relation')
+
+before_bulk_update = _potion.signal('before-bulk-update')
+
+after_bulk_update = _after_signal('after-bulk-update')
+
+before_bulk_delete = _potion.signal('before-bulk-delete')
+
+after_bulk_delete = _after_signal('after-bulk-delete')
@@ -1,5 +1,8 @@
-from flask import _app_ctx_stack, _request_ctx_stack
+import re
+
+from flask import _app_ctx_stack, _request_ctx_stack, current_app
 from werkzeug.exceptions import NotFound
+from werkzeug.routing import ValidationError
 from werkzeug.urls import url_parse
 
 
@@ -27,6 +30,62 @@ def route_from(url, method=None):
     return url_adapter.match(parsed_url.path, method)
 
 
+# URIs with any of these characters need to be parsed & matched by Werkzeug:
+_UNUSUAL_URI_CHARACTERS = re.compile(r'[%?#;\\]|//')
+
+
+def _item_uri_matcher(app, route_prefix, id_converter):
+    # matchers are kept with the application, for as long as it exists
+    matchers = app.extensions.setdefault('potion_item_uri_matchers', {})
+    key = (route_prefix, id_converter)
+
+    try:
+        return matchers[key]
+    except KeyError:
+        pass
+
+    url_map = app.url_map
+    converter_class = url_map.converters.get(id_converter)
+
+    # converters with arguments, e.g. "int(min=1)", are not supported:
+    if converter_class is None:
+        matcher = None
+    else:
+        converter = converter_class(url_map)
+        pattern = re.compile(r'^{}/({})$'.format(re.escape(route_prefix), converter.regex))
+        matcher = pattern, converter
+
+    matchers[key] = matcher
+    return matcher
+
+
+def id_from_uri(uri, resource):
+    """
+    Returns the id of an item of a resource from the item's URI.
+
+    The URI is matched against a pattern built from the resource's ``route_prefix`` and ``id_converter``, which is
+    precompiled once for each resource. Any URI that does not match, such as an absolute URL, falls back to
+    :func:`route_from`, which matches the URI against the whole URL map.
+
+    :param str uri: item URI, e.g. ``'/api/book/1'``
+    :param resource: resource class
+    """
+    matcher = _item_uri_matcher(current_app, resource.route_prefix, resource.meta.id_converter)
+
+    if matcher is not None and not _UNUSUAL_URI_CHARACTERS.search(uri):
+        pattern, converter = matcher
+        match = pattern.match(uri)
+
+        if match is not None:
+            try:
+                return converter.to_python(match.group(1))
+            except ValidationError:
+                pass
+
+    endpoint, args = route_from(uri, 'GET')
+    return args['id']
+
+
 # --- start of Flask-RESTful code ---
 # Copyright (c) 2013, Twilio, Inc.
 # All rights reserved.
@@ -62,6 +121,14 @@ def get_value(key, obj, default):
 # --- end of Flask-RESTful code ---
 
 
+def chunked(values, size):
+    """
+    Splits a list into lists of at most ``size`` values, e.g. to keep the number of bound parameters of a statement
+    below the limit of the database.
+    """
+    return [values[index:index + size] for index in range(0, len(values), size)]
+
+
 class AttributeDict(dict):
     __getattr__ = dict.__getitem__
     __setattr__ = dict.__setitem__
@@ -0,0 +1,273 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+from flask import current_app, g
+
+from .exceptions import BufferFull
+
+
+class WriteBehindBuffer(object):
+    """
+    Buffers items that are created through a :class:`ModelResource` with ``Meta.write_behind`` and writes them in
+    batches using :meth:`Manager.create_many`, on a background thread. A batch is written once ``max_size`` items are
+    buffered or the oldest buffered item has waited for ``max_delay`` seconds.
+
+    Items are validated before they are buffered, but errors when writing them, such as conflicts, can no longer be
+    reported to the client. When a batch fails, the error is logged with the application logger and the batch is kept
+    at the front of the buffer. It is retried after ``retry_delay`` seconds, a delay that doubles with every failed
+    attempt up to ``max_retry_delay``. Once ``max_pending`` items are buffered, new items are rejected with
+    ``503 Service Unavailable`` until the buffer has been written.
+
+    Batches are written with an application context but without a request context: ``request``, the current identity
+    and anything stored on ``g`` by the request that buffered the items are not available to the manager or to signal
+    receivers. Permissions are checked with :meth:`Manager.can_create_item` when the items are buffered, and
+    ``g.potion_write_behind`` is set while a batch is written.
+
+    :param resource: the resource whose manager creates the items
+    :param int max_size: the maximum number of items in a batch
+    :param float max_delay: the maximum number of seconds an item is buffered for
+    :param int max_pending: the maximum number of buffered items
+    :param float retry_delay: the number of seconds before a failed batch is retried for the first time
+    :param float max_retry_delay: the maximum number of seconds between two attempts to write a failed batch
+    :param int max_attempts: an optional number of attempts after which the items of a failed batch are logged and
+        dropped. By default, a failed batch is retried until it has been written.
+    :param str spool_path: an optional path of a file the buffered items are appended to, as lines of JSON. Once a
+        batch has been written, a line with the number of items written is appended; the file is rewritten with only
+        the buffered items once at least half of it has been written. Items left in the file when the process stops
+        are written with the first batch after a restart.
+    :param bool background: whether batches are written on a background thread. If ``False``, buffered items are
+        only written by :meth:`flush`, e.g. in tests or from a scheduled job.
+    """
+
+    def __init__(self, resource, max_size=500, max_delay=1.0, max_pending=100000, retry_delay=1.0,
+                 max_retry_delay=60.0, max_attempts=None, spool_path=None, background=True):
+        self.resource = resource
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.spool_path = spool_path
+        self.background = background
+
+        self._items = []
+        self._spooled = []
+        self._spool_written = 0
+        self._first_buffered_at = None
+        self._retry_at = None
+        self._attempts = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._app = None
+        self._closed = False
+
+        self._batches = 0
+        self._written = 0
+        self._errors = 0
+        self._failed = 0
+        self._last_flush_seconds = None
+        self._max_flush_seconds = 0
+
+    def append(self, items, data):
+        """
+        Buffers items to be created.
+
+        :param list items: the converted properties of each item
+        :param list data: the JSON representation of each item, for the spool file
+        :raises exceptions.BufferFull: if buffering the items would exceed ``max_pending``
+        """
+        with self._condition:
+            if self._app is None:
+                self._start(current_app._get_current_object())
+
+            if len(self._items) + len(items) > self.max_pending:
+                raise BufferFull()
+
+            if self.spool_path:
+                self._append_spool(data)
+                self._spooled.extend(data)
+
+            if not self._items:
+                self._first_buffered_at = time.time()
+            self._items.extend(items)
+
+            if len(self._items) >= self.max_size:
+                self._condition.notify()
+
+    def flush(self):
+        """
+        Writes all buffered items, e.g. before checking them in tests or before the application stops. Stops at the
+        first batch that fails to be written, which stays buffered.
+
+        :return: ``True`` if all items have been written
+        """
+        while self._flush_batch():
+            pass
+
+        with self._condition:
+            return not self._items
+
+    def close(self):
+        """
+        Writes all buffered items and stops the background thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def metrics(self):
+        """
+        :return: a dictionary with the number of buffered items (``depth``), the number of batches written, items
+            written, failed attempts to write a batch (``errors``) and items dropped after ``max_attempts`` or when
+            they could not be restored (``failed``), and the latest and longest time in seconds it took to write a
+            batch
+        """
+        with self._condition:
+            return {
+                "depth": len(self._items),
+                "batches": self._batches,
+                "written": self._written,
+                "errors": self._errors,
+                "failed": self._failed,
+                "last_flush_seconds": self._last_flush_seconds,
+                "max_flush_seconds": self._max_flush_seconds
+            }
+
+    def _start(self, app):
+        self._app = app
+
+        if self.spool_path and os.path.exists(self.spool_path):
+            self._restore()
+
+        if self.background:
+            self._thread = thread = threading.Thread(target=self._work,
+                                                     name='potion-write-behind-{}'.format(self.resource.meta.name))
+            thread.daemon = True
+            thread.start()
+        atexit.register(self.close)
+
+    def _restore(self):
+        with open(self.spool_path) as spool:
+            lines = [json.loads(line) for line in spool if line.strip()]
+
+        # numbers record how many of the items before them have been written
+        written = sum(line for line in lines if isinstance(line, int))
+        data = [line for line in lines if not isinstance(line, int)][written:]
+
+        with self._app.app_context():
+            for value in data:
+                try:
+                    self._items.append(self.resource.schema.convert(value))
+                    self._spooled.append(value)
+                except Exception:
+                    self._failed += 1
+                    self._app.logger.exception('Could not restore spooled {} item'.format(self.resource.meta.name))
+
+        self._rewrite_spool()
+
+        if self._items:
+            self._first_buffered_at = time.time()
+
+    def _append_spool(self, lines):
+        with open(self.spool_path, 'a') as spool:
+            for line in lines:
+                spool.write(json.dumps(line) + '\n')
+
+    def _rewrite_spool(self):
+        with open(self.spool_path, 'w') as spool:
+            for value in self._spooled:
+                spool.write(json.dumps(value) + '\n')
+        self._spool_written = 0
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._is_due():
+                    timeout = None
+                    if self._items:
+                        timeout = max(self._due_at() - time.time(), 0)
+                    self._condition.wait(timeout)
+
+                if self._closed:
+                    return
+
+            self._flush_batch(due_only=True)
+
+    def _due_at(self):
+        if self._retry_at is not None:
+            return self._retry_at
+        if len(self._items) >= self.max_size:
+            return 0
+        return self._first_buffered_at + self.max_delay
+
+    def _is_due(self):
+        return bool(self._items) and time.time() >= self._due_at()
+
+    def _flush_batch(self, due_only=False):
+        with self._flush_lock:
+            # items are only removed from the buffer once they have been written
+            with self._condition:
+                if due_only and not self._is_due():
+                    return False
+                batch = self._items[:self.max_size]
+
+            if not batch:
+                return False
+
+            started = time.time()
+            try:
+                with self._app.app_context():
+                    # the items have been checked with Manager.can_create_item() when they were buffered
+                    g.potion_write_behind = True
+                    self.resource.manager.create_many(batch)
+            except Exception:
+                failed = True
+                self._app.logger.exception('Could not write {} buffered {} items'.format(len(batch),
+                                                                                        self.resource.meta.name))
+            else:
+                failed = False
+            seconds = time.time() - started
+
+            with self._condition:
+                self._last_flush_seconds = seconds
+                self._max_flush_seconds = max(self._max_flush_seconds, seconds)
+
+                if failed:
+                    self._errors += 1
+                    self._attempts += 1
+
+                    if self.max_attempts is None or self._attempts < self.max_attempts:
+                        delay = min(self.retry_delay * 2 ** (self._attempts - 1), self.max_retry_delay)
+                        self._retry_at = time.time() + delay
+                        return False
+
+                    self._failed += len(batch)
+                    self._app.logger.error('Dropped {} buffered {} items after {} attempts'.format(
+                        len(batch), self.resource.meta.name, self._attempts))
+                else:
+                    self._batches += 1
+                    self._written += len(batch)
+
+                self._attempts = 0
+                self._retry_at = None
+                del self._items[:len(batch)]
+                self._first_buffered_at = time.time() if self._items else None
+
+                if self.spool_path:
+                    del self._spooled[:len(batch)]
+                    self._spool_written += len(batch)
+
+                    if self._spool_written >= len(self._spooled):
+                        self._rewrite_spool()
+                    else:
+                        self._append_spool([len(batch)])
+            return True
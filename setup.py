@@ -18,6 +18,7 @@ setup(
         'Flask-Testing>=0.4.1',
         'Flask-Principal>=0.4.0',
         'Flask-SQLAlchemy>=2.0',
+        'SQLAlchemy>=1.3,<2.0',
         'Flask-MongoEngine>=0.7.1',
         'peewee>=2.6.3',
         'nose>=1.1.2',
@@ -53,7 +54,8 @@ setup(
             'Flask-Principal',
         ],
         'sqlalchemy': [
-            'Flask-SQLAlchemy>=2.0'
+            'Flask-SQLAlchemy>=2.0',
+            'SQLAlchemy>=1.3,<2.0'
         ],
         'peewee': [
             'peewee>=2.6.3'
@@ -1,10 +1,18 @@
+import sqlite3
 import unittest
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import backref
-from flask_potion.routes import Relation
+from sqlalchemy import event
+from sqlalchemy.orm import backref, validates
+from sqlalchemy.dialects.postgresql.base import PGCompiler
+from sqlalchemy.dialects.sqlite.base import SQLiteCompiler
+from flask_potion.signals import before_add_to_relation, after_bulk_add_to_relation, after_bulk_remove_from_relation, \
+    after_create, after_update, after_bulk_delete
+from flask_potion.routes import Relation, Route, ItemRoute, ItemAttributeRoute
 from flask_potion.contrib.alchemy import SQLAlchemyManager
+from flask_potion.contrib.alchemy.manager import sqlite_insert
 from flask_potion import Api, fields
 from flask_potion.resource import ModelResource
+from flask_potion.schema import FieldSet
 from tests import BaseTestCase
 
 
@@ -207,6 +215,53 @@ class SQLAlchemyTestCase(BaseTestCase):
         self.assert200(response)
         self.assertJSONEqual({'$id': 1, '$type': 'machine', 'type': {"$ref": "/type/2"}, "wattage": 10000, "name": "Foo"}, response.json)
 
+    def test_facets(self):
+        for name in ("T1", "T2"):
+            response = self.client.post('/type', data={"name": name})
+            self.assert200(response)
+
+        for name, wattage, type_ in (("A", 100, 1), ("B", 100, 2), ("C", 200, 2), ("D", None, 2)):
+            response = self.client.post('/machine', data={"name": name, "wattage": wattage, "type": type_})
+            self.assert200(response)
+
+        response = self.client.get('/machine/facets?fields=["type", "wattage"]')
+        self.assert200(response)
+        self.assertJSONEqual({
+            "type": [
+                {"value": {"$ref": "/type/2"}, "count": 3},
+                {"value": {"$ref": "/type/1"}, "count": 1}
+            ],
+            "wattage": [
+                {"value": 100, "count": 2},
+                {"value": None, "count": 1},
+                {"value": 200, "count": 1}
+            ]
+        }, response.json)
+
+        response = self.client.get('/machine/facets?fields=["wattage"]&where={"type": 2}&limit=1')
+        self.assert200(response)
+        self.assertJSONEqual({"wattage": [{"value": None, "count": 1}]}, response.json)
+
+        response = self.client.get('/machine/facets?fields=["machines"]')
+        self.assert400(response)
+
+    def test_explain(self):
+        response = self.client.post('/type', data={"name": "T1"})
+        self.assert200(response)
+
+        response = self.client.get('/machine/explain?where={"type": 1, "name": {"$startswith": "R"}}&sort={"wattage": true}&per_page=5')
+        self.assert200(response)
+        self.assertIn('ORDER BY machine.wattage DESC', response.json['statement'])
+        self.assertEqual([1, 'R', 5, 0], response.json['parameters'])
+        self.assertTrue(response.json['plan'])
+
+        self.assertIn('explain', [link['rel'] for link in self.client.get('/machine/schema').json['links']])
+
+        self.app.debug = False
+        response = self.client.get('/machine/explain')
+        self.assert404(response)
+        self.assertNotIn('explain', [link['rel'] for link in self.client.get('/machine/schema').json['links']])
+
     def test_delete(self):
         response = self.client.delete('/type/1')
         self.assert404(response)
@@ -363,6 +418,802 @@ class SQLAlchemyRelationTestCase(BaseTestCase):
                          '</user/1/children?page=3&per_page=20>; rel="last"', response.headers['Link'])
 
 
+class SQLAlchemyQueryCountTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SQLAlchemyQueryCountTestCase, self).setUp()
+        self.app.config['SQLALCHEMY_ENGINE'] = 'sqlite://'
+        self.api = Api(self.app, batch=True)
+        self.sa = sa = SQLAlchemy(self.app, session_options={"autoflush": False})
+
+        book_tags = sa.Table('book_tags',
+                             sa.Column('book_id', sa.Integer(), sa.ForeignKey('book.id')),
+                             sa.Column('tag_id', sa.Integer(), sa.ForeignKey('tag.id')))
+
+        class Author(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String(60), nullable=False)
+
+        class Tag(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String(60), nullable=False)
+
+        class Book(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            title = sa.Column(sa.String(60), nullable=False)
+            author_id = sa.Column(sa.Integer, sa.ForeignKey(Author.id))
+            author = sa.relationship(Author, backref='books')
+            tags = sa.relationship(Tag, secondary=book_tags, backref='books')
+
+        sa.create_all()
+
+        class AuthorResource(ModelResource):
+            books = Relation('book')
+
+            class Meta:
+                model = Author
+                bulk_delete = True
+
+        class TagResource(ModelResource):
+            books = Relation('book')
+
+            class Meta:
+                model = Tag
+
+        class BookResource(ModelResource):
+            class Meta:
+                model = Book
+                bulk_update = True
+                bulk_delete = True
+
+            class Schema:
+                author = fields.ToOne('author')
+                tags = fields.ToMany('tag')
+
+        self.BookResource = BookResource
+        self.api.add_resource(BookResource)
+        self.api.add_resource(AuthorResource)
+        self.api.add_resource(TagResource)
+
+        tags = [Tag(name='tag-{}'.format(i)) for i in range(3)]
+        for i in range(10):
+            sa.session.add(Book(title='book-{}'.format(i),
+                                author=Author(name='author-{}'.format(i)),
+                                tags=tags[:i % 3 + 1]))
+        sa.session.commit()
+        sa.session.expunge_all()
+
+        self.statements = []
+
+        @event.listens_for(sa.engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, *args):
+            self.statements.append(statement)
+
+    def tearDown(self):
+        self.sa.drop_all()
+
+    def _count_statements(self, url):
+        self.sa.session.expunge_all()
+        self.statements = []
+        response = self.client.get(url)
+        self.assert200(response)
+        return len(self.statements), response.json
+
+    def test_embed(self):
+        count_5, books = self._count_statements('/book?per_page=5&embed=author,tags')
+        # the order of the embedded tags is not defined by the relationship
+        tags = sorted(books[1].pop("tags"), key=lambda tag: tag["$uri"])
+        self.assertJSONEqual({
+            "$uri": "/book/2",
+            "title": "book-1",
+            "author": {"$uri": "/author/2", "name": "author-1"}
+        }, books[1])
+        self.assertJSONEqual([{"$uri": "/tag/1", "name": "tag-0"}, {"$uri": "/tag/2", "name": "tag-1"}], tags)
+
+        count_10, books = self._count_statements('/book?per_page=10&embed=author,tags')
+        self.assertEqual(10, len(books))
+        self.assertEqual(count_5, count_10)
+
+        count_10, books = self._count_statements('/book?per_page=10&embed=author')
+        self.assertJSONEqual({"$ref": "/tag/1"}, books[0]["tags"][0])
+        self.assertEqual(count_5, count_10)
+
+        response = self.client.get('/book?embed=title')
+        self.assert400(response)
+
+    def test_to_one_formatted_from_foreign_key(self):
+        count, books = self._count_statements('/book?per_page=10')
+        self.assertEqual([{"$ref": "/author/{}".format(i)} for i in range(1, 11)], [book["author"] for book in books])
+        self.assertFalse([statement for statement in self.statements if 'FROM author' in statement])
+
+    def test_to_many_ids_read_for_page(self):
+        count_5, books = self._count_statements('/book?per_page=5')
+        count_10, books = self._count_statements('/book?per_page=10')
+        self.assertEqual(count_5, count_10)
+        self.assertEqual([["/tag/{}".format(t) for t in range(1, i % 3 + 2)] for i in range(10)],
+                         [sorted(tag["$ref"] for tag in book["tags"]) for book in books])
+        self.assertFalse([statement for statement in self.statements if 'tag.name' in statement])
+
+    def test_relation_page_read_with_limit(self):
+        self.sa.session.expunge_all()
+        self.statements = []
+        response = self.client.get('/tag/1/books?page=2&per_page=3')
+        self.assert200(response)
+        self.assertEqual('10', response.headers['X-Total-Count'])
+        self.assertJSONEqual([{"$ref": "/book/4"}, {"$ref": "/book/5"}, {"$ref": "/book/6"}], response.json)
+
+        # one statement for the page and one for the count; the collection itself is never loaded:
+        book_statements = [statement for statement in self.statements if 'book.title' in statement]
+        self.assertEqual(2, len(book_statements))
+        self.assertEqual(1, len([statement for statement in book_statements if 'LIMIT' in statement]))
+        self.assertEqual(1, len([statement for statement in book_statements if 'count(' in statement]))
+
+    def test_relation_where_and_sort(self):
+        response = self.client.get('/tag/2/books?where={"title": {"$in": ["book-1", "book-2", "book-5"]}}'
+                                   '&sort={"title": true}&per_page=2')
+        self.assert200(response)
+        self.assertEqual('3', response.headers['X-Total-Count'])
+        self.assertJSONEqual([{"$ref": "/book/6"}, {"$ref": "/book/3"}], response.json)
+
+    def test_relation_add_and_remove_many(self):
+        received = []
+
+        @before_add_to_relation.connect
+        def before_add(sender, item, attribute, child):
+            received.append(('add', child))
+
+        @after_bulk_add_to_relation.connect
+        def after_bulk_add(sender, item, attribute, child_ids):
+            received.append(('bulk_add', child_ids))
+
+        @after_bulk_remove_from_relation.connect
+        def after_bulk_remove(sender, item, attribute, child_ids):
+            received.append(('bulk_remove', child_ids))
+
+        self.sa.session.expunge_all()
+        self.statements = []
+        response = self.client.post('/tag/3/books', data=[{"$ref": "/book/1"}, 2, {"$ref": "/book/3"}])
+        self.assert200(response)
+        self.assertJSONEqual([{"$ref": "/book/1"}, {"$ref": "/book/2"}, {"$ref": "/book/3"}], response.json)
+        self.assertEqual(1, len([statement for statement in self.statements if statement.startswith('INSERT')]))
+        self.assertFalse([statement for statement in self.statements if 'book.title' in statement])
+
+        response = self.client.get('/tag/3/books')
+        self.assertEqual([{"$ref": "/book/{}".format(i)} for i in (1, 2, 3, 6, 9)], response.json)
+
+        response = self.client.delete('/tag/3/books', data=[1, 3])
+        self.assertStatus(response, 204)
+
+        response = self.client.get('/tag/3/books')
+        self.assertEqual([{"$ref": "/book/{}".format(i)} for i in (2, 6, 9)], response.json)
+        self.assertEqual([('bulk_add', [1, 2, 3]), ('bulk_remove', [1, 3])], received)
+
+        response = self.client.post('/tag/3/books', data=[1, 999])
+        self.assert404(response)
+
+        response = self.client.get('/tag/3/books')
+        self.assertEqual([{"$ref": "/book/{}".format(i)} for i in (2, 6, 9)], response.json)
+
+        before_add_to_relation.disconnect(before_add)
+        after_bulk_add_to_relation.disconnect(after_bulk_add)
+        after_bulk_remove_from_relation.disconnect(after_bulk_remove)
+
+    def test_relation_add_and_remove_many_foreign_key(self):
+        response = self.client.post('/author/1/books', data=[2, 3])
+        self.assert200(response)
+
+        response = self.client.get('/author/1/books')
+        self.assertEqual([{"$ref": "/book/{}".format(i)} for i in (1, 2, 3)], response.json)
+
+        response = self.client.delete('/author/1/books', data=[{"$ref": "/book/1"}, {"$ref": "/book/3"}])
+        self.assertStatus(response, 204)
+
+        response = self.client.get('/author/1/books')
+        self.assertEqual([{"$ref": "/book/2"}], response.json)
+
+        response = self.client.get('/book/3')
+        self.assertJSONEqual(None, response.json['author'])
+
+    def test_update_to_many_add_and_remove(self):
+        self.sa.session.expunge_all()
+        self.statements = []
+        response = self.client.patch('/book/3', data={"tags": {"$add": [{"$ref": "/tag/1"}], "$remove": [2, 3]}})
+        self.assert200(response)
+        self.assertJSONEqual([{"$ref": "/tag/1"}], response.json["tags"])
+
+        writes = [statement for statement in self.statements if statement.startswith(('INSERT', 'DELETE'))]
+        self.assertEqual(['DELETE', 'INSERT'], [statement.split()[0] for statement in writes])
+
+        response = self.client.get('/tag/2/books')
+        self.assertNotIn({"$ref": "/book/3"}, response.json)
+
+    def test_create_many(self):
+        created = []
+
+        @after_create.connect_via(self.BookResource)
+        def on_after_create(sender, item):
+            created.append(item.id)
+
+        response = self.client.post('/book', data=[
+            {"title": "New 1", "author": 1, "tags": [1, 2]},
+            {"title": "New 2", "author": {"$ref": "/author/2"}, "tags": []}
+        ])
+        self.assert200(response)
+        self.assertJSONEqual([
+            {"$uri": "/book/11", "title": "New 1", "author": {"$ref": "/author/1"},
+             "tags": [{"$ref": "/tag/1"}, {"$ref": "/tag/2"}]},
+            {"$uri": "/book/12", "title": "New 2", "author": {"$ref": "/author/2"}, "tags": []}
+        ], response.json)
+        self.assertEqual([11, 12], created)
+
+        response = self.client.post('/book', data=[
+            {"title": "New 3", "author": 1},
+            {"title": None, "author": 1}
+        ])
+        self.assert400(response)
+
+        after_create.disconnect(on_after_create)
+        self.assertEqual('12', self.client.get('/book').headers['X-Total-Count'])
+
+    def test_bulk_update(self):
+        self.statements = []
+        response = self.client.patch('/book?where={"tags": {"$contains": {"$ref": "/tag/3"}}}',
+                                     data={"author": 1, "title": "changed"})
+        self.assert200(response)
+        self.assertEqual({"count": 3}, response.json)
+        self.assertEqual(1, len([s for s in self.statements if s.startswith('UPDATE')]))
+        self.assertEqual([], [s for s in self.statements if s.startswith('SELECT') and 'FROM book' in s])
+
+        response = self.client.get('/book?where={"title": "changed"}')
+        self.assertEqual(['/book/3', '/book/6', '/book/9'], [book['$uri'] for book in response.json])
+        self.assertEqual([{"$ref": "/author/1"}] * 3, [book['author'] for book in response.json])
+
+        updated = []
+
+        @after_update.connect_via(self.BookResource)
+        def on_after_update(sender, item, changes):
+            updated.append(item.id)
+
+        response = self.client.patch('/book?where={"title": "changed"}', data={"title": "changed again"})
+        after_update.disconnect(on_after_update)
+        self.assertEqual({"count": 3}, response.json)
+        self.assertEqual([3, 6, 9], sorted(updated))
+
+    def test_bulk_delete(self):
+        deleted = []
+
+        @after_bulk_delete.connect_via(self.BookResource)
+        def on_after_bulk_delete(sender, ids):
+            deleted.append(ids)
+
+        self.statements = []
+        response = self.client.delete('/book?where={"tags": {"$contains": {"$ref": "/tag/3"}}}&limit=2')
+        self.assert200(response)
+        self.assertEqual({"count": 2}, response.json)
+        self.assertEqual([[3, 6]], deleted)
+        self.assertEqual(['DELETE FROM book_tags', 'DELETE FROM book'],
+                         [s.split(' WHERE')[0] for s in self.statements if s.startswith('DELETE')])
+
+        response = self.client.delete('/book?where={"tags": {"$contains": {"$ref": "/tag/3"}}}')
+        self.assertEqual({"count": 1}, response.json)
+        after_bulk_delete.disconnect(on_after_bulk_delete)
+
+        self.assertEqual('7', self.client.get('/book').headers['X-Total-Count'])
+        self.assertEqual(10, self.sa.session.execute('SELECT COUNT(*) FROM book_tags').scalar())
+
+        self.assert400(self.client.delete('/book'))
+
+        # authors are deleted through the session, which sets the author of their books to null
+        response = self.client.delete('/author?where={"name": {"$in": ["author-0", "author-1"]}}')
+        self.assertEqual({"count": 2}, response.json)
+        self.assertEqual(None, self.client.get('/book/1').json['author'])
+
+    def test_bulk_delete_without_reading_ids(self):
+        self.statements = []
+        response = self.client.delete('/book?where={"title": {"$in": ["book-0", "book-1"]}}')
+        self.assertEqual({"count": 2}, response.json)
+        # without a limit or bulk delete receivers, the items are deleted with their rows in book_tags by subquery
+        self.assertEqual(['DELETE FROM book_tags', 'DELETE FROM book'], [s.split(' WHERE')[0] for s in self.statements])
+
+        # a condition on book_tags is evaluated before its rows are deleted
+        self.statements = []
+        response = self.client.delete('/book?where={"tags": {"$contains": {"$ref": "/tag/3"}}}')
+        self.assertEqual({"count": 3}, response.json)
+        self.assertEqual(['SELECT tag.id', 'SELECT book.id', 'DELETE FROM book_tags', 'DELETE FROM book'],
+                         [s.split(' AS')[0].split(' WHERE')[0] for s in self.statements])
+        self.assertEqual('5', self.client.get('/book').headers['X-Total-Count'])
+
+        deleted = []
+
+        @after_bulk_delete.connect_via(self.BookResource)
+        def on_after_bulk_delete(sender, ids):
+            deleted.append(ids)
+
+        self.BookResource.manager.IDS_PER_STATEMENT = 3
+        self.addCleanup(delattr, self.BookResource.manager, 'IDS_PER_STATEMENT')
+
+        self.statements = []
+        response = self.client.delete('/book?where={"title": {"$startswith": "book"}}')
+        after_bulk_delete.disconnect(on_after_bulk_delete)
+        self.assertEqual({"count": 5}, response.json)
+        self.assertEqual([[4, 5, 7, 8, 10]], deleted)
+        self.assertEqual(2, len([s for s in self.statements if s.startswith('DELETE FROM book ')]))
+
+    def test_create_and_update_without_refresh(self):
+        self.statements = []
+        response = self.client.post('/book', data={"title": "book-10", "author": {"$ref": "/author/1"}})
+        self.assert200(response)
+        self.assertJSONEqual({"$uri": "/book/11", "title": "book-10",
+                              "author": {"$ref": "/author/1"}, "tags": []}, response.json)
+        self.assertEqual(2, len(self.statements))
+        self.assertTrue(self.statements[0].startswith('SELECT author'))
+        self.assertTrue(self.statements[1].startswith('INSERT INTO book'))
+
+        @after_update.connect_via(self.BookResource)
+        def on_after_update(sender, item, changes):
+            pass
+
+        self.sa.session.expunge_all()
+        self.statements = []
+        response = self.client.patch('/book/11', data={"title": "book-eleven"})
+        self.assert200(response)
+        self.assertEqual("book-eleven", response.json["title"])
+        # the book is read once, before it is updated
+        self.assertEqual(1, len([statement for statement in self.statements if 'FROM book' in statement]))
+        self.assertTrue(self.statements[-2].startswith('UPDATE book'))
+
+    def test_update_by_id(self):
+        self.statements = []
+        response = self.client.patch('/book/1', data={"title": "book-zero", "author": {"$ref": "/author/2"}})
+        self.assert200(response)
+        self.assertJSONEqual({"$uri": "/book/1", "title": "book-zero",
+                              "author": {"$ref": "/author/2"}, "tags": [{"$ref": "/tag/1"}]}, response.json)
+        # the author reference is resolved first; the book is not read before it is updated
+        self.assertTrue(self.statements[0].startswith('SELECT author'))
+        self.assertTrue(self.statements[1].startswith('UPDATE book'))
+
+        self.assert404(self.client.patch('/book/100', data={"title": "book-100"}))
+
+        received = []
+
+        @after_update.connect_via(self.BookResource)
+        def on_after_update(sender, item, changes):
+            received.append(changes)
+
+        self.assert200(self.client.patch('/book/2', data={"title": "book-one"}))
+        self.assertEqual([{"title": "book-one"}], received)
+
+    def test_update_by_id_with_validators_and_events(self):
+        sa = self.sa
+
+        class Publisher(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String(60), nullable=False)
+
+            @validates('name')
+            def validate_name(self, key, name):
+                return name.strip()
+
+        sa.create_all()
+
+        class PublisherResource(ModelResource):
+            class Meta:
+                model = Publisher
+
+        self.api.add_resource(PublisherResource)
+        self.assert200(self.client.post('/publisher', data={"name": "Foo"}))
+
+        # the item is read and changed so that the validator is applied
+        self.statements = []
+        response = self.client.patch('/publisher/1', data={"name": " Bar "})
+        self.assertJSONEqual({"$uri": "/publisher/1", "name": "Bar"}, response.json)
+        self.assertTrue(self.statements[0].startswith('SELECT publisher'))
+
+        Book = self.BookResource.meta.model
+
+        def on_set_title(target, value, oldvalue, initiator):
+            return value.upper()
+
+        event.listen(Book.title, 'set', on_set_title, retval=True)
+        self.addCleanup(event.remove, Book.title, 'set', on_set_title)
+
+        response = self.client.patch('/book/1', data={"title": "book-zero"})
+        self.assertEqual("BOOK-ZERO", response.json['title'])
+        self.assertEqual("BOOK-ZERO", self.client.get('/book/1').json['title'])
+
+    def test_update_by_id_returning(self):
+        # SQLite has RETURNING from 3.35 on, but the SQLite dialect of SQLAlchemy < 2.0 does not compile it
+        if sqlite3.sqlite_version_info < (3, 35):
+            raise unittest.SkipTest('SQLite {} does not support RETURNING'.format(sqlite3.sqlite_version))
+
+        dialect = self.sa.engine.dialect
+        dialect.full_returning = True
+        self.addCleanup(delattr, dialect, 'full_returning')
+        SQLiteCompiler.returning_clause = PGCompiler.returning_clause
+        self.addCleanup(delattr, SQLiteCompiler, 'returning_clause')
+
+        self.statements = []
+        response = self.client.patch('/book/1', data={"title": "book-zero"})
+        self.assert200(response)
+        self.assertJSONEqual({"$uri": "/book/1", "title": "book-zero",
+                              "author": {"$ref": "/author/1"}, "tags": [{"$ref": "/tag/1"}]}, response.json)
+        # the book is updated and read with the same statement
+        self.assertTrue(self.statements[0].startswith('UPDATE book'))
+        self.assertIn('RETURNING', self.statements[0])
+        self.assertEqual(0, len([statement for statement in self.statements if statement.startswith('SELECT book')]))
+
+        self.assert404(self.client.patch('/book/100', data={"title": "book-100"}))
+
+    def test_delete_by_id(self):
+        self.statements = []
+        self.assertStatus(self.client.delete('/book/1'), 204)
+        self.assertEqual(['DELETE FROM book_tags', 'DELETE FROM book'],
+                         [statement.split(' WHERE')[0] for statement in self.statements])
+
+        self.assert404(self.client.get('/book/1'))
+        self.assert404(self.client.delete('/book/1'))
+        self.assertEqual(0, self.sa.session.execute('SELECT COUNT(*) FROM book_tags WHERE book_id = 1').scalar())
+
+    def test_batch_atomic(self):
+        response = self.client.post('/batch', data={"requests": [
+            {"method": "POST", "path": "/book", "body": {"title": "New", "author": 1}},
+            {"method": "POST", "path": "/tag/1/books", "body": [11]},
+            {"method": "PATCH", "path": "/book/11", "body": {"title": None}}
+        ], "atomic": True})
+        self.assert400(response)
+        self.assertEqual([200, 200, 400], [r["status"] for r in response.json])
+        self.assertEqual('10', self.client.get('/book').headers['X-Total-Count'])
+        self.assertEqual('10', self.client.get('/tag/1/books').headers['X-Total-Count'])
+
+        response = self.client.post('/batch', data={"requests": [
+            {"method": "POST", "path": "/book", "body": {"title": "New", "author": 1}},
+            {"method": "POST", "path": "/tag/1/books", "body": [11]},
+            {"method": "GET", "path": "/book/11"}
+        ], "atomic": True})
+        self.assert200(response)
+        self.assertEqual([{"$ref": "/tag/1"}], response.json[2]["body"]["tags"])
+        self.assertEqual('11', self.client.get('/book').headers['X-Total-Count'])
+
+    def test_create_resolves_references_in_bulk(self):
+        self.statements = []
+        response = self.client.post('/book', data={
+            "title": "book-10",
+            "author": 1,
+            "tags": [{"$ref": "/tag/3"}, 1, {"$ref": "/tag/2"}]
+        })
+        self.assert200(response)
+        self.assertJSONEqual({
+            "$uri": "/book/11",
+            "title": "book-10",
+            "author": {"$ref": "/author/1"},
+            "tags": [{"$ref": "/tag/3"}, {"$ref": "/tag/1"}, {"$ref": "/tag/2"}]
+        }, response.json)
+        self.assertEqual(2, len([statement for statement in self.statements
+                                 if statement.startswith('SELECT') and 'IN' in statement]))
+
+        response = self.client.post('/book', data={"title": "book-11", "author": 1, "tags": [1, 42, 2]})
+        self.assert404(response)
+        self.assertJSONEqual({
+            'item': {'$id': 42, '$type': 'tag'},
+            'message': 'Not Found',
+            'status': 404
+        }, response.json)
+
+    def test_meta_eager_load(self):
+        class EagerBookResource(ModelResource):
+            class Meta:
+                name = 'eager-book'
+                model = self.BookResource.meta.model
+                eager_load = ('author', 'tags')
+
+            class Schema:
+                author = fields.ToOne('author')
+                tags = fields.ToMany('tag')
+
+        self.api.add_resource(EagerBookResource)
+
+        count_5, books = self._count_statements('/eager-book?per_page=5')
+        self.assertJSONEqual({"$uri": "/eager-book/1", "title": "book-0",
+                              "author": {"$ref": "/author/1"}, "tags": [{"$ref": "/tag/1"}]}, books[0])
+
+        count_10, books = self._count_statements('/eager-book?per_page=10')
+        self.assertEqual(count_5, count_10)
+
+
+    def test_upsert(self):
+        sa = self.sa
+
+        class Country(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            code = sa.Column(sa.String(2), nullable=False, unique=True)
+            name = sa.Column(sa.String(60))
+
+        sa.create_all()
+
+        class CountryResource(ModelResource):
+            class Meta:
+                model = Country
+                natural_key = 'code'
+
+        self.api.add_resource(CountryResource)
+
+        response = self.client.put('/country', data={"code": "DE", "name": "Germany"})
+        self.assert200(response)
+        self.assertJSONEqual({"$uri": "/country/1", "code": "DE", "name": "Germany"}, response.json)
+
+        self.sa.session.expunge_all()
+        self.statements = []
+        response = self.client.put('/country', data=[
+            {"code": "FR", "name": "France"},
+            {"code": "DE", "name": "Deutschland"}
+        ])
+        self.assert200(response)
+        self.assertJSONEqual([
+            {"$uri": "/country/2", "code": "FR", "name": "France"},
+            {"$uri": "/country/1", "code": "DE", "name": "Deutschland"}
+        ], response.json)
+
+        # SQLAlchemy < 1.4 has no INSERT ... ON CONFLICT for SQLite, so items are then looked up and written one by one
+        if sqlite_insert is not None:
+            self.assertEqual(1, len([s for s in self.statements if 'ON CONFLICT' in s]))
+            self.assertEqual(2, len(self.statements))
+
+    def test_upsert_version(self):
+        sa = self.sa
+
+        class Country(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            code = sa.Column(sa.String(2), nullable=False, unique=True)
+            name = sa.Column(sa.String(60))
+            version = sa.Column(sa.Integer, nullable=False)
+
+        sa.create_all()
+
+        class CountryResource(ModelResource):
+            class Meta:
+                model = Country
+                natural_key = 'code'
+                version_attribute = 'version'
+
+        self.api.add_resource(CountryResource)
+
+        response = self.client.put('/country', data={"code": "DE", "name": "Germany"})
+        self.assert200(response)
+        self.assertJSONEqual({"$uri": "/country/1", "code": "DE", "name": "Germany", "version": 1}, response.json)
+
+        response = self.client.put('/country', data=[
+            {"code": "FR", "name": "France"},
+            {"code": "DE", "name": "Deutschland"}
+        ])
+        self.assert200(response)
+        self.assertJSONEqual([
+            {"$uri": "/country/2", "code": "FR", "name": "France", "version": 1},
+            {"$uri": "/country/1", "code": "DE", "name": "Deutschland", "version": 2}
+        ], response.json)
+
+    def test_if_match_version(self):
+        sa = self.sa
+
+        class Document(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            title = sa.Column(sa.String(60))
+            # the initial version is set by the manager
+            version = sa.Column(sa.Integer, nullable=False)
+
+        sa.create_all()
+
+        class DocumentResource(ModelResource):
+            class Meta:
+                model = Document
+                version_attribute = 'version'
+
+        self.api.add_resource(DocumentResource)
+
+        response = self.client.post('/document', data={"title": "Draft"})
+        self.assert200(response)
+        self.assertEqual('"1"', response.headers['ETag'])
+        self.assertJSONEqual({"$uri": "/document/1", "title": "Draft", "version": 1}, response.json)
+
+        self.statements = []
+        response = self.client.patch('/document/1', data={"title": "Final"}, headers=[('If-Match', '"1"')])
+        self.assert200(response)
+        self.assertEqual('"2"', response.headers['ETag'])
+        self.assertJSONEqual({"$uri": "/document/1", "title": "Final", "version": 2}, response.json)
+        # the version is compared in the UPDATE statement itself, not read beforehand
+        self.assertTrue(self.statements[0].startswith('UPDATE document'))
+        self.assertIn('document.version = ?', self.statements[0])
+
+        self.assertStatus(self.client.patch('/document/1', data={"title": "Lost"}, headers=[('If-Match', '"1"')]), 412)
+        self.assertStatus(self.client.patch('/document/1', data={"title": "Lost"}, headers=[('If-Match', '"x"')]), 412)
+        self.assertStatus(self.client.patch('/document/1', data={"title": "Lost"},
+                                            headers=[('If-Match', '"2", "1"')]), 412)
+        self.assert404(self.client.patch('/document/2', data={"title": "Lost"}, headers=[('If-Match', '"1"')]))
+        self.assertStatus(self.client.delete('/document/1', headers=[('If-Match', '"1"')]), 412)
+        self.assertJSONEqual({"$uri": "/document/1", "title": "Final", "version": 2},
+                             self.client.get('/document/1').json)
+
+        self.assertStatus(self.client.delete('/document/1', headers=[('If-Match', '"2"')]), 204)
+        self.assert404(self.client.get('/document/1'))
+
+    def test_attribute_route_increment(self):
+        sa = self.sa
+
+        class Page(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            views = sa.Column(sa.Integer, nullable=False, default=0)
+
+        sa.create_all()
+
+        class PageResource(ModelResource):
+            views = ItemAttributeRoute(fields.Integer())
+
+            class Meta:
+                model = Page
+
+        self.api.add_resource(PageResource)
+        self.client.post('/page', data={})
+
+        self.statements = []
+        response = self.client.post('/page/1/views', data={"$inc": 2})
+        self.assert200(response)
+        self.assertEqual(2, response.json)
+        # the counter is incremented in the UPDATE statement, without reading it first
+        self.assertTrue(self.statements[0].startswith('UPDATE page SET views=(page.views + ?)'))
+
+        self.assertEqual(5, self.client.post('/page/1/views', data={"$inc": 3}).json)
+        self.assert404(self.client.post('/page/2/views', data={"$inc": 1}))
+
+    def test_item_attributes(self):
+        sa = self.sa
+
+        class Page(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            title = sa.Column(sa.String(60))
+            body = sa.Column(sa.Text)
+
+        sa.create_all()
+
+        class PageResource(ModelResource):
+            title = ItemAttributeRoute(fields.String())
+
+            @ItemRoute.GET('/summary', item_attributes=('title', 'body'))
+            def summary(self, item):
+                return {"title": item.title, "length": len(item.body)}
+
+            summary.response_schema = fields.Object({"title": fields.String(), "length": fields.Integer()})
+
+            class Meta:
+                model = Page
+
+        self.api.add_resource(PageResource)
+        self.client.post('/page', data={"title": "Home", "body": "Welcome"})
+
+        self.sa.session.expunge_all()
+        self.statements = []
+        response = self.client.get('/page/1/title')
+        self.assert200(response)
+        self.assertEqual("Home", response.json)
+        self.assertEqual(1, len(self.statements))
+        self.assertTrue(self.statements[0].startswith('SELECT page.id AS page_id, page.title AS page_title \nFROM page'))
+
+        self.sa.session.expunge_all()
+        self.statements = []
+        response = self.client.get('/page/1/summary')
+        self.assert200(response)
+        self.assertEqual({"title": "Home", "length": 7}, response.json)
+        self.assertEqual(1, len(self.statements))
+
+        self.assert404(self.client.get('/page/2/title'))
+
+
+class SQLAlchemyUnitOfWorkTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SQLAlchemyUnitOfWorkTestCase, self).setUp()
+        self.app.config['SQLALCHEMY_ENGINE'] = 'sqlite://'
+        self.api = Api(self.app, unit_of_work=True, batch=True)
+        self.sa = sa = SQLAlchemy(self.app, session_options={"autoflush": False})
+
+        class Author(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String(60), nullable=False)
+
+        sa.create_all()
+
+        class AuthorResource(ModelResource):
+            class Meta:
+                model = Author
+
+            @Route.POST('/pair', rel="createPair", schema=FieldSet({"name": fields.String()}))
+            def create_pair(self, name):
+                return [self.manager.create({"name": name}), self.manager.create({"name": name + "-2"})]
+
+            create_pair.response_schema = fields.List(fields.Inline('self'))
+
+            @Route.POST('/broken-pair', rel="createBrokenPair", schema=FieldSet({"name": fields.String()}))
+            def create_broken_pair(self, name):
+                self.manager.create({"name": name})
+                self.manager.create({"name": None})
+                return 2
+
+            create_broken_pair.response_schema = fields.Integer()
+
+        self.AuthorResource = AuthorResource
+        self.api.add_resource(AuthorResource)
+
+        self.events = []
+
+        @event.listens_for(sa.engine, 'commit')
+        def on_commit(conn):
+            self.events.append('commit')
+
+    def tearDown(self):
+        self.sa.drop_all()
+
+    def test_single_commit(self):
+        @after_create.connect_via(self.AuthorResource)
+        def on_after_create(sender, item):
+            self.events.append(item.name)
+
+        response = self.client.post('/author/pair', data={"name": "Jane"})
+        self.assert200(response)
+        self.assertJSONEqual([{"$uri": "/author/1", "name": "Jane"},
+                              {"$uri": "/author/2", "name": "Jane-2"}], response.json)
+        self.assertEqual(['commit', 'Jane', 'Jane-2'], self.events)
+
+        self.events = []
+        self.assert200(self.client.patch('/author/1', data={"name": "Joe"}))
+        self.assertEqual(['commit'], self.events)
+
+    def test_rollback(self):
+        @after_create.connect_via(self.AuthorResource)
+        def on_after_create(sender, item):
+            self.events.append(item.name)
+
+        response = self.client.post('/author/broken-pair', data={"name": "Jane"})
+        self.assertStatus(response, 409)
+        self.assertEqual([], self.events)
+        self.assertEqual([], self.client.get('/author').json)
+
+        self.assertStatus(self.client.post('/author', data={"name": None}), 400)
+        self.assert200(self.client.post('/author', data={"name": "John"}))
+        self.assertEqual(['commit', 'John'], self.events)
+
+    def test_commit_failure(self):
+        @after_create.connect_via(self.AuthorResource)
+        def on_after_create(sender, item):
+            self.events.append(item.name)
+
+        @event.listens_for(self.sa.engine, 'rollback')
+        def on_rollback(conn):
+            self.events.append('rollback')
+
+        def commit():
+            raise RuntimeError('commit failed')
+
+        self.AuthorResource.manager.commit = commit
+        with self.assertRaises(RuntimeError):
+            self.client.post('/author', data={"name": "Jane"})
+        self.assertEqual(['rollback'], self.events[:1])
+
+        del self.AuthorResource.manager.commit
+        self.events = []
+        self.assert200(self.client.post('/author', data={"name": "John"}))
+        self.assertEqual(['commit', 'John'], self.events)
+        self.assertEqual(['John'], [author['name'] for author in self.client.get('/author').json])
+
+    def test_batch_sub_request_transactions(self):
+        response = self.client.post('/batch', data=[
+            {"method": "POST", "path": "/author/pair", "body": {"name": "Jane"}},
+            {"method": "POST", "path": "/author/broken-pair", "body": {"name": "John"}},
+            {"method": "POST", "path": "/author", "body": {"name": "Joe"}}
+        ])
+        self.assert200(response)
+        self.assertEqual([200, 409, 200], [r["status"] for r in response.json])
+        self.assertEqual(['commit', 'commit'], self.events)
+        self.assertEqual(['Jane', 'Jane-2', 'Joe'], [author['name'] for author in self.client.get('/author').json])
+
+
 class SQLAlchemyInspectionTestCase(BaseTestCase):
 
     def setUp(self):
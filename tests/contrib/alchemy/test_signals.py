@@ -1,5 +1,7 @@
+import threading
 from functools import partial
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect
 from sqlalchemy.orm import backref
 from flask_potion import fields
 from flask_potion import signals
@@ -167,4 +169,115 @@ class SQLAlchemySignalTestCase(BaseTestCase):
             self.assert200(response)
 
             response = self.client.delete('/user/1/children/2')
-            self.assertStatus(response, 204)
\ No newline at end of file
+            self.assertStatus(response, 204)
+
+class SQLAlchemyAsyncDispatcherTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SQLAlchemyAsyncDispatcherTestCase, self).setUp()
+        self.app.config['SQLALCHEMY_ENGINE'] = 'sqlite://'
+        self.errors = []
+        self.dispatcher = signals.AsyncDispatcher(
+            workers=2, on_error=lambda signal, sender, receiver, e: self.errors.append(e))
+        self.api = Api(self.app, signal_dispatcher=self.dispatcher)
+        self.sa = sa = SQLAlchemy(self.app)
+
+        class User(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String(60), nullable=False)
+
+        sa.create_all()
+
+        class UserResource(ModelResource):
+            class Meta:
+                model = User
+
+        self.User = User
+        self.UserResource = UserResource
+        self.api.add_resource(UserResource)
+
+    def tearDown(self):
+        self.dispatcher.shutdown()
+        self.sa.drop_all()
+
+    def test_after_signals_dispatched(self):
+        main_thread = threading.current_thread()
+        events = []
+
+        @signals.before_create.connect_via(self.UserResource)
+        def before_create(sender, item):
+            events.append(('before_create', item.name, threading.current_thread() is main_thread))
+
+        @signals.after_create.connect_via(self.UserResource)
+        def after_create(sender, item):
+            # the item is a detached snapshot, which the request cannot change while it is received
+            self.assertTrue(inspect(item).transient)
+            events.append(('after_create', item.id, item.name, threading.current_thread() is main_thread))
+
+        @signals.after_update.connect_via(self.UserResource)
+        def after_update(sender, item, changes):
+            raise RuntimeError('receiver failed')
+
+        self.assert200(self.client.post('/user', data={"name": "Foo"}))
+        self.assert200(self.client.patch('/user/1', data={"name": "Bar"}))
+        self.dispatcher.flush()
+
+        self.assertEqual([('before_create', 'Foo', True), ('after_create', 1, 'Foo', False)], events)
+        self.assertEqual(['receiver failed'], [str(e) for e in self.errors])
+
+    def test_snapshot(self):
+        user = self.User(name='Foo')
+        self.sa.session.add(user)
+        self.sa.session.commit()
+
+        # the user has been expired on commit and is loaded again for the snapshot
+        snapshot = self.UserResource.manager.snapshot(user)
+        self.assertTrue(inspect(snapshot).transient)
+        self.assertEqual((1, 'Foo'), (snapshot.id, snapshot.name))
+
+        user.name = 'Bar'
+        self.assertEqual('Foo', snapshot.name)
+        self.assertEqual({"name": "Bar"}, self.UserResource.manager.snapshot({"name": "Bar"}))
+
+    def test_to_many_changes_snapshot(self):
+        sa = self.sa
+
+        team_members = sa.Table('team_members',
+                                sa.Column('team_id', sa.Integer(), sa.ForeignKey('team.id')),
+                                sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id')))
+
+        class Team(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            members = sa.relationship(self.User, secondary=team_members)
+
+        sa.create_all()
+
+        class TeamResource(ModelResource):
+            class Schema:
+                members = fields.ToMany('user')
+
+            class Meta:
+                model = Team
+
+        self.api.add_resource(TeamResource)
+        received = []
+
+        @signals.after_update.connect_via(TeamResource)
+        def after_update(sender, item, changes):
+            received.append(changes['members'])
+
+        for name in ('Foo', 'Bar'):
+            self.assert200(self.client.post('/user', data={"name": name}))
+        self.assert200(self.client.post('/team', data={"members": []}))
+
+        self.assert200(self.client.patch('/team/1', data={"members": [{"$ref": "/user/1"}]}))
+        self.assert200(self.client.patch('/team/1', data={"members": {"$add": [{"$ref": "/user/2"}]}}))
+        self.dispatcher.flush()
+
+        # the members are detached snapshots, not the instances of the request
+        members, changes = received
+        self.assertEqual([(1, 'Foo')], [(member.id, member.name) for member in members])
+        self.assertTrue(all(inspect(member).transient for member in members))
+        self.assertIsInstance(changes, fields.ToManyChanges)
+        self.assertEqual(([2], []), (changes.add, changes.remove))
+        self.assertEqual([], self.errors)
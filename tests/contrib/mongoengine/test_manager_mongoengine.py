@@ -4,7 +4,8 @@ from flask_mongoengine import MongoEngine
 from mongoengine.fields import StringField, FloatField, ReferenceField, ListField
 
 from flask_potion.contrib.mongoengine import MongoEngineManager
-from flask_potion.routes import Relation
+from flask_potion.routes import Relation, ItemRoute
+from flask_potion.schema import FieldSet
 from flask_potion import Api, fields
 from flask_potion.resource import ModelResource
 from tests import BaseTestCase
@@ -161,6 +162,34 @@ class MongoEngineTestCase(BaseTestCase):
                                   'message': 'Not Found',
                                   'status': 404}, response.json)
 
+    def test_item_attributes(self):
+        me = self.me
+
+        class Page(me.Document):
+            meta = {"collection": "page"}
+            title = StringField(max_length=60)
+            body = StringField()
+
+        class PageResource(ModelResource):
+            @ItemRoute.POST('/rename', item_attributes=('title',), schema=FieldSet({"title": fields.String()}))
+            def rename(self, item, title):
+                return self.manager.update(item, {"title": title})
+
+            rename.response_schema = fields.Inline('self')
+
+            class Meta:
+                model = Page
+
+        self.api.add_resource(PageResource)
+
+        page_uri = self.client.post('/page', data={"title": "Home", "body": "Welcome"}).json["$uri"]
+
+        # documents are read in full, so attributes the route does not declare are neither lost nor formatted as null
+        response = self.client.post('{}/rename'.format(page_uri), data={"title": "Start"})
+        self.assert200(response)
+        self.assertEqual({"$uri": page_uri, "title": "Start", "body": "Welcome"}, response.json)
+        self.assertEqual({"$uri": page_uri, "title": "Start", "body": "Welcome"}, self.client.get(page_uri).json)
+
     @unittest.SkipTest
     def test_pagination(self):
         pass  # TODO
@@ -6,7 +6,7 @@ from playhouse.fields import ManyToManyField
 from flask_potion import Api, fields
 from flask_potion.contrib.peewee import PeeweeManager
 from flask_potion.resource import ModelResource
-from flask_potion.routes import Relation
+from flask_potion.routes import Relation, ItemAttributeRoute
 from tests import BaseTestCase
 from tests.contrib.peewee import PeeweeTestDB
 
@@ -84,6 +84,25 @@ class PeeweeTestCase(BaseTestCase):
         response = self.client.post('/type', data={'name': 'foo'})
         self.assertStatus(response, 409)
 
+    def test_transaction(self):
+        manager = self.TypeResource.manager
+
+        with self.assertRaises(RuntimeError):
+            with manager.transaction():
+                manager.create({'name': 'x-ray'})
+                with manager.transaction():
+                    manager.create({'name': 'laser'})
+                raise RuntimeError()
+
+        self.assertEqual(0, self.db.database.transaction_depth())
+        self.assertEqual([], self.client.get('/type').json)
+
+        with manager.transaction():
+            manager.create({'name': 'x-ray'})
+
+        self.assertEqual(0, self.db.database.transaction_depth())
+        self.assertEqual(['x-ray'], [type_['name'] for type_ in self.client.get('/type').json])
+
     def test_create(self):
         response = self.client.post('/type', data={})
         self.assert400(response)
@@ -262,6 +281,141 @@ class PeeweeTestCase(BaseTestCase):
             'name': 'Foo'},
             response.json)
 
+    def test_attribute_route_increment(self):
+        class Page(self.db.Model):
+            views = pw.IntegerField(default=0)
+
+        self.db.database.create_tables([Page])
+
+        class PageResource(ModelResource):
+            views = ItemAttributeRoute(fields.Integer())
+
+            class Meta:
+                model = Page
+                manager = PeeweeManager
+
+        self.api.add_resource(PageResource)
+        self.client.post('/page', data={"views": 0})
+
+        response = self.client.post('/page/1/views', data={"$inc": 2})
+        self.assert200(response)
+        self.assertEqual(2, response.json)
+        self.assertEqual(5, self.client.post('/page/1/views', data={"$inc": 3}).json)
+        self.assert404(self.client.post('/page/2/views', data={"$inc": 1}))
+
+    def test_upsert(self):
+        class Country(self.db.Model):
+            code = pw.CharField(max_length=2, unique=True)
+            name = pw.CharField(max_length=60, null=True)
+            version = pw.IntegerField()
+
+        self.db.database.create_tables([Country])
+
+        class CountryResource(ModelResource):
+            class Meta:
+                model = Country
+                natural_key = 'code'
+                version_attribute = 'version'
+                manager = PeeweeManager
+
+        self.api.add_resource(CountryResource)
+
+        response = self.client.put('/country', data={"code": "DE", "name": "Germany"})
+        self.assert200(response)
+        self.assertEqual({"$uri": "/country/1", "code": "DE", "name": "Germany", "version": 1}, response.json)
+
+        response = self.client.put('/country', data=[
+            {"code": "FR", "name": "France"},
+            {"code": "DE", "name": "Deutschland"},
+            {"code": "FR", "name": "French Republic"}
+        ])
+        self.assert200(response)
+        self.assertEqual([
+            {"$uri": "/country/2", "code": "FR", "name": "French Republic", "version": 2},
+            {"$uri": "/country/1", "code": "DE", "name": "Deutschland", "version": 2},
+            {"$uri": "/country/2", "code": "FR", "name": "French Republic", "version": 2}
+        ], response.json)
+        self.assertEqual(2, Country.select().count())
+
+    def test_facets(self):
+        for name in ("T1", "T2"):
+            response = self.client.post('/type', data={"name": name})
+            self.assert200(response)
+
+        for name, wattage, type_ in (("A", 100, 1), ("B", 100, 2), ("C", 200, 2), ("D", None, 2)):
+            response = self.client.post('/machine', data={"name": name, "wattage": wattage, "type": type_})
+            self.assert200(response)
+
+        response = self.client.get('/machine/facets?fields=["type", "wattage"]')
+        self.assert200(response)
+        self.assertJSONEqual({
+            "type": [
+                {"value": {"$ref": "/type/2"}, "count": 3},
+                {"value": {"$ref": "/type/1"}, "count": 1}
+            ],
+            "wattage": [
+                {"value": 100, "count": 2},
+                {"value": None, "count": 1},
+                {"value": 200, "count": 1}
+            ]
+        }, response.json)
+
+        response = self.client.get('/machine/facets?fields=["wattage"]&where={"type": 2}&limit=1')
+        self.assert200(response)
+        self.assertJSONEqual({"wattage": [{"value": None, "count": 1}]}, response.json)
+
+        response = self.client.get('/machine/facets?fields=["machines"]')
+        self.assert400(response)
+
+    def test_explain(self):
+        response = self.client.get('/machine/explain?where={"wattage": {"$gt": 100}}&sort={"name": false}')
+        self.assert200(response)
+        self.assertIn('ORDER BY "t1"."name" ASC', response.json['statement'])
+        self.assertEqual([100], response.json['parameters'])
+        self.assertTrue(response.json['plan'])
+
+        self.app.debug = False
+        response = self.client.get('/machine/explain')
+        self.assert404(response)
+
+    def test_embed(self):
+        for name in ("T1", "T2"):
+            response = self.client.post('/type', data={"name": name})
+            self.assert200(response)
+
+        for name, type_ in (("A", 1), ("B", 2), ("C", 2)):
+            response = self.client.post('/machine', data={"name": name, "type": type_})
+            self.assert200(response)
+
+        response = self.client.get('/machine?embed=type&per_page=2')
+        self.assert200(response)
+        self.assertJSONEqual([
+            {"$id": 1, "$type": "machine", "name": "A", "wattage": None,
+             "type": {"$id": 1, "$type": "type", "name": "T1", "machines": [{"$ref": "/machine/1"}]}},
+            {"$id": 2, "$type": "machine", "name": "B", "wattage": None,
+             "type": {"$id": 2, "$type": "type", "name": "T2",
+                      "machines": [{"$ref": "/machine/2"}, {"$ref": "/machine/3"}]}}
+        ], response.json)
+
+        response = self.client.get('/type')
+        self.assert200(response)
+        self.assertJSONEqual([
+            {"$id": 1, "$type": "type", "name": "T1", "machines": [{"$ref": "/machine/1"}]},
+            {"$id": 2, "$type": "type", "name": "T2", "machines": [{"$ref": "/machine/2"}, {"$ref": "/machine/3"}]}
+        ], response.json)
+
+        response = self.client.get('/type?embed=machines')
+        self.assert200(response)
+        self.assertJSONEqual([
+            {"$id": 1, "$type": "type", "name": "T1", "machines": [
+                {"$id": 1, "$type": "machine", "name": "A", "wattage": None, "type": {"$ref": "/type/1"}}
+            ]},
+            {"$id": 2, "$type": "type", "name": "T2", "machines": [
+                {"$id": 2, "$type": "machine", "name": "B", "wattage": None, "type": {"$ref": "/type/2"}},
+                {"$id": 3, "$type": "machine", "name": "C", "wattage": None, "type": {"$ref": "/type/2"}}
+            ]}
+        ], response.json)
+
     def test_delete(self):
         response = self.client.delete('/type/1')
         self.assert404(response)
@@ -309,6 +463,8 @@ class PeeweeRelationTestCase(BaseTestCase):
                 include_id = True
                 include_type = True
                 manager = PeeweeManager
+                bulk_update = True
+                bulk_delete = True
 
             children = Relation('self')
 
@@ -435,3 +591,80 @@ class PeeweeRelationTestCase(BaseTestCase):
         self.assertJSONEqual(
             [{'$ref': '/user/{}'.format(i)} for i in range(42, 50)],
             response.json)
+
+    def test_relationship_where_and_sort(self):
+        self.client.post('/group', data={'name': 'Foo'})
+
+        for name in ('Anna', 'Betty', 'Cindy'):
+            response = self.client.post('/user', data={'name': name})
+            self.assert200(response)
+            response = self.client.post('/group/1/members', data={'$ref': '/user/{}'.format(response.json['$id'])})
+            self.assert200(response)
+
+        response = self.client.get('/group/1/members?where={"name": {"$ne": "Betty"}}&sort={"name": true}')
+        self.assert200(response)
+        self.assertEqual('2', response.headers.get('X-Total-Count'))
+        self.assertJSONEqual([{'$ref': '/user/3'}, {'$ref': '/user/1'}], response.json)
+
+    def test_relationship_add_and_remove_many(self):
+        self.client.post('/group', data={'name': 'Foo'})
+        self.client.post('/user', data={'name': 'Parent'})
+
+        for name in ('Anna', 'Betty', 'Cindy'):
+            self.client.post('/user', data={'name': name})
+
+        response = self.client.post('/group/1/members', data=[2, {'$ref': '/user/3'}])
+        self.assert200(response)
+        self.assertJSONEqual([{'$ref': '/user/2'}, {'$ref': '/user/3'}], response.json)
+
+        response = self.client.post('/group/1/members', data=[3, 4])
+        self.assert200(response)
+
+        response = self.client.get('/group/1/members')
+        self.assertJSONEqual([{'$ref': '/user/2'}, {'$ref': '/user/3'}, {'$ref': '/user/4'}], response.json)
+
+        response = self.client.delete('/group/1/members', data=[2, 4])
+        self.assertStatus(response, 204)
+
+        response = self.client.get('/group/1/members')
+        self.assertJSONEqual([{'$ref': '/user/3'}], response.json)
+
+        response = self.client.post('/group/1/members', data=[2, 99])
+        self.assert404(response)
+
+        response = self.client.post('/user/1/children', data=[2, 3])
+        self.assert200(response)
+
+        response = self.client.delete('/user/1/children', data=[2])
+        self.assertStatus(response, 204)
+
+        response = self.client.get('/user/1/children')
+        self.assertJSONEqual([{'$ref': '/user/3'}], response.json)
+
+    def test_bulk_update(self):
+        for name in ('Anna', 'Betty', 'Cindy'):
+            self.client.post('/user', data={'name': name})
+
+        response = self.client.patch('/user?where={"name": {"$in": ["Anna", "Cindy"]}}', data={'name': 'Dana'})
+        self.assert200(response)
+        self.assertEqual({'count': 2}, response.json)
+
+        response = self.client.get('/user?where={"name": "Dana"}')
+        self.assertEqual([1, 3], [user['$id'] for user in response.json])
+
+    def test_bulk_delete(self):
+        for name in ('Anna', 'Betty', 'Cindy', 'Dana'):
+            self.client.post('/user', data={'name': name})
+
+        response = self.client.delete('/user?where={"name": {"$ne": "Betty"}}&limit=2')
+        self.assert200(response)
+        self.assertEqual({'count': 2}, response.json)
+
+        response = self.client.get('/user')
+        self.assertEqual([2, 4], [user['$id'] for user in response.json])
+
+        response = self.client.delete('/user?where={"name": {"$ne": "Betty"}}')
+        self.assertEqual({'count': 1}, response.json)
+
+        response = self.client.get('/user')
+        self.assertEqual([2], [user['$id'] for user in response.json])
@@ -143,10 +143,55 @@ class PrincipalTestCase(BaseTestCase):
         # self.user = {'id': 1, 'roles': ['author']}
         # self.assert200(self.client.delete('/book/1'))
 
+    def test_create_many(self):
+        class BookResource(PrincipalResource):
+            class Meta:
+                model = self.BOOK
+                permissions = {
+                    'create': 'admin'
+                }
+
+        self.api.add_resource(BookResource)
+
+        self.mock_user = {'id': 1}
+        response = self.client.post('/book', data=[{'title': 'Foo'}, {'title': 'Bar'}])
+        self.assert403(response)
+
+        self.mock_user = {'id': 1, 'roles': ['admin']}
+        self.assertEqual([], self.client.get('/book').json)
+
+        response = self.client.post('/book', data=[{'title': 'Foo'}, {'title': 'Bar'}])
+        self.assert200(response)
+        self.assertEqual(['Foo', 'Bar'], [book['title'] for book in response.json])
+
         # response = self.client.post('/book', data={'title': 'Foo'})
         #
         # self.assert200(response)
 
+    def test_write_behind(self):
+        class BookResource(PrincipalResource):
+            class Meta:
+                model = self.BOOK
+                permissions = {
+                    'create': 'admin'
+                }
+                write_behind = {"background": False}
+
+        self.api.add_resource(BookResource)
+        self.addCleanup(BookResource.write_behind.close)
+
+        # items are checked when they are buffered, as they are created without a request
+        self.mock_user = {'id': 1}
+        self.assert403(self.client.post('/book', data={'title': 'Foo'}))
+        self.assert403(self.client.post('/book', data=[{'title': 'Foo'}, {'title': 'Bar'}]))
+
+        self.mock_user = {'id': 1, 'roles': ['admin']}
+        self.assertStatus(self.client.post('/book', data=[{'title': 'Foo'}, {'title': 'Bar'}]), 202)
+        self.assertEqual(2, BookResource.write_behind.metrics()["depth"])
+
+        self.assertTrue(BookResource.write_behind.flush())
+        self.assertEqual(['Foo', 'Bar'], [book['title'] for book in self.client.get('/book').json])
+
     def test_access_forbidden_to_resource_collection(self):
         class BookResource(PrincipalResource):
             class Meta:
@@ -326,6 +371,40 @@ class PrincipalTestCase(BaseTestCase):
 
         # TODO DELETE
 
+    def test_item_need_bulk_update(self):
+
+        class BookStoreResource(PrincipalResource):
+            class Meta:
+                model = self.BOOK_STORE
+                permissions = {
+                    'create': 'admin',
+                    'update': 'update'
+                }
+                bulk_update = True
+
+        self.api.add_resource(BookStoreResource)
+
+        self.mock_user = {'id': 1, 'roles': ['admin']}
+
+        for name in ('Bar Books', 'Foomazon', 'Bazaar'):
+            response = self.client.post('/book_store', data={'name': name})
+            self.assert200(response)
+
+        self.mock_user = {'id': 1, 'needs': [ItemNeed('update', 2, 'book_store'), ItemNeed('update', 3, 'book_store')]}
+
+        response = self.client.patch('/book_store?where={"name": {"$in": ["Bar Books", "Foomazon"]}}',
+                                     data={'name': 'Foo'})
+        self.assert200(response)
+        self.assertEqual({'count': 1}, response.json)
+
+        response = self.client.get('/book_store')
+        self.assertEqual(['Bar Books', 'Foo', 'Bazaar'], [store['name'] for store in response.json])
+
+        self.mock_user = {'id': 1}
+
+        response = self.client.patch('/book_store?where={"name": "Foo"}', data={'name': 'Bar'})
+        self.assertEqual({'count': 0}, response.json)
+
     def test_yes_no(self):
         class BookResource(PrincipalResource):
             class Meta:
@@ -1,3 +1,4 @@
+from flask import g
 from flask_potion.routes import Route, ItemRoute
 from flask_potion import Api, fields
 from flask_potion.contrib.memory.manager import MemoryManager
@@ -75,6 +76,8 @@ class ApiTestCase(BaseTestCase):
         self.assertEqual({
                     "/api/v1/book",
                     "/api/v1/book/schema",
+                    "/api/v1/book/explain",
+                    "/api/v1/book/facets",
                     "/api/v1/book/genres",
                     "/api/v1/book/{id}",
                     "/api/v1/book/{id}/rating"
@@ -191,3 +194,107 @@ class ApiTestCase(BaseTestCase):
                                  }
                              ],
                          }, response.json)
+
+    def test_api_batch(self):
+        api = Api(self.app, prefix='/api/v1', batch=True)
+
+        class BookResource(ModelResource):
+            class Schema:
+                title = fields.String()
+
+            class Meta:
+                name = "book"
+                model = "book"
+                manager = MemoryManager
+
+        api.add_resource(BookResource)
+
+        response = self.client.post("/api/v1/batch", data=[
+            {"method": "POST", "path": "/api/v1/book", "body": {"title": "Foo"}},
+            {"method": "GET", "path": "/api/v1/book/1"},
+            {"method": "GET", "path": "/api/v1/book?where={\"title\": \"Bar\"}"},
+            {"method": "GET", "path": "/api/v1/book/2"},
+            {"method": "DELETE", "path": "/api/v1/book/1"}
+        ])
+        self.assert200(response)
+        self.assertEqual([200, 200, 200, 404, 204], [r["status"] for r in response.json])
+        self.assertEqual({"$uri": "/api/v1/book/1", "title": "Foo"}, response.json[1]["body"])
+        self.assertEqual([], response.json[2]["body"])
+        self.assertIn(["X-Total-Count", "0"], response.json[2]["headers"])
+        self.assertEqual(None, response.json[4]["body"])
+
+        response = self.client.post("/api/v1/batch", data={"requests": [
+            {"method": "POST", "path": "/api/v1/book", "body": {"title": "Bar"}},
+            {"method": "POST", "path": "/api/v1/book", "body": {"title": 1}}
+        ], "atomic": True})
+        self.assert400(response)
+        self.assertEqual([200, 400], [r["status"] for r in response.json])
+        self.assertEqual([], self.client.get("/api/v1/book").json)
+
+        response = self.client.post("/api/v1/batch", data=[{"method": "GET"}])
+        self.assert400(response)
+
+        response = self.client.post("/api/v1/batch", data=[{"method": "POST", "path": "/api/v1/batch", "body": []}])
+        self.assert200(response)
+        self.assertEqual([400], [r["status"] for r in response.json])
+        self.assertEqual("Batch requests cannot be nested", response.json[0]["body"]["message"])
+
+        self.app.config['POTION_MAX_BATCH_SIZE'] = 2
+        response = self.client.post("/api/v1/batch", data=[{"method": "GET", "path": "/api/v1/book"}] * 3)
+        self.assert400(response)
+        self.assertEqual({"status": 400, "message": "Batch requests are limited to 2 sub-requests"}, response.json)
+
+    def test_api_batch_sub_requests(self):
+        api = Api(self.app, batch=True)
+
+        class FooResource(ModelResource):
+            class Meta:
+                name = "foo"
+                model = "foo"
+                manager = MemoryManager
+
+            @Route.GET('/tags')
+            def tags(self):
+                return None, 200, [('X-Tag', 'a'), ('X-Tag', 'b')]
+
+            tags.response_schema = fields.Any()
+
+            @Route.GET('/visit')
+            def visit(self):
+                visited = getattr(g, 'visited', False)
+                g.visited = True
+                return visited
+
+            visit.response_schema = fields.Boolean()
+
+        api.add_resource(FooResource)
+
+        g.visited = 'batch'
+        response = self.client.post("/batch", data=[
+            {"method": "GET", "path": "/foo/tags"},
+            {"method": "GET", "path": "/foo/visit"},
+            {"method": "GET", "path": "/foo/visit"}
+        ])
+        self.assert200(response)
+
+        # repeated headers are kept
+        self.assertEqual([["X-Tag", "a"], ["X-Tag", "b"]],
+                         [header for header in response.json[0]["headers"] if header[0] == "X-Tag"])
+
+        # nothing stored on g is shared between sub-requests or with the batch request
+        self.assertEqual([False, False], [r["body"] for r in response.json[1:]])
+        self.assertEqual('batch', g.visited)
+
+    def test_api_batch_disabled(self):
+        api = Api(self.app)
+
+        class BatchResource(ModelResource):
+            class Meta:
+                name = "batch"
+                model = "batch"
+                manager = MemoryManager
+
+        api.add_resource(BatchResource)
+
+        self.assert200(self.client.post("/batch", data={}))
+        self.assertEqual([{"$uri": "/batch/1"}], self.client.get("/batch").json)
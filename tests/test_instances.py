@@ -108,3 +108,38 @@ class RelationTestCase(BaseTestCase):
         self.assertJSONEqual([
             {'$uri': '/person/5', 'mother': {'$ref': '/person/2'}, 'name': 'Clare'}
         ], response.json)
+
+    def test_facets(self):
+        class Person(ModelResource):
+            class Schema:
+                name = fields.String()
+                age = fields.Integer(nullable=True)
+                mother = fields.ToOne('person', nullable=True)
+
+            class Meta:
+                name = "person"
+                model = name
+                manager = MemoryManager
+
+        self.api.add_resource(Person)
+
+        for name, age, mother in (("Anna", 60, None), ("Betty", 30, 1), ("Cindy", 30, 1), ("Dana", 5, 2)):
+            response = self.client.post('/person', data={"name": name, "age": age, "mother": mother})
+            self.assert200(response)
+
+        response = self.client.get('/person/facets?fields=["mother", "age"]&where={"age": {"$gt": 10}}')
+        self.assert200(response)
+        self.assertJSONEqual({
+            "mother": [
+                {"value": {"$ref": "/person/1"}, "count": 2},
+                {"value": None, "count": 1}
+            ],
+            "age": [
+                {"value": 30, "count": 2},
+                {"value": 60, "count": 1}
+            ]
+        }, response.json)
+
+        response = self.client.get('/person/facets?fields=["age"]&limit=1')
+        self.assert200(response)
+        self.assertJSONEqual({"age": [{"value": 30, "count": 2}]}, response.json)
@@ -1,5 +1,9 @@
+import os
+import tempfile
+
 from flask_potion.contrib.memory import MemoryManager
 from flask_potion import fields, Api, Resource, ModelResource
+from flask_potion.routes import ItemRoute
 from tests import BaseTestCase
 
 
@@ -67,3 +71,302 @@ class ModelResourceTestCase(BaseTestCase):
             "slug": "foo",
             "secret": "mystery"
         }, FooResource.manager.items[1])
+
+    def test_create_many(self):
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = "foo"
+
+        self.api.add_resource(FooResource)
+
+        response = self.client.post("/foo", data=[{"name": "Foo"}, {"name": "Bar"}])
+        self.assert200(response)
+        self.assertEqual([
+            {"$uri": "/foo/1", "name": "Foo"},
+            {"$uri": "/foo/2", "name": "Bar"}
+        ], response.json)
+
+        response = self.client.post("/foo", data=[{"name": "Baz"}, {"name": 1}, {}])
+        self.assert400(response)
+        self.assertEqual([[1, "name"], [2]], [error["path"] for error in response.json["errors"]])
+
+        response = self.client.get("/foo")
+        self.assertEqual(["Foo", "Bar"], [item["name"] for item in response.json])
+
+    def test_bulk_update(self):
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+                status = fields.String(nullable=True)
+                secret = fields.String(io="r", nullable=True)
+
+            class Meta:
+                name = "foo"
+                bulk_update = True
+
+        class BarResource(ModelResource):
+            class Meta:
+                name = "bar"
+
+        self.api.add_resource(FooResource)
+        self.api.add_resource(BarResource)
+
+        self.assert405(self.client.patch('/bar?where={"$uri": "/bar/1"}', data={}))
+        self.assertNotIn('bulkUpdate', [link['rel'] for link in self.client.get('/bar/schema').json['links']])
+
+        self.client.post("/foo", data=[{"name": "Foo"}, {"name": "Bar"}, {"name": "Baz"}])
+
+        response = self.client.patch('/foo?where={"name": {"$startswith": "B"}}', data={"status": "done"})
+        self.assert200(response)
+        self.assertEqual({"count": 2}, response.json)
+
+        response = self.client.get("/foo")
+        self.assertEqual([None, "done", "done"], [item["status"] for item in response.json])
+
+        response = self.client.patch('/foo', data={"status": "done"})
+        self.assert400(response)
+
+        response = self.client.patch('/foo?where={"name": "Foo"}', data={"secret": "x"})
+        self.assert400(response)
+
+        response = self.client.patch('/foo?where={"name": "Foo"}', data={"status": 1})
+        self.assert400(response)
+
+    def test_bulk_delete(self):
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = "foo"
+                bulk_delete = True
+
+        class BarResource(ModelResource):
+            class Meta:
+                name = "bar"
+
+        self.api.add_resource(FooResource)
+        self.api.add_resource(BarResource)
+
+        self.assert405(self.client.delete('/bar?where={"$uri": "/bar/1"}'))
+
+        self.client.post("/foo", data=[{"name": "Foo"}, {"name": "Bar"}, {"name": "Baz"}])
+
+        response = self.client.delete('/foo?where={"name": {"$startswith": "B"}}&limit=1')
+        self.assert200(response)
+        self.assertEqual({"count": 1}, response.json)
+
+        response = self.client.delete('/foo?where={"name": {"$startswith": "B"}}')
+        self.assertEqual({"count": 1}, response.json)
+
+        response = self.client.get("/foo")
+        self.assertEqual(["Foo"], [item["name"] for item in response.json])
+
+        self.assert400(self.client.delete('/foo'))
+        self.assert400(self.client.delete('/foo?where={}'))
+
+    def test_explain_not_supported(self):
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = "foo"
+
+        self.api.add_resource(FooResource)
+
+        response = self.client.get("/foo/explain")
+        self.assertStatus(response, 501)
+        self.assertEqual({"status": 501, "message": "Not Implemented"}, response.json)
+
+    def test_prefer_return_minimal(self):
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+                views = fields.Integer(io="r")
+
+            class Meta:
+                name = "foo"
+                natural_key = 'name'
+                bulk_update = True
+                bulk_delete = True
+
+            @ItemRoute.POST('/views', rel="addView")
+            def add_view(self, item):
+                return self.manager.update(item, {"views": (item.get("views") or 0) + 1})
+
+            add_view.response_schema = fields.Inline('self')
+
+        self.api.add_resource(FooResource)
+
+        minimal = [('Prefer', 'return=minimal')]
+
+        response = self.client.post("/foo", data={"name": "Foo"}, headers=minimal)
+        self.assertStatus(response, 201)
+        self.assertEqual(b'', response.data)
+        self.assertEqual('http://localhost/foo/1', response.headers['Location'])
+        self.assertEqual('return=minimal', response.headers['Preference-Applied'])
+
+        response = self.client.patch("/foo/1", data={"name": "Bar"}, headers=[('Prefer', 'respond-async, return=minimal')])
+        self.assertStatus(response, 204)
+        self.assertEqual('http://localhost/foo/1', response.headers['Location'])
+
+        response = self.client.post("/foo", data=[{"name": "Baz"}, {"name": "Qux"}], headers=minimal)
+        self.assertStatus(response, 201)
+        self.assertNotIn('Location', response.headers)
+
+        response = self.client.patch("/foo/1", data={"name": "Foo"}, headers=[('Prefer', 'return=representation')])
+        self.assert200(response)
+        self.assertEqual({"$uri": "/foo/1", "name": "Foo", "views": None}, response.json)
+
+        response = self.client.get("/foo/1", headers=minimal)
+        self.assert200(response)
+        self.assertEqual({"$uri": "/foo/1", "name": "Foo", "views": None}, response.json)
+
+        # other POST routes do not create items
+        response = self.client.post("/foo/1/views", headers=minimal)
+        self.assertStatus(response, 204)
+        self.assertEqual('http://localhost/foo/1', response.headers['Location'])
+
+        response = self.client.put("/foo", data={"name": "Quux"}, headers=minimal)
+        self.assertStatus(response, 204)
+
+        # bulk changes respond with the number of items
+        response = self.client.patch('/foo?where={"name": {"$in": ["Baz", "Qux"]}}', data={"name": "Changed"},
+                                     headers=minimal)
+        self.assert200(response)
+        self.assertEqual({"count": 2}, response.json)
+
+        response = self.client.delete('/foo?where={"name": "Changed"}', headers=minimal)
+        self.assert200(response)
+        self.assertEqual({"count": 2}, response.json)
+
+    def test_if_match_version(self):
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+                version = fields.Integer()
+
+            class Meta:
+                name = "foo"
+                version_attribute = "version"
+
+        self.api.add_resource(FooResource)
+
+        response = self.client.post("/foo", data={"name": "Foo"})
+        self.assert200(response)
+        self.assertEqual('"1"', response.headers['ETag'])
+        self.assertEqual('"1"', self.client.get("/foo/1").headers['ETag'])
+
+        response = self.client.patch("/foo/1", data={"name": "Bar"}, headers=[('If-Match', '"1"')])
+        self.assert200(response)
+        self.assertEqual('"2"', response.headers['ETag'])
+        self.assertEqual({"$uri": "/foo/1", "name": "Bar", "version": 2}, response.json)
+
+        self.assertStatus(self.client.patch("/foo/1", data={"name": "Baz"}, headers=[('If-Match', '"1"')]), 412)
+        self.assertStatus(self.client.patch("/foo/1", data={"name": "Baz"}, headers=[('If-Match', '"1", "2"')]), 412)
+        self.assert404(self.client.patch("/foo/2", data={"name": "Baz"}, headers=[('If-Match', '"1"')]))
+        self.assert200(self.client.patch("/foo/1", data={"name": "Baz"}, headers=[('If-Match', '*')]))
+        self.assertStatus(self.client.delete("/foo/1", headers=[('If-Match', '"2"')]), 412)
+        self.assertStatus(self.client.delete("/foo/1", headers=[('If-Match', '"3"')]), 204)
+
+    def test_write_behind(self):
+        spool_path = os.path.join(tempfile.mkdtemp(), 'foo.spool')
+
+        with open(spool_path, 'w') as spool:
+            spool.write('{"name": "Spooled"}\n')
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = "foo"
+                write_behind = {"max_size": 3, "max_delay": 60, "spool_path": spool_path, "background": False}
+
+        self.api.add_resource(FooResource)
+        self.addCleanup(FooResource.write_behind.close)
+
+        response = self.client.post("/foo", data={"name": "Foo"})
+        self.assertStatus(response, 202)
+        self.assertEqual(b'', response.data)
+        self.assert400(self.client.post("/foo", data={"name": 1}))
+
+        self.assertEqual([], self.client.get("/foo").json)
+        self.assertEqual(2, FooResource.write_behind.metrics()["depth"])
+        with open(spool_path) as spool:
+            self.assertEqual(['{"name": "Spooled"}\n', '{"name": "Foo"}\n'], spool.readlines())
+
+        self.assertStatus(self.client.post("/foo", data=[{"name": "Bar"}, {"name": "Baz"}]), 202)
+
+        # items are written in batches of at most max_size
+        self.assertTrue(FooResource.write_behind.flush())
+        self.assertEqual(["Spooled", "Foo", "Bar", "Baz"], [item["name"] for item in self.client.get("/foo").json])
+
+        metrics = FooResource.write_behind.metrics()
+        self.assertEqual((0, 2, 4, 0), (metrics["depth"], metrics["batches"], metrics["written"], metrics["failed"]))
+        with open(spool_path) as spool:
+            self.assertEqual('', spool.read())
+
+    def test_write_behind_retry(self):
+        spool_path = os.path.join(tempfile.mkdtemp(), 'foo.spool')
+
+        with open(spool_path, 'w') as spool:
+            spool.write('{"name": "Written"}\n1\n{"name": "Pending"}\n')
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = "foo"
+                write_behind = {"max_size": 1, "max_delay": 60, "max_pending": 3, "retry_delay": 60,
+                                "spool_path": spool_path, "background": False}
+
+        self.api.add_resource(FooResource)
+        self.addCleanup(FooResource.write_behind.close)
+
+        calls = []
+        create_many = FooResource.manager.create_many
+
+        def flaky_create_many(properties_list, commit=True):
+            calls.append([properties["name"] for properties in properties_list])
+            if len(calls) in (1, 3):
+                raise RuntimeError('database unavailable')
+            return create_many(properties_list, commit)
+
+        FooResource.manager.create_many = flaky_create_many
+
+        # the restored item is written first and fails; writing stops at the failed batch
+        self.assertStatus(self.client.post("/foo", data={"name": "Foo"}), 202)
+        self.assertFalse(FooResource.write_behind.flush())
+
+        self.assertEqual([["Pending"]], calls)
+        self.assertStatus(self.client.post("/foo", data={"name": "Bar"}), 202)
+        self.assertStatus(self.client.post("/foo", data={"name": "Baz"}), 503)
+        self.assertEqual(3, FooResource.write_behind.metrics()["depth"])
+
+        # failed items stay buffered and spooled; written items are recorded by a count
+        self.assertFalse(FooResource.write_behind.flush())
+        with open(spool_path) as spool:
+            self.assertEqual(['{"name": "Pending"}\n', '{"name": "Foo"}\n', '{"name": "Bar"}\n', '1\n'],
+                             spool.readlines())
+
+        self.assertTrue(FooResource.write_behind.flush())
+        self.assertEqual([["Pending"], ["Pending"], ["Foo"], ["Foo"], ["Bar"]], calls)
+        self.assertEqual(["Pending", "Foo", "Bar"], [item["name"] for item in self.client.get("/foo").json])
+
+        metrics = FooResource.write_behind.metrics()
+        self.assertEqual((0, 3, 3, 2, 0), (metrics["depth"], metrics["batches"], metrics["written"],
+                                           metrics["errors"], metrics["failed"]))
+        with open(spool_path) as spool:
+            self.assertEqual('', spool.read())
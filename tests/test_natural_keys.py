@@ -217,3 +217,43 @@ class NaturalKeyTestCase(BaseTestCase):
 
         with self.assertRaises(ValidationError):
             foo_field.convert(['John', None])
+
+    def test_upsert(self):
+        class Foo(ModelResource):
+            class Schema:
+                first_name = fields.String()
+                last_name = fields.String()
+                age = fields.Integer(nullable=True)
+
+            class Meta:
+                natural_key = ['first_name', 'last_name']
+                manager = MemoryManager
+                model = 'foo'
+                name = 'foo'
+
+        class Bar(ModelResource):
+            class Meta:
+                manager = MemoryManager
+                model = 'bar'
+                name = 'bar'
+
+        self.api.add_resource(Foo)
+        self.api.add_resource(Bar)
+
+        response = self.client.put('/api/foo', data={"first_name": "Jane", "last_name": "Doe", "age": 30})
+        self.assert200(response)
+        self.assertEqual({"$uri": "/api/foo/1", "first_name": "Jane", "last_name": "Doe", "age": 30}, response.json)
+
+        response = self.client.put('/api/foo', data=[
+            {"first_name": "John", "last_name": "Doe"},
+            {"first_name": "Jane", "last_name": "Doe", "age": 31}
+        ])
+        self.assert200(response)
+        self.assertEqual([
+            {"$uri": "/api/foo/2", "first_name": "John", "last_name": "Doe", "age": None},
+            {"$uri": "/api/foo/1", "first_name": "Jane", "last_name": "Doe", "age": 31}
+        ], response.json)
+
+        self.assertEqual('2', self.client.get('/api/foo').headers['X-Total-Count'])
+        self.assert400(self.client.put('/api/foo', data={"first_name": "Jane"}))
+        self.assert405(self.client.put('/api/bar', data={}))
@@ -67,6 +67,36 @@ class RelationTestCase(BaseTestCase):
         response = self.client.get('/box/greet?greeting=Hello')
         self.assertEqual("Hello box!", response.json)
 
+    def test_item_route_manager_read_without_attributes(self):
+        class ReadCountingManager(MemoryManager):
+            reads = 0
+
+            def read(self, id):
+                ReadCountingManager.reads += 1
+                return super(ReadCountingManager, self).read(id)
+
+        class Box(ModelResource):
+
+            class Schema:
+                description = fields.String()
+
+            class Meta:
+                model = 'box'
+                manager = ReadCountingManager
+
+            @ItemRoute.GET()
+            def verbose_description(self, box):
+                return box["description"] + " box"
+
+            verbose_description.response_schema = fields.String()
+
+        self.api.add_resource(Box)
+
+        self.assert200(self.client.post('/box', data={"description": "mysterious"}))
+        self.assertEqual("mysterious box", self.client.get('/box/1/verbose-description').json)
+        self.assertEqual({"$uri": "/box/1", "description": "mysterious"}, self.client.get('/box/1').json)
+        self.assertEqual(2, ReadCountingManager.reads)
+
     @unittest.SkipTest
     def test_item_attribute_route(self):
         class Recipe(ModelResource):
@@ -214,6 +244,108 @@ class RelationTestCase(BaseTestCase):
                                  }
                              ], response.json)
 
+        response = self.client.post('/group/1/members', data=[{"$ref": "/person/1"}, 2])
+        self.assert200(response)
+        self.assertJSONEqual([{"$ref": "/person/1"}, {"$ref": "/person/2"}], response.json)
+
+        response = self.client.get('/group/1/members')
+        self.assertJSONEqual([{"$ref": "/person/1"}, {"$ref": "/person/2"}], response.json)
+
+        response = self.client.delete('/group/1/members', data=[1, 2])
+        self.assertStatus(response, 204)
+
+        response = self.client.get('/group/1/members')
+        self.assertJSONEqual([], response.json)
+
+    def test_relation_where_and_sort(self):
+
+        class Person(ModelResource):
+            class Schema:
+                name = fields.String()
+                age = fields.Integer()
+
+            class Meta:
+                name = 'person'
+                model = name
+                manager = MemoryManager
+
+        self.api.add_resource(Person)
+
+        class Group(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = 'group'
+                model = name
+                manager = MemoryManager
+
+            members = Relation('person')
+
+        self.api.add_resource(Group)
+
+        self.client.post('/group', data={"name": "Family"})
+
+        for name, age in (("Anna", 60), ("Betty", 30), ("Cindy", 5), ("Dana", 35)):
+            self.client.post('/person', data={"name": name, "age": age})
+
+        for i in (1, 2, 3):
+            self.client.post('/group/1/members', data={"$ref": "/person/{}".format(i)})
+
+        response = self.client.get('/group/1/members?where={"age": {"$gt": 10}}&sort={"age": false}')
+        self.assert200(response)
+        self.assertEqual('2', response.headers['X-Total-Count'])
+        self.assertJSONEqual([{"$ref": "/person/2"}, {"$ref": "/person/1"}], response.json)
+
+        response = self.client.get('/group/1/members?where={"title": "Dr."}')
+        self.assert400(response)
+
+        response = self.client.get('/group/schema')
+        link = next(link for link in response.json['links'] if link['rel'] == 'members')
+        self.assertEqual(['page', 'per_page', 'sort', 'where'], sorted(link['schema']['properties']))
+        self.assertEqual(['age', 'name'], sorted(link['schema']['properties']['where']['properties']))
+
+    def test_to_many_patch_add_and_remove(self):
+
+        class Tag(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = 'tag'
+                model = name
+                manager = MemoryManager
+
+        class Article(ModelResource):
+            class Schema:
+                tags = fields.ToMany('tag')
+
+            class Meta:
+                name = 'article'
+                model = name
+                manager = MemoryManager
+
+        self.api.add_resource(Tag)
+        self.api.add_resource(Article)
+
+        for name in ('a', 'b', 'c'):
+            self.client.post('/tag', data={"name": name})
+
+        self.client.post('/article', data={"tags": [1, 2]})
+
+        response = self.client.patch('/article/1', data={"tags": {"$add": [{"$ref": "/tag/3"}, 2], "$remove": [1]}})
+        self.assert200(response)
+        self.assertJSONEqual([{"$ref": "/tag/2"}, {"$ref": "/tag/3"}], response.json["tags"])
+
+        response = self.client.patch('/article/1', data={"tags": {"$add": [5]}})
+        self.assert404(response)
+
+        response = self.client.patch('/article/1', data={"tags": {"$replace": [1]}})
+        self.assert400(response)
+
+        response = self.client.post('/article', data={"tags": {"$add": [1]}})
+        self.assert400(response)
+
     def test_attribute_route(self):
 
         class IngredientResource(ModelResource):
@@ -288,6 +420,50 @@ class RelationTestCase(BaseTestCase):
         self.assertJSONEqual([{'ingredient': {'$ref': '/ingredient/1'}, 'volume': 0.6},
                               {'ingredient': {'$ref': '/ingredient/2'}, 'volume': 0.4}], response.json)
 
+        response = self.client.post("/drink/1/recipe", data={
+            "$push": {"ingredient": {"$ref": "/ingredient/1"}, "volume": 0.1}
+        })
+        self.assert200(response)
+        self.assertJSONEqual([{'ingredient': {'$ref': '/ingredient/1'}, 'volume': 0.6},
+                              {'ingredient': {'$ref': '/ingredient/2'}, 'volume': 0.4},
+                              {'ingredient': {'$ref': '/ingredient/1'}, 'volume': 0.1}], response.json)
+
+    def test_attribute_route_increment(self):
+        class PageResource(ModelResource):
+            views = ItemAttributeRoute(fields.Integer(minimum=0))
+            title = ItemAttributeRoute(fields.String())
+
+            class Meta:
+                name = "page"
+                model = name
+                manager = MemoryManager
+
+            class Schema:
+                title = fields.String()
+                views = fields.Integer(default=0)
+
+        self.api.add_resource(PageResource)
+
+        self.client.post("/page", data={"title": "Home"})
+
+        response = self.client.post("/page/1/views", data={"$inc": 1})
+        self.assert200(response)
+        self.assertEqual(1, response.json)
+
+        response = self.client.post("/page/1/views", data={"$inc": 5})
+        self.assertEqual(6, response.json)
+
+        response = self.client.post("/page/1/views", data=10)
+        self.assertEqual(10, response.json)
+
+        self.assert400(self.client.post("/page/1/views", data={"$inc": 1.5}))
+        self.assert400(self.client.post("/page/1/views", data={"$push": 1}))
+        self.assert400(self.client.post("/page/1/title", data={"$inc": 1}))
+        self.assert404(self.client.post("/page/2/views", data={"$inc": 1}))
+
+        response = self.client.get("/page/1")
+        self.assertEqual({"$uri": "/page/1", "title": "Home", "views": 10}, response.json)
+
 
     # def test_attribute_set_route
     # def test_attribute_map_route
\ No newline at end of file
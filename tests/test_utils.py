@@ -0,0 +1,88 @@
+from werkzeug.exceptions import NotFound
+from werkzeug.routing import BaseConverter
+
+from flask_potion import Api, fields
+from flask_potion.contrib.memory.manager import MemoryManager
+from flask_potion.resource import ModelResource
+from flask_potion import utils
+from flask_potion.utils import id_from_uri, route_from
+from tests import BaseTestCase
+
+
+class IdFromUriTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(IdFromUriTestCase, self).setUp()
+        self.api = Api(self.app, prefix='/api')
+
+        class Foo(ModelResource):
+            class Meta:
+                name = 'foo'
+                model = name
+                manager = MemoryManager
+
+        class Bar(ModelResource):
+            class Meta:
+                name = 'bar'
+                model = name
+                manager = MemoryManager
+                id_field_class = fields.String
+
+        self.api.add_resource(Foo)
+        self.api.add_resource(Bar)
+        self.Foo = Foo
+        self.Bar = Bar
+
+    def _matches(self, uri, resource):
+        routed = []
+        original_route_from = utils.route_from
+
+        def route_from(*args, **kwargs):
+            routed.append(args)
+            return original_route_from(*args, **kwargs)
+
+        utils.route_from = route_from
+        try:
+            return id_from_uri(uri, resource), not routed
+        finally:
+            utils.route_from = original_route_from
+
+    def test_fast_path(self):
+        with self.app.test_request_context('/api/foo'):
+            self.assertEqual((1, True), self._matches('/api/foo/1', self.Foo))
+            self.assertEqual((123, True), self._matches('/api/foo/123', self.Foo))
+            self.assertEqual(('abc', True), self._matches('/api/bar/abc', self.Bar))
+            self.assertEqual(route_from('/api/foo/123', 'GET')[1]['id'], id_from_uri('/api/foo/123', self.Foo))
+
+    def test_fallback(self):
+        with self.app.test_request_context('/api/foo'):
+            self.assertEqual((1, False), self._matches('http://localhost/api/foo/1', self.Foo))
+            self.assertEqual((1, False), self._matches('/api/foo/1?x=y', self.Foo))
+            self.assertEqual(('a%20b', False), self._matches('/api/bar/a%20b', self.Bar))
+
+            with self.assertRaises(NotFound):
+                id_from_uri('/api/foo/abc', self.Foo)
+
+            with self.assertRaises(NotFound):
+                id_from_uri('http://example.com/api/foo/1', self.Foo)
+
+    def test_custom_converter(self):
+        class UpperConverter(BaseConverter):
+            regex = '[A-Z]+'
+
+            def to_python(self, value):
+                return value.lower()
+
+        self.app.url_map.converters['upper'] = UpperConverter
+
+        class Baz(ModelResource):
+            class Meta:
+                name = 'baz'
+                model = name
+                manager = MemoryManager
+                id_converter = 'upper'
+
+        self.api.add_resource(Baz)
+
+        with self.app.test_request_context('/api/baz'):
+            self.assertEqual(('abc', True), self._matches('/api/baz/ABC', Baz))